@@ -1,13 +1,10 @@
 #!/usr/bin/env python
 import logging.handlers
 
-import binascii
-import libscrc
+import asyncio
 import os
-import re
-import requests
+import pickle
 import simplejson as json
-import socket
 import threading
 import time
 import zmq
@@ -18,15 +15,67 @@ from sentry_sdk.integrations.threading import ThreadingIntegration
 from sentry_sdk.integrations.sys_exit import SysExitIntegration
 
 import paho.mqtt.client as mqtt
-from paho.mqtt.client import MQTT_ERR_NO_CONN
+from paho.mqtt.client import MQTT_ERR_NO_CONN, MQTT_ERR_SUCCESS
 
-from collections import deque
 from pathlib import Path
 from simplejson.scanner import JSONDecodeError
-from zmq.error import ZMQError, ContextTerminated
+from zmq.error import ContextTerminated
 
 import os.path
 
+from app.solarman import (
+    DEFAULT_REGISTER_GAP_MAX,
+    DEFAULT_REGISTER_WINDOW_MAX,
+    AsyncLoggerConnection,
+    FrameError,
+    LoggerConnection,
+    ReadWindow,
+    build_request_frame,
+    compile_read_windows,
+    compile_register_plan,
+    decode_responses,
+    response_words,
+    select_register_plan,
+)
+from app.capture import (
+    DEFAULT_MAX_BYTES as DEFAULT_CAPTURE_MAX_BYTES,
+    KIND_CRITICAL,
+    KIND_READ,
+    KIND_REREAD,
+    KIND_SAMPLE,
+    FrameCapture,
+)
+from app.deadband import DEFAULT_MAX_SILENCE_SECS, DeadbandFilter, parse_deadbands
+from app.energy import DEFAULT_GAP_MAX_SECS, EnergyIntegrator
+from app.history import (
+    DEFAULT_RAW_POINTS,
+    DEFAULT_TIERS,
+    HistoryStore,
+    parse_tiers,
+    start_history_server,
+)
+from app.plausibility import (
+    DEFAULT_FIELD_LIMITS,
+    PlausibilityFilter,
+    SampleCheck,
+    load_field_limits,
+)
+from app.registers import (
+    DEFAULT_CACHE_TTL_SECS,
+    DEFAULT_MAX_PENDING_READS,
+    RegisterCache,
+    RegisterReadQueue,
+    coalesce_reads,
+    parse_register_read,
+    register_reply,
+)
+from app.sample import SampleRecord, SampleSchema
+from app.schedule import SampleBudget, SampleSchedule
+from app.solar import SolarSite
+from app.spool import LineSpool
+from app.weather import DEFAULT_OBSERVATION_INTERVAL_SECS, WeatherClient
+from app.stats import FieldStats, WindowStats
+
 from tailucas_pylib import APP_NAME, app_config, creds, DEVICE_NAME_BASE, log
 from tailucas_pylib.flags import is_flag_enabled
 from tailucas_pylib.process import SignalHandler
@@ -39,34 +88,430 @@ from tailucas_pylib.handler import exception_handler
 from requests.adapters import ConnectionError
 from requests.exceptions import RequestException
 
-from influxdb_client import InfluxDBClient, Point
-from influxdb_client.client.write_api import ASYNCHRONOUS
+from influxdb_client import InfluxDBClient, Point, WritePrecision
+from influxdb_client.client.write_api import SYNCHRONOUS, WriteOptions
+from influxdb_client.rest import ApiException
 
-from prometheus_client import start_http_server, Gauge, CollectorRegistry
+from prometheus_client import start_http_server, Counter, Gauge, Histogram, CollectorRegistry
 from prometheus_client import multiprocess
 
+LOGGER_CONNECT_SECONDS = Histogram(
+    "logger_connect_seconds", "Time to open a session to the logger.", ["logger_sn"]
+)
+LOGGER_ROUND_TRIP_SECONDS = Histogram(
+    "logger_round_trip_seconds",
+    "Time from sending the requests to receiving the response for a read window.",
+    ["logger_sn", "window"],
+)
+LOGGER_DECODE_SECONDS = Histogram(
+    "logger_decode_seconds",
+    "Time to validate and decode the responses of a poll.",
+    ["logger_sn"],
+    buckets=(0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025),
+)
+LOGGER_RETRIES = Counter(
+    "logger_retries", "Logger polls that had to be retried.", ["logger_sn", "reason"]
+)
+LOGGER_IMPLAUSIBLE_VALUES = Counter(
+    "logger_implausible_values",
+    "Field values rejected by the plausibility filter.",
+    ["logger_sn", "field"],
+)
+LOGGER_SAMPLES = Counter(
+    "logger_samples", "Logger samples by tier and outcome.", ["logger_sn", "tier", "outcome"]
+)
+EVENT_DELAY_SECONDS = Histogram(
+    "event_delay_seconds",
+    "Time from sampling to the EventProcessor receiving the sample.",
+    ["logger_sn"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+INPROC_QUEUE_DEPTH = Gauge(
+    "inproc_queue_depth", "Messages sent to a worker but not yet received.", ["queue"]
+)
+INFLUXDB_WRITE_DELAY_SECONDS = Histogram(
+    "influxdb_write_delay_seconds",
+    "Time from sampling to InfluxDB accepting the point.",
+    ["point"],
+    buckets=(0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 15.0, 30.0, 60.0, 120.0, 300.0),
+)
+INFLUXDB_WRITE_FAILURES = Counter(
+    "influxdb_write_failures", "InfluxDB writes that failed.", ["stage"]
+)
+INFLUXDB_SPOOLED_POINTS = Counter(
+    "influxdb_spooled_points", "Points spooled to disk while InfluxDB was unavailable."
+)
+ENERGY_KWH = Counter(
+    "energy_kwh",
+    "Energy integrated from the power fields of samples.",
+    ["logger_sn", "field", "direction"],
+)
+WEATHER_REQUESTS = Counter(
+    "weather_requests", "Weather API requests by outcome.", ["outcome"]
+)
+FIELD_STATISTICS = Gauge(
+    "field_statistics",
+    "Statistics of sample fields over the statistics window.",
+    ["logger_sn", "field", "statistic"],
+)
+REGISTER_READS = Counter(
+    "register_reads", "Register reads requested over MQTT by outcome.", ["outcome"]
+)
+MQTT_FIELD_UPDATES = Counter(
+    "mqtt_field_updates",
+    "Per-field topic updates published or suppressed by their deadband.",
+    ["outcome"],
+)
+RUNTIME_QUEUE_DROPS = Counter(
+    "runtime_queue_drops",
+    "Messages dropped by the asyncio runtime for want of queue space.",
+    ["queue"],
+)
+MQTT_PUBLISH_SECONDS = Histogram(
+    "mqtt_publish_seconds",
+    "Time to publish the inverter state of a logger.",
+    ["logger_sn"],
+    buckets=(0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025),
+)
+
+
+def observe_exchange(logger_sn, read_windows, connection, decode_secs):
+    labels = {"logger_sn": str(logger_sn)}
+    if connection.connect_secs is not None:
+        LOGGER_CONNECT_SECONDS.labels(**labels).observe(connection.connect_secs)
+    for window, round_trip_secs in zip(read_windows, connection.round_trip_secs):
+        LOGGER_ROUND_TRIP_SECONDS.labels(window=f"{window.start:#06x}", **labels).observe(
+            round_trip_secs
+        )
+    LOGGER_DECODE_SECONDS.labels(**labels).observe(decode_secs)
+
+
+def decode_exchange(
+    logger_sn, connection, read_windows, request_frames, responses, capture, kind, register_cache
+):
+    """
+    Capture, decode and cache the responses of one exchange with a logger,
+    observing its timings.
+
+    Raises FrameError on the first invalid response.
+    """
+    log.debug(f"[{logger_sn}] Received {sum(len(data) for data in responses)} bytes.")
+    if capture is not None:
+        # before decoding, so that frames which fail to decode are kept too
+        capture.append(time.time_ns(), logger_sn, kind, request_frames, responses)
+    decode_start = time.perf_counter()
+    logger_data = decode_responses(
+        read_windows=read_windows, responses=responses, logger_sn=logger_sn, output={}
+    )
+    if register_cache is not None:
+        read_at = time.monotonic()
+        for window, data in zip(read_windows, responses):
+            register_cache.put(logger_sn, window.start, response_words(data, window.count), read_at)
+    observe_exchange(
+        logger_sn=logger_sn,
+        read_windows=read_windows,
+        connection=connection,
+        decode_secs=time.perf_counter() - decode_start,
+    )
+    log.debug(f"[{logger_sn}] Fetched {len(logger_data)} fields after {len(responses)} chunks.")
+    return logger_data
+
+
+def open_capture(capture_path, capture_max_bytes):
+    capture = FrameCapture(capture_path, max_bytes=capture_max_bytes)
+    if capture.outdated_path is not None:
+        log.warning(
+            f"Moved the capture at {capture_path}, which is in an older format, to {capture.outdated_path}."
+        )
+    return capture
+
+
+def exchange_failed(logger_sn, connection, error, attempt):
+    """
+    Count a failed exchange with a logger, returning whether to retry it.
+    """
+    if isinstance(error, FrameError):
+        log.warning(f"[{logger_sn}] Discarding invalid response (attempt {attempt}): {error}")
+        LOGGER_RETRIES.labels(logger_sn=str(logger_sn), reason="invalid_frame").inc()
+        # resynchronize on a fresh session and retry immediately
+        connection.close()
+        return True
+    log.warning(f"[{logger_sn}] {error}")
+    LOGGER_RETRIES.labels(logger_sn=str(logger_sn), reason="connection").inc()
+    return False
+
+
+class ObservedSampleCheck(SampleCheck):
+    """
+    Logs and counts the judgement of a sample read from a logger. The readers
+    differ only in how they read.
+    """
+
+    def __init__(self, logger_sn, plausibility, read_windows, logger_data):
+        SampleCheck.__init__(
+            self, plausibility, read_windows, logger_data, max_rereads=PLAUSIBILITY_REREAD_ATTEMPTS
+        )
+        self.logger_sn = logger_sn
+
+    def reread_windows(self):
+        reread_windows = SampleCheck.reread_windows(self, now=time.time())
+        if len(self.rejected) == 0:
+            return reread_windows
+        observe_rejected(self.logger_sn, self.rejected)
+        if len(reread_windows) == 0:
+            return reread_windows
+        LOGGER_RETRIES.labels(logger_sn=str(self.logger_sn), reason="implausible").inc()
+        log.debug(
+            f"[{self.logger_sn}] Re-reading {', '.join(self.rejected)} in {len(reread_windows)} requests (attempt {self.rereads})."
+        )
+        return reread_windows
+
+    def sample(self):
+        if len(self.rejected) > 0:
+            log.warning(
+                f"[{self.logger_sn}] Dropping {', '.join(self.rejected)} after {self.rereads} re-reads."
+            )
+        return SampleCheck.sample(self, now=time.time())
+
+
+def compile_critical_tier(register_plan, logger_sn, critical_fields, register_window_max):
+    """
+    Plan the registers read between full scans for load shedding, returning
+    the schema of their fields and the windows reading them.
+    """
+    critical_plan = select_register_plan(register_plan, set(critical_fields) | set(CRITICAL_FIELDS))
+    critical_schema = SampleSchema.from_register_plan(critical_plan).register()
+    # as few requests as possible, even if that reads a few more registers
+    critical_windows = compile_read_windows(
+        register_plan=critical_plan,
+        logger_sn=logger_sn,
+        max_gap=register_window_max,
+        max_count=register_window_max,
+    )
+    return critical_schema, critical_windows
+
+
+def register_reply_message(read, reply):
+    return [
+        EVENT_REGISTERS,
+        (read.reply_to or REGISTER_REPLY_TOPIC).encode(),
+        json.dumps(reply).encode(),
+    ]
+
+
+def take_register_reads(read_queue, register_cache, logger_sn, register_gap_max, register_window_max):
+    """
+    Take the queued register reads, replying to those the cache now holds or
+    that are for another logger. Returns the replies, the reads left and the
+    windows reading their registers in as few requests as possible.
+    """
+    replies = []
+    unanswered = []
+    for read in read_queue.take():
+        if read.logger_sn != logger_sn:
+            REGISTER_READS.labels(outcome="unanswered").inc()
+            reply = register_reply(
+                read, error=f"Not cached; on-demand reads are only made from logger {logger_sn}."
+            )
+        else:
+            # perhaps read by a sample since it was queued
+            cached = register_cache.get(read.logger_sn, read.start, read.count, read.max_age_secs)
+            if cached is None:
+                unanswered.append(read)
+                continue
+            REGISTER_READS.labels(outcome="cached").inc()
+            reply = register_reply(read, *cached, source="cache")
+        replies.append(register_reply_message(read, reply))
+    if len(unanswered) == 0:
+        return replies, unanswered, []
+    read_windows = [
+        ReadWindow(
+            start=start,
+            count=count,
+            frame=build_request_frame(logger_sn, start, count),
+            decoders=(),
+        )
+        for start, count in coalesce_reads(unanswered, register_gap_max, register_window_max)
+    ]
+    log.debug(
+        f"[{logger_sn}] Reading registers for {len(unanswered)} requests in {len(read_windows)} requests: "
+        + ", ".join(f"0x{window.start:04X}+{window.count}" for window in read_windows)
+    )
+    return replies, unanswered, read_windows
+
+
+def answer_register_reads(unanswered, register_cache):
+    """
+    Reply to the reads made, from whatever reading them put in the cache.
+    """
+    replies = []
+    for read in unanswered:
+        cached = register_cache.get(read.logger_sn, read.start, read.count)
+        if cached is None:
+            REGISTER_READS.labels(outcome="failed").inc()
+            reply = register_reply(read, error="Unable to read the registers.")
+        else:
+            REGISTER_READS.labels(outcome="read").inc()
+            reply = register_reply(read, *cached, source="logger")
+        replies.append(register_reply_message(read, reply))
+    return replies
+
+
+async def pause(stopping, delay):
+    """
+    Sleep for the delay unless stopping is set first, returning whether it is.
+    """
+    try:
+        await asyncio.wait_for(stopping.wait(), timeout=max(delay, 0))
+    except TimeoutError:
+        pass
+    return stopping.is_set()
+
+
+def observe_statistics(logger_sn, field, snapshot):
+    for statistic, value in snapshot.items():
+        if value is not None:
+            FIELD_STATISTICS.labels(
+                logger_sn=str(logger_sn), field=field, statistic=statistic
+            ).set(value)
+
+
+def observe_rejected(logger_sn, rejected):
+    for key, reason in rejected.items():
+        log.warning(f"[{logger_sn}] Treating {reason} as implausible.")
+        LOGGER_IMPLAUSIBLE_VALUES.labels(logger_sn=str(logger_sn), field=key).inc()
+
+
 sentry_dsn = creds.get_creds(
     app_config.get("creds", "sentry_dsn").replace("__APP_NAME__", APP_NAME)
 )
 
 URL_WORKER_MQTT_PUBLISH = "inproc://mqtt-publish"
+# event keys holding tags and the sample time rather than a point
+EVENT_TAGS = "tags"
+EVENT_TIMESTAMP = "timestamp"
+# first frame of a two-part message carrying a packed logger sample
+EVENT_SAMPLE = b"sample"
+# as above, for the critical registers sampled between full scans
+EVENT_CRITICAL_SAMPLE = b"critical"
+# first frame of a three-part message carrying the logger serial and its energy totals
+EVENT_ENERGY = b"energy"
+# first frame of a three-part message carrying a register read reply and its topic
+EVENT_REGISTERS = b"registers"
+
+INFLUXDB_BATCH_SIZE = 500
+INFLUXDB_FLUSH_INTERVAL_MS = 10000
+INFLUXDB_SPOOL_DIR = "/data/influxdb-spool"
+INFLUXDB_SPOOL_SEGMENT_BYTES = 1048576
+INFLUXDB_SPOOL_MAX_BYTES = 67108864
+INFLUXDB_SPOOL_REPLAY_LINES_PER_SEC = 100
+# how often an unhealthy sink is probed with spooled points
+INFLUXDB_SPOOL_PROBE_INTERVAL_SECS = 30
+# bad request, too large and unprocessable: the points themselves are at fault
+INFLUXDB_REJECTED_STATUSES = (400, 413, 422)
+EVENT_POLL_INTERVAL_MS = 1000
+HISTORY_NETWORK_PORT = 9402
+ENERGY_STATE_PATH = "/data/energy-state.json"
+ENERGY_PERSIST_INTERVAL_SECS = 60
+
+MQTT_POLL_INTERVAL_MS = 1000
+REGISTER_REQUEST_TOPIC = "inverter/registers/get"
+REGISTER_REPLY_TOPIC = "inverter/registers/reply"
+# the alternative to a thread per component
+RUNTIME_ASYNCIO = "asyncio"
+RUNTIME_QUEUE_SIZE = 100
+RUNTIME_SHUTDOWN_GRACE_SECONDS = 20
+
+LOGGER_SOCKET_TIMEOUT_SECONDS = 10
+# invalid frames are retried at once rather than after the plausibility delay
+LOGGER_FRAME_ATTEMPTS = 3
 
 DEFAULT_SAMPLE_INTERVAL_SECONDS = 60
 ERROR_RETRY_INTERVAL_SECONDS = 5
-IMPLAUSIBLE_CHANGE_PERCENTAGE = 5
+# windows holding implausible values are re-read at once before retrying the sample
+PLAUSIBILITY_REREAD_ATTEMPTS = 2
 BATTERY_LOW_PCT = 45
+# read between full scans to drive load shedding, with the plausibility check inputs
+CRITICAL_FIELDS = (
+    "alert",
+    "battery_soc_pct",
+    "battery_voltage_v",
+    "battery_power_w",
+    "pv1_power_w",
+    "pv2_power_w",
+    "grid_voltage_l1_v",
+    "grid_voltage_l2_v",
+    "inverter_l1_power_w",
+    "inverter_l2_power_w",
+)
+DEFAULT_CRITICAL_SAMPLE_INTERVAL_SECONDS = 5
 # assuming CFE drop-out at 30%
 BATTERY_CRITICAL_PCT = 40
 # idle small home ~ 300W
 BATTERY_MAJOR_DRAW_W = 500
+# restoring load is held this long after shedding it
+SWITCH_HYSTERESIS_SECONDS = 300
+# commands are resent when the bank has not reported the state by then
+SWITCH_CONFIRM_TIMEOUT_SECONDS = 90
+# the power surplus and the fields below are smoothed over this many seconds
+STATISTICS_WINDOW_SECONDS = 300
+STATISTICS_EWMA_HALFLIFE_SECONDS = 120
+STATISTICS_FIELDS = (
+    "battery_soc_pct",
+    "battery_power_w",
+    "pv1_power_w",
+    "pv2_power_w",
+    "total_load_power_w",
+)
 
 
-def twos_complement_hex(hexval):
-    bits = 16
-    val = int(hexval, bits)
-    if val & (1 << (bits - 1)):
-        val -= 1 << bits
-    return val
+class SwitchActuator:
+    """
+    Tracks the desired and last commanded state of each switch bank so that
+    control messages are only sent for transitions or unconfirmed commands.
+    Shedding is immediate, restoring is held for the hysteresis window.
+    """
+
+    def __init__(self, hysteresis_secs, confirm_timeout_secs):
+        self.hysteresis_secs = hysteresis_secs
+        self.confirm_timeout_secs = confirm_timeout_secs
+        self.desired_state = dict()
+        self.commanded_at = dict()
+        self.commands_sent = 0
+        self.commands_suppressed = 0
+
+    def should_command(self, switch_bank, confirmed_state, switch_state, now):
+        desired_state = self.desired_state.get(switch_bank)
+        confirmed = all(s == switch_state for s in confirmed_state)
+        if desired_state is None and confirmed:
+            # the bank is already where we want it
+            self.desired_state[switch_bank] = switch_state
+            desired_state = switch_state
+        commanded_at = self.commanded_at.get(switch_bank)
+        if switch_state == desired_state:
+            if confirmed or (
+                commanded_at is not None
+                and now - commanded_at < self.confirm_timeout_secs
+            ):
+                self.commands_suppressed += 1
+                return False
+            if commanded_at is not None:
+                log.warning(
+                    f"[{switch_bank}] State {confirmed_state} does not yet confirm [{switch_state}]; resending."
+                )
+        elif (
+            switch_state == 1
+            and commanded_at is not None
+            and now - commanded_at < self.hysteresis_secs
+        ):
+            self.commands_suppressed += 1
+            return False
+        return True
+
+    def commanded(self, switch_bank, switch_state, now):
+        self.desired_state[switch_bank] = switch_state
+        self.commanded_at[switch_bank] = now
+        self.commands_sent += 1
 
 
 class LoggerReader(AppThread):
@@ -77,244 +522,623 @@ class LoggerReader(AppThread):
         logger_ip,
         logger_port,
         sample_interval_secs=DEFAULT_SAMPLE_INTERVAL_SECONDS,
+        register_gap_max=DEFAULT_REGISTER_GAP_MAX,
+        register_window_max=DEFAULT_REGISTER_WINDOW_MAX,
+        critical_fields=(),
+        critical_interval_secs=0,
+        field_limits=DEFAULT_FIELD_LIMITS,
+        capture_path=None,
+        capture_max_bytes=DEFAULT_CAPTURE_MAX_BYTES,
+        register_cache=None,
+        read_queue=None,
     ):
         AppThread.__init__(self, name=self.__class__.__name__)
         self.field_mappings = field_mappings
+        self.register_plan = compile_register_plan(field_mappings)
+        self.sample_schema = SampleSchema.from_register_plan(self.register_plan).register()
+        self.read_windows = compile_read_windows(
+            register_plan=self.register_plan,
+            logger_sn=logger_sn,
+            max_gap=register_gap_max,
+            max_count=register_window_max,
+        )
+        self.request_frames = [window.frame for window in self.read_windows]
         self.logger_sn = logger_sn
         self.logger_ip = logger_ip
         self.logger_port = logger_port
         self.sample_interval_secs = sample_interval_secs
-
-    def get_logger_data(self):
-        output = {}
-
-        client_socket = None
-        pini = 59
-        pfin = 112
-        chunks = 0
-        while chunks < 2:
-            start = binascii.unhexlify("A5")  # start
-            length = binascii.unhexlify("1700")  # datalength
-            controlcode = binascii.unhexlify("1045")  # controlCode
-            serial = binascii.unhexlify("0000")  # serial
-            datafield = binascii.unhexlify(
-                "020000000000000000000000000000"
-            )  # com.igen.localmode.dy.instruction.send.SendDataField
-            pos_ini = str(hex(pini)[2:4].zfill(4))
-            pos_fin = str(hex(pfin - pini + 1)[2:4].zfill(4))
-            businessfield = binascii.unhexlify(
-                "0103" + pos_ini + pos_fin
-            )  # sin CRC16MODBUS
-            crc = binascii.unhexlify(
-                str(hex(libscrc.modbus(businessfield))[4:6])
-                + str(hex(libscrc.modbus(businessfield))[2:4])
-            )  # CRC16modbus
-            checksum = binascii.unhexlify("00")  # checksum F2
-            endCode = binascii.unhexlify("15")
-
-            inverter_sn2 = bytearray.fromhex(
-                hex(self.logger_sn)[8:10]
-                + hex(self.logger_sn)[6:8]
-                + hex(self.logger_sn)[4:6]
-                + hex(self.logger_sn)[2:4]
-            )
-            frame = bytearray(
-                start
-                + length
-                + controlcode
-                + serial
-                + inverter_sn2
-                + datafield
-                + businessfield
-                + crc
-                + checksum
-                + endCode
+        self.register_gap_max = register_gap_max
+        self.register_window_max = register_window_max
+        self.budget = SampleBudget.for_interval(
+            interval_secs=sample_interval_secs,
+            socket_timeout_secs=LOGGER_SOCKET_TIMEOUT_SECONDS,
+            retry_wait_secs=ERROR_RETRY_INTERVAL_SECONDS,
+        )
+        # raw registers shared with the read service, and the reads it could not answer
+        self.register_cache = register_cache
+        self.read_queue = read_queue
+        self.connection = LoggerConnection(
+            address=logger_ip,
+            port=logger_port,
+            timeout=self.budget.read_secs,
+            connect_timeout=self.budget.connect_secs,
+        )
+        self.plausibility = PlausibilityFilter(field_limits, sample_interval_secs)
+        # raw exchanges kept for offline replay
+        self.capture = None
+        if capture_path:
+            self.capture = open_capture(capture_path, capture_max_bytes)
+        # registers read between full scans for load shedding
+        self.critical_interval_secs = critical_interval_secs
+        self.critical_windows = ()
+        if critical_interval_secs > 0:
+            self.critical_schema, self.critical_windows = compile_critical_tier(
+                self.register_plan, logger_sn, critical_fields, register_window_max
             )
+        self.critical_frames = [window.frame for window in self.critical_windows]
 
-            checksum = 0
-            frame_bytes = bytearray(frame)
-            for i in range(1, len(frame_bytes) - 2, 1):
-                checksum += frame_bytes[i] & 255
-            frame_bytes[len(frame_bytes) - 2] = int((checksum & 255))
-
-            # OPEN SOCKET
-            log.debug(
-                f"Opening stream socket to logger {self.logger_sn} @ {self.logger_ip}:{self.logger_port}..."
-            )
-            for res in socket.getaddrinfo(
-                self.logger_ip, self.logger_port, socket.AF_INET, socket.SOCK_STREAM
-            ):
-                family, socktype, proto, canonname, sockadress = res
-                try:
-                    client_socket = socket.socket(family, socktype, proto)
-                    client_socket.settimeout(10)
-                    client_socket.connect(sockadress)
-                except socket.error as msg:
-                    log.warning(f"{msg}")
+    def _read_resynchronizing(self, read_windows, request_frames, kind):
+        for attempt in range(1, LOGGER_FRAME_ATTEMPTS + 1):
+            if not self.connection.connected:
+                log.debug(
+                    f"Opening stream socket to logger {self.logger_sn} @ {self.logger_ip}:{self.logger_port}..."
+                )
+            log.debug(f"Sending {len(request_frames)} data frames.")
+            try:
+                responses = self.connection.exchange(request_frames)
+                return decode_exchange(
+                    logger_sn=self.logger_sn,
+                    connection=self.connection,
+                    read_windows=read_windows,
+                    request_frames=request_frames,
+                    responses=responses,
+                    capture=self.capture,
+                    kind=kind,
+                    register_cache=self.register_cache,
+                )
+            except (FrameError, OSError) as e:
+                if not exchange_failed(self.logger_sn, self.connection, e, attempt):
                     return None
+        return None
 
-            # SEND DATA
-            log.debug(
-                f"Sending {len(frame_bytes)} bytes data frame for chunk {chunks}."
+    def get_logger_data(self, critical=False):
+        read_windows, request_frames = self.read_windows, self.request_frames
+        kind = KIND_SAMPLE
+        if critical:
+            read_windows, request_frames = self.critical_windows, self.critical_frames
+            kind = KIND_CRITICAL
+        logger_data = self._read_resynchronizing(read_windows, request_frames, kind)
+        if logger_data is None:
+            return None
+        check = ObservedSampleCheck(self.logger_sn, self.plausibility, read_windows, logger_data)
+        reread_windows = check.reread_windows()
+        while len(reread_windows) > 0:
+            reread = self._read_resynchronizing(
+                reread_windows, [window.frame for window in reread_windows], KIND_REREAD
             )
-            client_socket.sendall(frame_bytes)
+            if reread is None:
+                break
+            check.merge(reread)
+            reread_windows = check.reread_windows()
+        return check.sample()
 
-            # RECEIVE RESPONSE
-            data = None
-            try:
-                data = client_socket.recv(1024)
-                if data is None:
-                    log.warning("No response data.")
-                    return None
-            except socket.timeout as msg:
-                log.warning(f"{msg}")
-                return None
-            finally:
-                try:
-                    client_socket.close()
-                except socket.error as msg:
-                    log.warning(f"{msg}")
-
-            log.debug(f"Received {len(data)} bytes for chunk {chunks}.")
-            # PARSE RESPONSE (start position 56, end position 60)
-            totalpower = 0
-            i = pfin - pini
-            a = 0
-            while a <= i:
-                p1 = 56 + (a * 4)
-                p2 = 60 + (a * 4)
-                try:
-                    response = twos_complement_hex(
-                        str(
-                            "".join(
-                                hex(ord(chr(x)))[2:].zfill(2) for x in bytearray(data)
-                            )
-                            + "  "
-                            + re.sub("[^\x20-\x7f]", "", "")
-                        )[p1:p2]
-                    )
-                except ValueError:
-                    log.warning(f"Discarding {len(data)} byte response.", exc_info=True)
-                    return None
-                hexpos = str("0x") + str(hex(a + pini)[2:].zfill(4)).upper()
-                for parameter in self.field_mappings:
-                    for item in parameter["items"]:
-                        title = item["titleEN"]
-                        ratio = item["ratio"]
-                        unit = item["unit"]
-                        for register in item["registers"]:
-                            if register == hexpos and chunks != -1:
-                                if title.find("Temperature") != -1:
-                                    response = round(response * ratio - 100, 2)
-                                else:
-                                    response = round(response * ratio, 2)
-                                if len(unit) > 0:
-                                    key = f"{title} {unit}"
-                                else:
-                                    key = f"{title}"
-                                # sanitize string
-                                key = (
-                                    key.replace(" ", "_")
-                                    .replace("-", "_")
-                                    .replace("º", "c")
-                                    .replace("%", "pct")
-                                    .lower()
-                                )
-                                output[key] = response
-                                if hexpos == "0x00BA":
-                                    totalpower += response * ratio
-                                if hexpos == "0x00BB":
-                                    totalpower += response * ratio
-                a += 1
-            pini = 150
-            pfin = 195
-            chunks += 1
-        log.debug(f"Fetched {len(output)} fields after {chunks} chunks.")
-        return output
+    def serve_reads(self, mqtt_socket):
+        """
+        Answer the queued register reads, reading whatever the cache does not
+        hold in as few requests as possible.
+        """
+        replies, unanswered, read_windows = take_register_reads(
+            self.read_queue,
+            self.register_cache,
+            self.logger_sn,
+            self.register_gap_max,
+            self.register_window_max,
+        )
+        self._send_replies(mqtt_socket, replies)
+        if len(read_windows) == 0:
+            return
+        # the cache is filled with whatever is read
+        self._read_resynchronizing(
+            read_windows, [window.frame for window in read_windows], KIND_READ
+        )
+        self._send_replies(mqtt_socket, answer_register_reads(unanswered, self.register_cache))
+
+    def _send_replies(self, mqtt_socket, replies):
+        for message in replies:
+            mqtt_socket.send_multipart(message)
+            INPROC_QUEUE_DEPTH.labels(queue="mqtt").inc()
+
+    def wait(self, delay, mqtt_socket):
+        """
+        Sleep until the delay has passed or shutdown, making any register
+        reads queued meanwhile.
+        """
+        if self.read_queue is None:
+            threads.interruptable_sleep.wait(delay)
+            return
+        deadline = time.monotonic() + delay
+        while not threads.shutting_down:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            # woken by a queued read, or at shutdown
+            if self.read_queue.wait(remaining) and not threads.shutting_down:
+                self.serve_reads(mqtt_socket)
+
+    def sample_critical(self, tick, mqtt_socket):
+        logger_data = self.get_logger_data(critical=True)
+        if logger_data is None:
+            LOGGER_SAMPLES.labels(
+                logger_sn=str(self.logger_sn), tier="critical", outcome="missing"
+            ).inc()
+            return
+        # straight to load shedding
+        mqtt_socket.send_multipart(
+            [
+                EVENT_CRITICAL_SAMPLE,
+                self.critical_schema.subset(logger_data.keys()).pack(
+                    self.logger_sn, tick.time_ns, logger_data
+                ),
+            ],
+            copy=False,
+        )
+        INPROC_QUEUE_DEPTH.labels(queue="mqtt").inc()
+        LOGGER_SAMPLES.labels(
+            logger_sn=str(self.logger_sn), tier="critical", outcome="sent"
+        ).inc()
 
     # noinspection PyBroadException
     def run(self):
         log.info(
             f"Using inverter logger {self.logger_sn} at address {self.logger_ip}:{self.logger_port}."
         )
+        log.info(
+            f"Reading {len(self.register_plan)} mapped registers in {len(self.read_windows)} requests: "
+            + ", ".join(
+                f"0x{window.start:04X}+{window.count}" for window in self.read_windows
+            )
+        )
+        if len(self.critical_windows) > 0:
+            log.info(
+                f"Reading {len(self.critical_schema.keys)} critical fields every {self.critical_interval_secs}s in {len(self.critical_windows)} requests: "
+                + ", ".join(
+                    f"0x{window.start:04X}+{window.count}"
+                    for window in self.critical_windows
+                )
+            )
         with exception_handler(
             connect_url=URL_WORKER_APP, and_raise=False, shutdown_on_error=True
-        ) as app_socket:
-            prev_battery_soc = None
-            prev_battery_soc_set = time.time()
+        ) as app_socket, exception_handler(
+            connect_url=URL_WORKER_MQTT_PUBLISH, and_raise=False, shutdown_on_error=True
+        ) as mqtt_socket:
+            schedule = SampleSchedule(self.sample_interval_secs)
+            critical_schedule = None
+            if len(self.critical_windows) > 0:
+                critical_schedule = SampleSchedule(self.critical_interval_secs)
             while not threads.shutting_down:
-                operation_start_time = time.time()
-                tries = 1
+                tick = schedule.next_tick()
+                if tick.skipped > 0:
+                    log.warning(f"Skipping {tick.skipped} late samples.")
+                    LOGGER_SAMPLES.labels(
+                        logger_sn=str(self.logger_sn), tier="full", outcome="skipped"
+                    ).inc(tick.skipped)
+                # the critical tier fills the time until the full scan
+                while critical_schedule is not None and not threads.shutting_down:
+                    critical_tick = critical_schedule.next_tick()
+                    if critical_tick.time_ns >= tick.time_ns:
+                        break
+                    self.wait(critical_tick.monotonic - time.monotonic(), mqtt_socket)
+                    if threads.shutting_down:
+                        break
+                    self.sample_critical(critical_tick, mqtt_socket)
+                sample_delay = tick.monotonic - time.monotonic()
+                log.debug(f"Waiting {sample_delay:.2f}s until the next sample.")
+                self.wait(sample_delay, mqtt_socket)
+                if threads.shutting_down:
+                    break
+                tries = 0
                 logger_data = None
-                # try within the time budget to get a plausible value, relative to the previous
-                while (
-                    time.time() - operation_start_time
-                    < DEFAULT_SAMPLE_INTERVAL_SECONDS / 2
-                ):
+                # try within the time budget to get a plausible sample
+                while not threads.shutting_down:
                     tries += 1
-                    now = time.time()
                     logger_data = self.get_logger_data()
-                    if isinstance(logger_data, dict):
-                        if "battery_soc_pct" in logger_data.keys():
-                            battery_soc = logger_data["battery_soc_pct"]
-                            battery_voltage = logger_data["battery_voltage_v"]
-                            # implausible battery state
-                            if battery_soc == 0 and battery_voltage == 0:
-                                log.warning(
-                                    f"{battery_soc=}% and {battery_voltage=}v. Treating this output as implausible: {str(logger_data)}"
-                                )
-                                continue
-                            # no previous to compare
-                            if prev_battery_soc is None:
-                                prev_battery_soc = battery_soc
-                                prev_battery_soc_set = now
-                                # current dict is good enough, break the try loop
-                                break
-                            soc_delta_pct = int(battery_soc - prev_battery_soc)
-                            prev_battery_soc_last_set = now - prev_battery_soc_set
-                            log.debug(
-                                f"battery_soc_pct changed by {soc_delta_pct}% from {prev_battery_soc} (set {prev_battery_soc_last_set:.2f}s ago) to {battery_soc}."
-                            )
-                            # check for an implausible negative change within some time bound
-                            if (
-                                abs(soc_delta_pct) >= IMPLAUSIBLE_CHANGE_PERCENTAGE
-                                and prev_battery_soc_last_set
-                                < DEFAULT_SAMPLE_INTERVAL_SECONDS * 2
-                            ):
-                                log.warning(
-                                    f"battery_soc_pct changed by more than {IMPLAUSIBLE_CHANGE_PERCENTAGE}% from {prev_battery_soc} to {battery_soc}. Treating this output as implausible: {str(logger_data)}"
-                                )
-                            else:
-                                # accept the new value as good
-                                prev_battery_soc = battery_soc
-                                prev_battery_soc_set = now
-                                # control field change is plausible
-                                break
+                    if logger_data is not None:
+                        break
+                    if not self.budget.can_retry(tick, now=time.monotonic()):
+                        break
                     log.warning(
-                        f"Waiting {ERROR_RETRY_INTERVAL_SECONDS}s after {tries} unsuccessful tries."
+                        f"Waiting {self.budget.retry_wait_secs}s after {tries} unsuccessful tries."
                     )
-                    threads.interruptable_sleep.wait(ERROR_RETRY_INTERVAL_SECONDS)
+                    threads.interruptable_sleep.wait(self.budget.retry_wait_secs)
                 if logger_data is not None and len(logger_data) > 0:
                     log.debug(f"Sending {len(logger_data)} fields for publication.")
-                    app_socket.send_pyobj({"inverter": logger_data})
-                else:
-                    log.warning(
-                        f"Unable to fetch any valid data after {tries} tries (within {DEFAULT_SAMPLE_INTERVAL_SECONDS}s)."
-                    )
-                # stop for the remainder of the sampling interval
-                operation_time = time.time() - operation_start_time
-                sample_delay = self.sample_interval_secs - operation_time
-                if sample_delay < 0:
-                    normalized_sample_delay = min(
-                        operation_time, self.sample_interval_secs
+                    # attributed to the tick so that samples line up
+                    app_socket.send_multipart(
+                        [
+                            EVENT_SAMPLE,
+                            self.sample_schema.subset(logger_data.keys()).pack(
+                                self.logger_sn, tick.time_ns, logger_data
+                            ),
+                        ],
+                        copy=False,
                     )
+                    INPROC_QUEUE_DEPTH.labels(queue="app").inc()
+                    LOGGER_SAMPLES.labels(
+                        logger_sn=str(self.logger_sn), tier="full", outcome="sent"
+                    ).inc()
+                else:
+                    LOGGER_SAMPLES.labels(
+                        logger_sn=str(self.logger_sn), tier="full", outcome="missing"
+                    ).inc()
                     log.warning(
-                        f"Sample interval of {self.sample_interval_secs}s is too short, implying wait of {sample_delay:.2f}s. Resetting delay to {normalized_sample_delay:.2f}s."
+                        f"Unable to fetch any valid data after {tries} tries (within {self.budget.retry_secs}s)."
                     )
-                    # don't use 0: never spin
-                    sample_delay = normalized_sample_delay
-                log.debug(f"Waiting {sample_delay:.2f}s until the next sample.")
-                threads.interruptable_sleep.wait(sample_delay)
+        self.connection.close()
+        if self.capture is not None:
+            self.capture.close()
+
+
+class FleetLogger:
+    def __init__(
+        self,
+        register_plan,
+        logger_sn,
+        logger_ip,
+        logger_port,
+        sample_interval_secs,
+        register_gap_max,
+        register_window_max,
+        field_limits,
+        critical_fields=(),
+        critical_interval_secs=0,
+    ):
+        self.logger_sn = logger_sn
+        self.logger_ip = logger_ip
+        self.logger_port = logger_port
+        self.sample_interval_secs = sample_interval_secs
+        self.budget = SampleBudget.for_interval(
+            interval_secs=sample_interval_secs,
+            socket_timeout_secs=LOGGER_SOCKET_TIMEOUT_SECONDS,
+            retry_wait_secs=ERROR_RETRY_INTERVAL_SECONDS,
+        )
+        self.read_windows = compile_read_windows(
+            register_plan=register_plan,
+            logger_sn=logger_sn,
+            max_gap=register_gap_max,
+            max_count=register_window_max,
+        )
+        self.request_frames = [window.frame for window in self.read_windows]
+        self.connection = AsyncLoggerConnection(
+            address=logger_ip,
+            port=logger_port,
+            timeout=self.budget.read_secs,
+            connect_timeout=self.budget.connect_secs,
+        )
+        self.plausibility = PlausibilityFilter(field_limits, sample_interval_secs)
+        # registers read between full scans for load shedding
+        self.critical_interval_secs = critical_interval_secs
+        self.critical_windows = ()
+        if critical_interval_secs > 0:
+            self.critical_schema, self.critical_windows = compile_critical_tier(
+                register_plan, logger_sn, critical_fields, register_window_max
+            )
+        self.critical_frames = [window.frame for window in self.critical_windows]
+
+
+class FleetReader(AppThread):
+    """
+    Polls many inverter loggers concurrently from a single asyncio event
+    loop, each on its own schedule. The primary logger also has its critical
+    fields read between samples and makes the register reads queued for it.
+    """
+
+    def __init__(
+        self,
+        field_mappings,
+        logger_fleet,
+        register_gap_max=DEFAULT_REGISTER_GAP_MAX,
+        register_window_max=DEFAULT_REGISTER_WINDOW_MAX,
+        critical_fields=(),
+        critical_interval_secs=0,
+        primary_logger_sn=None,
+        field_limits=DEFAULT_FIELD_LIMITS,
+        capture_path=None,
+        capture_max_bytes=DEFAULT_CAPTURE_MAX_BYTES,
+        register_cache=None,
+        read_queue=None,
+    ):
+        AppThread.__init__(self, name=self.__class__.__name__)
+        self.register_plan = compile_register_plan(field_mappings)
+        self.sample_schema = SampleSchema.from_register_plan(self.register_plan).register()
+        self.register_gap_max = register_gap_max
+        self.register_window_max = register_window_max
+        # raw registers shared with the read service, and the reads it could not answer
+        self.register_cache = register_cache
+        self.read_queue = read_queue
+        # one capture for the fleet, its records carry the logger serial
+        self.capture = None
+        if capture_path:
+            self.capture = open_capture(capture_path, capture_max_bytes)
+        self.loggers = [
+            FleetLogger(
+                register_plan=self.register_plan,
+                logger_sn=logger_sn,
+                logger_ip=logger_ip,
+                logger_port=logger_port,
+                sample_interval_secs=sample_interval_secs,
+                register_gap_max=register_gap_max,
+                register_window_max=register_window_max,
+                field_limits=field_limits,
+                critical_fields=critical_fields,
+                # load shedding acts on the primary logger only
+                critical_interval_secs=critical_interval_secs
+                if logger_sn == primary_logger_sn
+                else 0,
+            )
+            for logger_sn, logger_ip, logger_port, sample_interval_secs in logger_fleet
+        ]
+        self.primary_logger = None
+        for logger in self.loggers:
+            if logger.logger_sn == primary_logger_sn:
+                self.primary_logger = logger
+        self._shutdown = None
+        self._reads_ready = None
+
+    def _watch_shutdown(self, loop):
+        threads.interruptable_sleep.wait()
+        try:
+            loop.call_soon_threadsafe(self._shutdown.set)
+        except RuntimeError:
+            # the loop has already finished
+            pass
+
+    async def _wake_on_shutdown(self):
+        await self._shutdown.wait()
+        self._reads_ready.set()
+
+    async def _read_resynchronizing(self, logger, read_windows, request_frames, kind):
+        for attempt in range(1, LOGGER_FRAME_ATTEMPTS + 1):
+            try:
+                responses = await logger.connection.exchange(request_frames)
+                return decode_exchange(
+                    logger_sn=logger.logger_sn,
+                    connection=logger.connection,
+                    read_windows=read_windows,
+                    request_frames=request_frames,
+                    responses=responses,
+                    capture=self.capture,
+                    kind=kind,
+                    register_cache=self.register_cache,
+                )
+            except (FrameError, OSError) as e:
+                if not exchange_failed(logger.logger_sn, logger.connection, e, attempt):
+                    return None
+        return None
+
+    async def get_logger_data(self, logger, critical=False):
+        read_windows, request_frames = logger.read_windows, logger.request_frames
+        kind = KIND_SAMPLE
+        if critical:
+            read_windows, request_frames = logger.critical_windows, logger.critical_frames
+            kind = KIND_CRITICAL
+        logger_data = await self._read_resynchronizing(logger, read_windows, request_frames, kind)
+        if logger_data is None:
+            return None
+        check = ObservedSampleCheck(logger.logger_sn, logger.plausibility, read_windows, logger_data)
+        reread_windows = check.reread_windows()
+        while len(reread_windows) > 0:
+            reread = await self._read_resynchronizing(
+                logger, reread_windows, [window.frame for window in reread_windows], KIND_REREAD
+            )
+            if reread is None:
+                break
+            check.merge(reread)
+            reread_windows = check.reread_windows()
+        return check.sample()
+
+    async def serve_reads(self, logger, publish):
+        """
+        Answer the queued register reads, reading whatever the cache does not
+        hold in as few requests as possible.
+        """
+        replies, unanswered, read_windows = take_register_reads(
+            self.read_queue,
+            self.register_cache,
+            logger.logger_sn,
+            self.register_gap_max,
+            self.register_window_max,
+        )
+        await self._publish_replies(publish, replies)
+        if len(read_windows) == 0:
+            return
+        # the cache is filled with whatever is read
+        await self._read_resynchronizing(
+            logger, read_windows, [window.frame for window in read_windows], KIND_READ
+        )
+        await self._publish_replies(publish, answer_register_reads(unanswered, self.register_cache))
+
+    @staticmethod
+    async def _publish_replies(publish, replies):
+        for message in replies:
+            await publish(message)
+            INPROC_QUEUE_DEPTH.labels(queue="mqtt").inc()
+
+    async def _wait(self, logger, delay, publish):
+        """
+        Sleep until the delay has passed or shutdown, making any register
+        reads queued meanwhile for the primary logger.
+        """
+        if logger is not self.primary_logger or self.read_queue is None:
+            await pause(self._shutdown, delay)
+            return
+        deadline = time.monotonic() + delay
+        while not self._shutdown.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            # woken by a queued read, or at shutdown
+            if await pause(self._reads_ready, remaining) and not self._shutdown.is_set():
+                self._reads_ready.clear()
+                await self.serve_reads(logger, publish)
+
+    async def sample_critical(self, logger, tick, publish):
+        logger_data = await self.get_logger_data(logger, critical=True)
+        if logger_data is None:
+            LOGGER_SAMPLES.labels(
+                logger_sn=str(logger.logger_sn), tier="critical", outcome="missing"
+            ).inc()
+            return
+        # straight to load shedding
+        await publish(
+            [
+                EVENT_CRITICAL_SAMPLE,
+                logger.critical_schema.subset(logger_data.keys()).pack(
+                    logger.logger_sn, tick.time_ns, logger_data
+                ),
+            ]
+        )
+        INPROC_QUEUE_DEPTH.labels(queue="mqtt").inc()
+        LOGGER_SAMPLES.labels(
+            logger_sn=str(logger.logger_sn), tier="critical", outcome="sent"
+        ).inc()
+
+    async def _poll(self, logger, send, publish):
+        schedule = SampleSchedule(logger.sample_interval_secs)
+        critical_schedule = None
+        if len(logger.critical_windows) > 0:
+            log.info(
+                f"[{logger.logger_sn}] Reading {len(logger.critical_schema.keys)} critical fields every {logger.critical_interval_secs}s in {len(logger.critical_windows)} requests: "
+                + ", ".join(
+                    f"0x{window.start:04X}+{window.count}"
+                    for window in logger.critical_windows
+                )
+            )
+            critical_schedule = SampleSchedule(logger.critical_interval_secs)
+        while not self._shutdown.is_set():
+            tick = schedule.next_tick()
+            if tick.skipped > 0:
+                log.warning(f"[{logger.logger_sn}] Skipping {tick.skipped} late samples.")
+                LOGGER_SAMPLES.labels(
+                    logger_sn=str(logger.logger_sn), tier="full", outcome="skipped"
+                ).inc(tick.skipped)
+            # the critical tier fills the time until the full scan
+            while critical_schedule is not None and not self._shutdown.is_set():
+                critical_tick = critical_schedule.next_tick()
+                if critical_tick.time_ns >= tick.time_ns:
+                    break
+                await self._wait(logger, critical_tick.monotonic - time.monotonic(), publish)
+                if self._shutdown.is_set():
+                    break
+                await self.sample_critical(logger, critical_tick, publish)
+            await self._wait(logger, tick.monotonic - time.monotonic(), publish)
+            if self._shutdown.is_set():
+                break
+            tries = 0
+            logger_data = None
+            # try within the time budget to get a plausible sample
+            while not self._shutdown.is_set():
+                tries += 1
+                logger_data = await self.get_logger_data(logger)
+                if logger_data is not None:
+                    break
+                if not logger.budget.can_retry(tick, now=time.monotonic()):
+                    break
+                log.warning(
+                    f"[{logger.logger_sn}] Waiting {logger.budget.retry_wait_secs}s after {tries} unsuccessful tries."
+                )
+                await pause(self._shutdown, logger.budget.retry_wait_secs)
+            if logger_data is not None and len(logger_data) > 0:
+                log.debug(
+                    f"[{logger.logger_sn}] Sending {len(logger_data)} fields for publication."
+                )
+                # attributed to the tick so that samples line up
+                await send(
+                    [
+                        EVENT_SAMPLE,
+                        self.sample_schema.subset(logger_data.keys()).pack(
+                            logger.logger_sn, tick.time_ns, logger_data
+                        ),
+                    ]
+                )
+                INPROC_QUEUE_DEPTH.labels(queue="app").inc()
+                LOGGER_SAMPLES.labels(
+                    logger_sn=str(logger.logger_sn), tier="full", outcome="sent"
+                ).inc()
+            else:
+                LOGGER_SAMPLES.labels(
+                    logger_sn=str(logger.logger_sn), tier="full", outcome="missing"
+                ).inc()
+                log.warning(
+                    f"[{logger.logger_sn}] Unable to fetch any valid data after {tries} tries."
+                )
+        logger.connection.close()
+
+    async def _run(self, send, publish, shutdown=None):
+        """
+        Poll every logger, passing each sample to the send coroutine and the
+        critical samples and register replies to the publish coroutine, until
+        shutdown is set, or until the application shuts down if not given.
+        """
+        for logger in self.loggers:
+            log.info(
+                f"Using inverter logger {logger.logger_sn} at address {logger.logger_ip}:{logger.logger_port} every {logger.sample_interval_secs}s."
+            )
+        loop = asyncio.get_running_loop()
+        watchers = []
+        self._shutdown = shutdown
+        if shutdown is None:
+            self._shutdown = asyncio.Event()
+            # woken by die(), as the threads are
+            threading.Thread(
+                target=self._watch_shutdown,
+                args=(loop,),
+                name=f"{self.name}Shutdown",
+                daemon=True,
+            ).start()
+        if self.read_queue is not None:
+            self._reads_ready = asyncio.Event()
+            # reads are queued from the MQTT client, perhaps on another thread
+            self.read_queue.on_submit = lambda: loop.call_soon_threadsafe(self._reads_ready.set)
+            watchers.append(asyncio.create_task(self._wake_on_shutdown()))
+            # for any queued before the loop started
+            self._reads_ready.set()
+        try:
+            # the loggers sample together on the shared wall-clock boundaries
+            await asyncio.gather(
+                *[self._poll(logger=logger, send=send, publish=publish) for logger in self.loggers]
+            )
+        finally:
+            if self.read_queue is not None:
+                self.read_queue.on_submit = None
+            for watcher in watchers:
+                watcher.cancel()
+
+    # noinspection PyBroadException
+    def run(self):
+        with exception_handler(
+            connect_url=URL_WORKER_APP, and_raise=False, shutdown_on_error=True
+        ) as app_socket, exception_handler(
+            connect_url=URL_WORKER_MQTT_PUBLISH, and_raise=False, shutdown_on_error=True
+        ) as mqtt_socket:
+
+            async def send(message):
+                app_socket.send_multipart(message, copy=False)
+
+            async def publish(message):
+                mqtt_socket.send_multipart(message, copy=False)
+
+            asyncio.run(self._run(send=send, publish=publish))
+        if self.capture is not None:
+            self.capture.close()
+
+    async def run_async(self, app_queue, mqtt_queue, stopping):
+        try:
+            await self._run(send=app_queue.put, publish=mqtt_queue.put, shutdown=stopping)
+        finally:
+            for logger in self.loggers:
+                logger.connection.close()
+            if self.capture is not None:
+                self.capture.close()
 
 
 class WeatherReader(AppThread):
@@ -324,28 +1148,64 @@ class WeatherReader(AppThread):
         self.lat, self.lon = tuple(
             app_config.get("weather", "coord_lat_lon").split(",")
         )
+        observation_interval_secs = app_config.getint(
+            "weather",
+            "observation_interval_secs",
+            fallback=DEFAULT_OBSERVATION_INTERVAL_SECS,
+        )
+        self.weather_client = WeatherClient(
+            api_key=self.api_key,
+            observation_interval_secs=observation_interval_secs,
+        )
+        # cloud cover is left out rather than repeated once it is this old
+        self.cloudiness_max_age_secs = observation_interval_secs * 2
+        self.solar_site = SolarSite(self.lat, self.lon)
+        self.observation = None
 
     def get_weather_data(self):
-        output = None
         try:
-            r = requests.get(
-                "https://api.openweathermap.org/data/2.5/weather",
-                params={
-                    "lat": self.lat,
-                    "lon": self.lon,
-                    "appid": self.api_key,
-                },
-            )
-            try:
-                output = json.loads(r.content)
-                log.debug(f"Loaded {len(output)} weather fields.")
-            except JSONDecodeError:
-                log.warning(f"JSON parse error of {r.content}", exc_info=True)
-                return None
-        except (OSError, ConnectionError, RequestException):
+            observation = self.weather_client.get(self.lat, self.lon)
+        except (OSError, ConnectionError, RequestException, KeyError, ValueError):
             log.warning("Problem getting weather data.", exc_info=True)
+            WEATHER_REQUESTS.labels(outcome="error").inc()
             return None
-        return output
+        if observation.new:
+            WEATHER_REQUESTS.labels(outcome="new").inc()
+            log.debug(f"Loaded {len(observation.data)} weather fields.")
+        else:
+            WEATHER_REQUESTS.labels(outcome="unchanged").inc()
+        return observation
+
+    def get_sun_fields(self, timestamp):
+        sun = self.solar_site.position(timestamp)
+        return {
+            "midday_pct": sun.midday_pct,
+            "sun_elevation_deg": sun.elevation_deg,
+            "clear_sky_ghi_wm2": sun.clear_sky_ghi_wm2,
+        }
+
+    def update_observation(self):
+        # the cached observation serves until a newer one is expected
+        if self.weather_client.next_fetch_secs(self.lat, self.lon) > 0:
+            return
+        fetched = self.get_weather_data()
+        if fetched is not None:
+            self.observation = fetched
+            log.debug(f"Received weather data: {self.observation.data}")
+
+    def weather_event(self, tick):
+        sample_time = tick.time_ns / 1e9
+        # the sun is computed locally, so it keeps up while the API is down
+        weather = self.get_sun_fields(sample_time)
+        observation = self.observation
+        if (
+            observation is not None
+            and "clouds" in observation.data
+            and sample_time - observation.dt < self.cloudiness_max_age_secs
+        ):
+            weather["cloudiness_pct"] = observation.data["clouds"]["all"]
+        log.debug(f"Sending {len(weather)} fields for publication: {weather}")
+        return {"weather": weather, EVENT_TIMESTAMP: tick.time_ns}
 
     # noinspection PyBroadException
     def run(self):
@@ -353,40 +1213,50 @@ class WeatherReader(AppThread):
         with exception_handler(
             connect_url=URL_WORKER_APP, and_raise=False, shutdown_on_error=True
         ) as app_socket:
+            schedule = SampleSchedule(DEFAULT_SAMPLE_INTERVAL_SECONDS)
             while not threads.shutting_down:
-                wd = self.get_weather_data()
-                log.debug(f"Received weather data: {wd}")
-                if wd is not None and len(wd) > 0:
-                    weather = dict()
-                    weather["cloudiness_pct"] = wd["clouds"]["all"]
-                    date_value = int(wd["dt"])
-                    sunrise = int(wd["sys"]["sunrise"])
-                    sunset = int(wd["sys"]["sunset"])
-                    sun_output = 0
-                    # calculate theoretical sun output
-                    if date_value > sunrise and date_value < sunset:
-                        # normalize and divide
-                        midday_secs = (sunset - sunrise) / 2
-                        secs_from_dark = min(date_value - sunrise, sunset - date_value)
-                        sun_output = int((secs_from_dark / midday_secs) * 100)
-                        log.debug(
-                            f"Derived {sun_output}% sun output from {sunrise=},{date_value=},{sunset=},{midday_secs=},{secs_from_dark=}"
-                        )
-                    else:
-                        log.debug(
-                            f"Using {sun_output}% sun output from {sunrise=},{date_value=},{sunset=}"
-                        )
-                    country = wd["sys"]["country"]
-                    weather["midday_pct"] = sun_output
-                    log.debug(
-                        f"{country}: Sending {len(weather)} fields for publication: {weather}"
-                    )
-                    app_socket.send_pyobj({"weather": weather})
-                threads.interruptable_sleep.wait(DEFAULT_SAMPLE_INTERVAL_SECONDS)
+                tick = schedule.next_tick()
+                threads.interruptable_sleep.wait(tick.monotonic - time.monotonic())
+                if threads.shutting_down:
+                    break
+                self.update_observation()
+                app_socket.send_pyobj(self.weather_event(tick))
+                INPROC_QUEUE_DEPTH.labels(queue="app").inc()
+        self.weather_client.close()
+
+    async def run_async(self, app_queue, stopping):
+        log.info(f"Fetching weather data using coordinates [{self.lat},{self.lon}].")
+        schedule = SampleSchedule(DEFAULT_SAMPLE_INTERVAL_SECONDS)
+        try:
+            while not stopping.is_set():
+                tick = schedule.next_tick()
+                if await pause(stopping, tick.monotonic - time.monotonic()):
+                    break
+                # the HTTP client blocks
+                await asyncio.to_thread(self.update_observation)
+                await app_queue.put(self.weather_event(tick))
+                INPROC_QUEUE_DEPTH.labels(queue="app").inc()
+        finally:
+            self.weather_client.close()
 
 
 class MqttSubscriber(AppThread, Closable):
-    def __init__(self, mqtt_server_address, mqtt_topic_prefix, mqtt_switch_devices):
+    def __init__(
+        self,
+        mqtt_server_address,
+        mqtt_topic_prefix,
+        mqtt_switch_devices,
+        primary_logger_sn,
+        switch_hysteresis_secs=SWITCH_HYSTERESIS_SECONDS,
+        switch_confirm_timeout_secs=SWITCH_CONFIRM_TIMEOUT_SECONDS,
+        statistics_fields=STATISTICS_FIELDS,
+        statistics_window_secs=STATISTICS_WINDOW_SECONDS,
+        statistics_ewma_halflife_secs=STATISTICS_EWMA_HALFLIFE_SECONDS,
+        register_cache=None,
+        read_queue=None,
+        register_request_topic=REGISTER_REQUEST_TOPIC,
+        field_deadband=None,
+    ):
         AppThread.__init__(self, name=self.__class__.__name__)
         Closable.__init__(self, connect_url=URL_WORKER_MQTT_PUBLISH)
 
@@ -394,12 +1264,35 @@ class MqttSubscriber(AppThread, Closable):
         self._mqtt_server_address = mqtt_server_address
         self._mqtt_subscribe_topic_prefix = mqtt_topic_prefix
         self._mqtt_switch_devices = mqtt_switch_devices
+        # only this logger drives load shedding
+        self._primary_logger_sn = str(primary_logger_sn)
 
         self._disconnected = False
 
         self._switch_state = dict()
+        self._switch_actuator = SwitchActuator(
+            hysteresis_secs=switch_hysteresis_secs,
+            confirm_timeout_secs=switch_confirm_timeout_secs,
+        )
+
+        self._statistics_fields = statistics_fields
+        self._statistics_window_secs = statistics_window_secs
+        self._statistics_ewma_halflife_secs = statistics_ewma_halflife_secs
+        # per logger
+        self._field_stats = dict()
+        self._power_surplus = WindowStats(
+            window_secs=statistics_window_secs,
+            ewma_halflife_secs=statistics_ewma_halflife_secs,
+        )
+        self._prev_switch_state = 0
 
-        self._power_generation_history = deque(maxlen=5)
+        # register reads are answered from the cache, or queued for the reader
+        self._register_cache = register_cache
+        self._read_queue = read_queue
+        self._register_request_topic = register_request_topic
+
+        # publishes changed fields to their own retained topics if set
+        self._field_deadband = field_deadband
 
     def close(self):
         Closable.close(self)
@@ -412,6 +1305,9 @@ class MqttSubscriber(AppThread, Closable):
         subscription_topic = f"{self._mqtt_subscribe_topic_prefix}/state/#"
         log.info(f"Subscribing to topic [{subscription_topic}]...")
         self._mqtt_client.subscribe(subscription_topic)
+        if self._register_cache is not None:
+            log.info(f"Serving register reads on topic [{self._register_request_topic}]...")
+            self._mqtt_client.subscribe(self._register_request_topic)
 
     def on_disconnect(self, client, userdata, rc):
         log.info("MQTT client has disconnected.")
@@ -430,6 +1326,9 @@ class MqttSubscriber(AppThread, Closable):
             return
         except ContextTerminated:
             self.close()
+        if topic == self._register_request_topic and self._register_cache is not None:
+            self.on_register_read(msg_data)
+            return
         if "switches" in msg_data.keys():
             switch_bank = topic.split("/")[2]
             new_state = msg_data["switches"]
@@ -442,13 +1341,82 @@ class MqttSubscriber(AppThread, Closable):
             # state capture
             self._switch_state[switch_bank] = new_state
 
+    def on_register_read(self, request):
+        try:
+            read = parse_register_read(
+                request,
+                default_logger_sn=int(self._primary_logger_sn),
+                ttl_secs=self._register_cache.ttl_secs,
+            )
+        except ValueError as e:
+            REGISTER_READS.labels(outcome="invalid").inc()
+            log.warning(f"Ignoring register read: {e}")
+            return
+        reply_topic = read.reply_to or REGISTER_REPLY_TOPIC
+        cached = self._register_cache.get(
+            read.logger_sn, read.start, read.count, read.max_age_secs
+        )
+        if cached is not None:
+            REGISTER_READS.labels(outcome="cached").inc()
+            self.publish_reply(reply_topic, json.dumps(register_reply(read, *cached, source="cache")))
+            return
+        if self._read_queue is None:
+            reply = register_reply(read, error="Not cached.")
+        elif read.logger_sn != int(self._primary_logger_sn):
+            reply = register_reply(
+                read,
+                error=f"Not cached; on-demand reads are only made from logger {self._primary_logger_sn}.",
+            )
+        elif not self._read_queue.submit(read):
+            reply = register_reply(read, error="Too many reads waiting.")
+        else:
+            # answered by the reader between samples
+            REGISTER_READS.labels(outcome="queued").inc()
+            return
+        REGISTER_READS.labels(outcome="unanswered").inc()
+        self.publish_reply(reply_topic, json.dumps(reply))
+
+    def publish_reply(self, topic, payload):
+        try:
+            self._mqtt_client.publish(topic=topic, payload=payload)
+        except (TypeError, ValueError):
+            # a bad reply topic must not take the MQTT client down with it
+            log.exception(f"Unable to reply to register read on [{topic}].")
+
+    def publish_fields(self, inverter_data):
+        """
+        Publish the fields of a sample that moved beyond their deadband, each
+        retained on inverter/<logger_sn>/<field>.
+        """
+        logger_sn = str(inverter_data.logger_sn)
+        suppressed = self._field_deadband.suppressed
+        changes = self._field_deadband.changes(
+            logger_sn, inverter_data, now=inverter_data.timestamp_ns / 1e9
+        )
+        for field, value in changes:
+            self._mqtt_client.publish(
+                topic=f"inverter/{logger_sn}/{field}", payload=json.dumps(value), retain=True
+            )
+        MQTT_FIELD_UPDATES.labels(outcome="published").inc(len(changes))
+        MQTT_FIELD_UPDATES.labels(outcome="suppressed").inc(
+            self._field_deadband.suppressed - suppressed
+        )
+
     def set_switch_state(self, switch_state=1):
+        now = time.monotonic()
         for switch_bank in self._switch_state.keys():
             if switch_bank not in self._mqtt_switch_devices:
                 log.warning(
                     f"Not changing state for {switch_bank} due to missing configuration."
                 )
                 continue
+            if not self._switch_actuator.should_command(
+                switch_bank=switch_bank,
+                confirmed_state=self._switch_state[switch_bank],
+                switch_state=switch_state,
+                now=now,
+            ):
+                continue
             mqtt_pub_topic = "/".join(
                 [f"{self._mqtt_subscribe_topic_prefix}", "control", switch_bank]
             )
@@ -460,118 +1428,273 @@ class MqttSubscriber(AppThread, Closable):
                 f"[{mqtt_pub_topic}] Publishing {len(message_data)} bytes: [{message_data}]"
             )
             self._mqtt_client.publish(topic=mqtt_pub_topic, payload=message_data)
+            self._switch_actuator.commanded(switch_bank, switch_state, now)
 
-    def get_power_generation_avg(self, value):
-        self._power_generation_history.append(value)
-        total = 0
-        for sample in self._power_generation_history:
-            total += sample
-        return total / len(self._power_generation_history)
+    def update_statistics(self, inverter_data):
+        """
+        Fold a full sample into the window statistics of its logger, returning
+        the smoothed values as fields for publication.
+        """
+        logger_sn = str(inverter_data.logger_sn)
+        field_stats = self._field_stats.get(logger_sn)
+        if field_stats is None:
+            field_stats = FieldStats(
+                fields=self._statistics_fields,
+                window_secs=self._statistics_window_secs,
+                ewma_halflife_secs=self._statistics_ewma_halflife_secs,
+            )
+            self._field_stats[logger_sn] = field_stats
+        # windowed by sample time, so that missed samples leave a gap
+        field_stats.update(inverter_data, now=inverter_data.timestamp_ns / 1e9)
+        for field, snapshot in field_stats.snapshot().items():
+            observe_statistics(logger_sn, field, snapshot)
+        return field_stats.smoothed()
 
-    # noinspection PyBroadException
-    def run(self):
+    def shed_load(self, inverter_data, critical=False):
+        """
+        Decide the switch state from a sample of the primary logger, returning
+        the decision stats or None when the sample cannot be judged.
+        """
+        switch_stats = dict()
+        # check for required fields, which may have been dropped as implausible
+        if not all(
+            field in inverter_data
+            for field in [
+                "alert",
+                "battery_power_w",
+                "battery_soc_pct",
+                "pv1_power_w",
+                "pv2_power_w",
+                "grid_voltage_l1_v",
+                "grid_voltage_l2_v",
+                "inverter_l1_power_w",
+                "inverter_l2_power_w",
+            ]
+        ):
+            return None
+        switch_state = 1
+        switch_stats["surplus_ration"] = 0
+        switch_stats["battery_ration"] = 0
+        if int(inverter_data["alert"]) == 1:
+            # do not load shed during an alert condition
+            self.set_switch_state()
+            return None
+        # check 1: calculate surplus as a function of PV reported *usage* and how much the batteries are supplying
+        pv1_power_w = float(inverter_data["pv1_power_w"])
+        pv2_power_w = float(inverter_data["pv2_power_w"])
+        battery_power_w = float(inverter_data["battery_power_w"])
+        sampled_at = inverter_data.timestamp_ns / 1e9
+        self._power_surplus.expire(now=sampled_at)
+        # the average is smoothed over full samples unless they have dried up
+        if not critical or self._power_surplus.count == 0:
+            self._power_surplus.update(
+                pv1_power_w + pv2_power_w - battery_power_w, now=sampled_at
+            )
+            observe_statistics(
+                self._primary_logger_sn, "power_surplus_w", self._power_surplus.snapshot()
+            )
+        power_generation_w_avg = self._power_surplus.mean
+        # disable switch if battery is critically low without adequate surplus (i.e. not charging from solar)
+        battery_soc_pct = inverter_data["battery_soc_pct"]
+        if (
+            battery_soc_pct < BATTERY_CRITICAL_PCT
+            and power_generation_w_avg < 0
+        ):
+            switch_state = 0
+            switch_stats["surplus_ration"] = 1
+        # check 2: determine battery state of charge and whether there is any grid fallback
+        grid_voltage_l1_v = float(inverter_data["grid_voltage_l1_v"])
+        grid_voltage_l2_v = float(inverter_data["grid_voltage_l2_v"])
+        grid_voltage = max(grid_voltage_l1_v, grid_voltage_l2_v)
+        # more conservative rationing if there is no grid backup (draw assumes no surplus)
+        if (
+            battery_soc_pct < BATTERY_LOW_PCT
+            and grid_voltage < 90
+            and battery_power_w >= BATTERY_MAJOR_DRAW_W
+        ):
+            switch_state = 0
+            switch_stats["battery_ration"] = 1
+        # check 3: determine whether the inverter is no longer pulling from solar or battery (i.e. from grid)
+        inverter_l1_power_w = float(inverter_data["inverter_l1_power_w"])
+        inverter_l2_power_w = float(inverter_data["inverter_l2_power_w"])
+        # can't use min/max because l2 is normally 0
+        inverter_power_w = inverter_l1_power_w + inverter_l2_power_w
+        if inverter_power_w < 0:
+            switch_state = 0
+            switch_stats["battery_ration"] = 1
+        # log the supporting data
+        log_msg = (
+            f"Inverter is delivering {inverter_power_w}w to consumers from backup (solar/battery). "
+            f"Power surplus average is {power_generation_w_avg:.2f}w ({pv1_power_w=:.2f}w, {pv2_power_w=:.2f}w, {battery_power_w=:.2f}w). "
+            f"Battery discharge {battery_power_w}w with remaining charge of {battery_soc_pct}% and supporting grid voltage of {grid_voltage}v. "
+            f"Updating switch banks to [{switch_state}]."
+        )
+        if self._prev_switch_state != switch_state:
+            log.info(log_msg)
+        elif log.level == logging.DEBUG:
+            log.debug(log_msg)
+        # update switches
+        self.set_switch_state(switch_state=switch_state)
+        self._prev_switch_state = switch_state
+        switch_stats["switch_state"] = switch_state
+        return switch_stats
+
+    def handle(self, message):
+        """
+        Publish the parts of a message relayed by the EventProcessor, returning
+        the switch stats event of a load shedding decision, if any.
+        """
+        if len(message) == 3 and message[0] == EVENT_ENERGY:
+            # retained, so that dashboards see the totals as they subscribe
+            self._mqtt_client.publish(
+                topic=f"inverter/{bytes(message[1]).decode()}/energy",
+                payload=bytes(message[2]),
+                retain=True,
+            )
+            return None
+        if len(message) == 3 and message[0] == EVENT_REGISTERS:
+            self.publish_reply(bytes(message[1]).decode(), bytes(message[2]))
+            return None
+        if len(message) != 2 or message[0] not in (
+            EVENT_SAMPLE,
+            EVENT_CRITICAL_SAMPLE,
+        ):
+            return None
+        # fields are decoded as the checks below read them
+        inverter_data = SampleRecord(message[1])
+        logger_sn = str(inverter_data.logger_sn)
+        # critical samples only feed load shedding
+        critical = message[0] == EVENT_CRITICAL_SAMPLE
+        if self._field_deadband is not None:
+            # critical samples keep the fields they read current
+            self.publish_fields(inverter_data)
+        if not critical:
+            inverter_state = inverter_data.to_dict()
+            # smoothed values alongside the raw ones
+            inverter_state.update(self.update_statistics(inverter_data))
+            inverter_state = json.dumps(inverter_state)
+            # per-logger state for fleet consumers
+            with MQTT_PUBLISH_SECONDS.labels(logger_sn=logger_sn).time():
+                self._mqtt_client.publish(
+                    topic=f"inverter/{logger_sn}/state", payload=inverter_state
+                )
+        if logger_sn != self._primary_logger_sn:
+            return None
+        switch_stats = self.shed_load(inverter_data, critical=critical)
+        if critical or switch_stats is None:
+            return None
+        # for other interested consumers
+        with MQTT_PUBLISH_SECONDS.labels(logger_sn=logger_sn).time():
+            self._mqtt_client.publish(topic="inverter/state", payload=inverter_state)
+        # post stats
+        switch_stats["commands_sent"] = self._switch_actuator.commands_sent
+        switch_stats["commands_suppressed"] = self._switch_actuator.commands_suppressed
+        return {"switches": switch_stats, EVENT_TIMESTAMP: time.time_ns()}
+
+    def _connect(self):
         log.info(f"Connecting to MQTT server {self._mqtt_server_address}...")
         self._mqtt_client = mqtt.Client()
         self._mqtt_client.on_connect = self.on_connect
         self._mqtt_client.on_disconnect = self.on_disconnect
         self._mqtt_client.on_message = self.on_message
         self._mqtt_client.connect(self._mqtt_server_address)
+
+    def _check_connection(self, rc):
+        if rc == MQTT_ERR_NO_CONN or self._disconnected:
+            raise ResourceWarning(
+                f"No connection to MQTT broker at {self._mqtt_server_address} (disconnected? {self._disconnected})"
+            )
+
+    # noinspection PyBroadException
+    def run(self):
+        self._connect()
         my_socket = self.get_socket()
+        # plain sockets are polled, and reported ready, by descriptor
+        mqtt_socket = self._mqtt_client.socket().fileno()
+        # sleep until either the broker or the event processor has work
+        poller = zmq.Poller()
+        poller.register(my_socket, zmq.POLLIN)
+        poller.register(mqtt_socket, zmq.POLLIN)
         with exception_handler(
             connect_url=URL_WORKER_APP, and_raise=False, shutdown_on_error=True
         ) as app_socket:
-            prev_switch_state = 0
             while not threads.shutting_down:
-                switch_stats = dict()
-                rc = self._mqtt_client.loop()
-                if rc == MQTT_ERR_NO_CONN or self._disconnected:
-                    raise ResourceWarning(
-                        f"No connection to MQTT broker at {self._mqtt_server_address} (disconnected? {self._disconnected})"
-                    )
-                inverter_data = None
+                mqtt_flags = zmq.POLLIN
+                if self._mqtt_client.want_write():
+                    mqtt_flags |= zmq.POLLOUT
+                poller.modify(mqtt_socket, mqtt_flags)
+                ready = dict(poller.poll(timeout=MQTT_POLL_INTERVAL_MS))
+                rc = MQTT_ERR_SUCCESS
+                if ready.get(mqtt_socket, 0) & zmq.POLLIN:
+                    rc = self._mqtt_client.loop_read()
+                if rc == MQTT_ERR_SUCCESS and ready.get(mqtt_socket, 0) & zmq.POLLOUT:
+                    rc = self._mqtt_client.loop_write()
+                if rc == MQTT_ERR_SUCCESS:
+                    # keepalive
+                    rc = self._mqtt_client.loop_misc()
+                self._check_connection(rc)
                 # check for messages to publish
-                try:
-                    inverter_data = my_socket.recv_pyobj(flags=zmq.NOBLOCK)
-                except ZMQError:
-                    # ignore, no data
-                    continue
-                if not isinstance(inverter_data, dict):
+                if not ready.get(my_socket, 0) & zmq.POLLIN:
                     continue
-                # check for required fields
-                if not all(
-                    field in inverter_data.keys()
-                    for field in [
-                        "alert",
-                        "battery_power_w",
-                        "pv1_power_w",
-                        "pv2_power_w",
-                    ]
-                ):
+                frames = my_socket.recv_multipart(copy=False)
+                INPROC_QUEUE_DEPTH.labels(queue="mqtt").dec()
+                switch_event = self.handle([frame.buffer for frame in frames])
+                if switch_event is not None:
+                    app_socket.send_pyobj(switch_event)
+                    INPROC_QUEUE_DEPTH.labels(queue="app").inc()
+        self.close()
+
+    async def run_async(self, mqtt_queue, app_queue, stopping):
+        await asyncio.to_thread(self._connect)
+        loop = asyncio.get_running_loop()
+        # by descriptor, which outlives the socket closed on disconnection
+        mqtt_socket = self._mqtt_client.socket().fileno()
+        # the broker's replies are read as they arrive, and anything published
+        # is written as soon as the socket allows
+        failures = []
+
+        def pump(read):
+            rc = MQTT_ERR_SUCCESS
+            if read:
+                rc = self._mqtt_client.loop_read()
+            if rc == MQTT_ERR_SUCCESS and self._mqtt_client.want_write():
+                rc = self._mqtt_client.loop_write()
+            if rc != MQTT_ERR_SUCCESS:
+                failures.append(rc)
+            if self._mqtt_client.want_write():
+                loop.add_writer(mqtt_socket, pump, False)
+            else:
+                loop.remove_writer(mqtt_socket)
+
+        loop.add_reader(mqtt_socket, pump, True)
+        try:
+            while not stopping.is_set():
+                self._check_connection(failures[-1] if failures else MQTT_ERR_SUCCESS)
+                try:
+                    message = await asyncio.wait_for(
+                        mqtt_queue.get(), timeout=MQTT_POLL_INTERVAL_MS / 1000
+                    )
+                except TimeoutError:
+                    message = None
+                # keepalive
+                self._check_connection(self._mqtt_client.loop_misc())
+                if message is None:
                     continue
-                switch_state = 1
-                switch_stats["surplus_ration"] = 0
-                switch_stats["battery_ration"] = 0
-                if int(inverter_data["alert"]) == 1:
-                    # do not load shed during an alert condition
-                    self.set_switch_state()
+                INPROC_QUEUE_DEPTH.labels(queue="mqtt").dec()
+                switch_event = self.handle(message)
+                pump(False)
+                if switch_event is None:
                     continue
-                # check 1: calculate surplus as a function of PV reported *usage* and how much the batteries are supplying
-                pv1_power_w = float(inverter_data["pv1_power_w"])
-                pv2_power_w = float(inverter_data["pv2_power_w"])
-                battery_power_w = float(inverter_data["battery_power_w"])
-                power_generation_w_avg = self.get_power_generation_avg(
-                    value=pv1_power_w + pv2_power_w - battery_power_w
-                )
-                # disable switch if battery is critically low without adequate surplus (i.e. not charging from solar)
-                battery_soc_pct = inverter_data["battery_soc_pct"]
-                if (
-                    battery_soc_pct < BATTERY_CRITICAL_PCT
-                    and power_generation_w_avg < 0
-                ):
-                    switch_state = 0
-                    switch_stats["surplus_ration"] = 1
-                # check 2: determine battery state of charge and whether there is any grid fallback
-                grid_voltage_l1_v = float(inverter_data["grid_voltage_l1_v"])
-                grid_voltage_l2_v = float(inverter_data["grid_voltage_l2_v"])
-                grid_voltage = max(grid_voltage_l1_v, grid_voltage_l2_v)
-                # more conservative rationing if there is no grid backup (draw assumes no surplus)
-                if (
-                    battery_soc_pct < BATTERY_LOW_PCT
-                    and grid_voltage < 90
-                    and battery_power_w >= BATTERY_MAJOR_DRAW_W
-                ):
-                    switch_state = 0
-                    switch_stats["battery_ration"] = 1
-                # check 3: determine whether the inverter is no longer pulling from solar or battery (i.e. from grid)
-                inverter_l1_power_w = float(inverter_data["inverter_l1_power_w"])
-                inverter_l2_power_w = float(inverter_data["inverter_l2_power_w"])
-                # can't use min/max because l2 is normally 0
-                inverter_power_w = inverter_l1_power_w + inverter_l2_power_w
-                if inverter_power_w < 0:
-                    switch_state = 0
-                    switch_stats["battery_ration"] = 1
-                # log the supporting data
-                log_msg = (
-                    f"Inverter is delivering {inverter_power_w}w to consumers from backup (solar/battery). "
-                    f"Power surplus average is {power_generation_w_avg:.2f}w ({pv1_power_w=:.2f}w, {pv2_power_w=:.2f}w, {battery_power_w=:.2f}w). "
-                    f"Battery discharge {battery_power_w}w with remaining charge of {battery_soc_pct}% and supporting grid voltage of {grid_voltage}v. "
-                    f"Updating switch banks to [{switch_state}]."
-                )
-                if prev_switch_state != switch_state:
-                    log.info(log_msg)
-                elif log.level == logging.DEBUG:
-                    log.debug(log_msg)
-                # update switches
-                self.set_switch_state(switch_state=switch_state)
-                prev_switch_state = switch_state
-                # post stats
-                switch_stats["switch_state"] = switch_state
-                app_socket.send_pyobj({"switches": switch_stats})
-                # for other interested consumers
-                self._mqtt_client.publish(
-                    topic="inverter/state", payload=json.dumps(inverter_data)
-                )
-        self.close()
+                try:
+                    # dropped rather than awaited so that the queues never wait on each other
+                    app_queue.put_nowait(switch_event)
+                    INPROC_QUEUE_DEPTH.labels(queue="app").inc()
+                except asyncio.QueueFull:
+                    RUNTIME_QUEUE_DROPS.labels(queue="app").inc()
+        finally:
+            loop.remove_reader(mqtt_socket)
+            loop.remove_writer(mqtt_socket)
+            self.close()
 
 
 class EventProcessor(AppThread, Closable):
@@ -584,27 +1707,162 @@ class EventProcessor(AppThread, Closable):
         self.influxdb = None
         self.influxdb_rw = None
         self.influxdb_ro = None
+        # points are spooled to disk while InfluxDB is unreachable
+        self.influxdb_spool = None
+        self.influxdb_spool_rw = None
+        self.influxdb_healthy = True
+        self.spool_replay_lines_per_sec = app_config.getint(
+            "influxdb",
+            "spool_replay_lines_per_sec",
+            fallback=INFLUXDB_SPOOL_REPLAY_LINES_PER_SEC,
+        )
+        self.influxdb_batch_size = app_config.getint(
+            "influxdb", "batch_size", fallback=INFLUXDB_BATCH_SIZE
+        )
+        self.spool_replay_allowance = 0
+        self.spool_replayed_at = time.monotonic()
+        self.spool_probe_at = 0
+        # running kWh totals of the power fields, saved across restarts
+        self.energy = EnergyIntegrator(
+            state_path=app_config.get("energy", "state_path", fallback=ENERGY_STATE_PATH),
+            gap_max_secs=app_config.getint(
+                "energy", "gap_max_secs", fallback=DEFAULT_GAP_MAX_SECS
+            ),
+        )
+        self.energy_persist_interval_secs = app_config.getint(
+            "energy", "persist_interval_secs", fallback=ENERGY_PERSIST_INTERVAL_SECS
+        )
+        self.energy_saved_at = time.monotonic()
+        # recent history of every field, served next to the metrics
+        tiers_csv = app_config.get("history", "tiers_csv", fallback="")
+        self.history = HistoryStore(
+            raw_points=app_config.getint(
+                "history", "raw_points", fallback=DEFAULT_RAW_POINTS
+            ),
+            tiers=parse_tiers(tiers_csv) if len(tiers_csv) > 0 else DEFAULT_TIERS,
+        )
+        # created as fields are first seen
+        self.gauges = dict()
+
+    @staticmethod
+    def _observe_write_delay(lines):
+        now_ns = time.time_ns()
+        for line in lines:
+            # the measurement leads and the timestamp trails each line
+            INFLUXDB_WRITE_DELAY_SECONDS.labels(point=line.split(",", 1)[0]).observe(
+                (now_ns - int(line.rsplit(" ", 1)[1])) / 1e9
+            )
+
+    def _influxdb_batch_written(self, conf, data):
+        self._observe_write_delay(data.decode().splitlines())
+        if not self.influxdb_healthy:
+            log.info("InfluxDB is accepting writes again.")
+        self.influxdb_healthy = True
+
+    def _influxdb_batch_failed(self, conf, data, exception):
+        # called from the write API's own thread once its retries are spent
+        self.influxdb_healthy = False
+        INFLUXDB_WRITE_FAILURES.labels(stage="batch").inc()
+        lines = data.decode().splitlines()
+        log.warning(f"Spooling {len(lines)} points that InfluxDB did not accept: {exception!s}")
+        self.influxdb_spool.append(lines)
+        INFLUXDB_SPOOLED_POINTS.inc(len(lines))
+
+    def _replay_spool(self):
+        now = time.monotonic()
+        self.spool_replay_allowance = min(
+            self.influxdb_batch_size,
+            self.spool_replay_allowance
+            + (now - self.spool_replayed_at) * self.spool_replay_lines_per_sec,
+        )
+        self.spool_replayed_at = now
+        if not self.influxdb_spool.pending:
+            return
+        if not self.influxdb_healthy and now < self.spool_probe_at:
+            return
+        lines, position = self.influxdb_spool.read(int(self.spool_replay_allowance))
+        if len(lines) == 0:
+            self.influxdb_spool.commit(position)
+            return
+        try:
+            self.influxdb_spool_rw.write(bucket=self.influxdb_bucket, record="\n".join(lines))
+        except Exception as e:
+            if isinstance(e, ApiException) and e.status in INFLUXDB_REJECTED_STATUSES:
+                # retrying points that InfluxDB rejects would stall the spool
+                log.error(f"Discarding {len(lines)} spooled points rejected by InfluxDB: {e!s}")
+                INFLUXDB_WRITE_FAILURES.labels(stage="rejected").inc()
+                self.influxdb_spool.commit(position)
+                return
+            self.influxdb_healthy = False
+            INFLUXDB_WRITE_FAILURES.labels(stage="replay").inc()
+            self.spool_probe_at = now + INFLUXDB_SPOOL_PROBE_INTERVAL_SECS
+            if isinstance(e, ApiException) and e.status in range(400, 500):
+                # e.g. an expired token or a missing bucket, kept until fixed
+                log.error(f"Keeping spooled points that InfluxDB refuses to accept: {e!s}")
+            else:
+                log.warning(f"Unable to replay spooled points to InfluxDB: {e!s}")
+            return
+        self.influxdb_spool.commit(position)
+        self._observe_write_delay(lines)
+        self.spool_replay_allowance -= len(lines)
+        if not self.influxdb_healthy:
+            log.info("InfluxDB is accepting writes again.")
+        self.influxdb_healthy = True
+        if not self.influxdb_spool.pending:
+            log.info("Replayed all spooled points to InfluxDB.")
+
+    def _save_energy(self):
+        try:
+            self.energy.save()
+        except OSError:
+            log.warning("Unable to save the energy totals.", exc_info=True)
+        self.energy_saved_at = time.monotonic()
+
+    def _integrate_energy(self, sample):
+        logger_sn = str(sample.logger_sn)
+        for field, positive_kwh, negative_kwh in self.energy.update(
+            logger_sn, sample.timestamp_ns, sample
+        ):
+            if positive_kwh > 0:
+                ENERGY_KWH.labels(
+                    logger_sn=logger_sn, field=field, direction="positive"
+                ).inc(positive_kwh)
+            if negative_kwh > 0:
+                ENERGY_KWH.labels(
+                    logger_sn=logger_sn, field=field, direction="negative"
+                ).inc(negative_kwh)
+        if time.monotonic() - self.energy_saved_at >= self.energy_persist_interval_secs:
+            self._save_energy()
+        return self.energy.totals(logger_sn)
 
-    def _influxdb_write(self, point_name, field_name, field_value):
+    def _influxdb_write(self, point_name, fields, tags, timestamp_ns):
         if is_flag_enabled("local-influxdb"):
             try:
-                self.influxdb_rw.write(
-                    bucket=self.influxdb_bucket,
-                    record=Point(point_name)
+                # one multi-field point per event, batched by the write API
+                point = (
+                    Point(point_name)
                     .tag("application", APP_NAME)
                     .tag("device", DEVICE_NAME_BASE)
-                    .field(field_name, field_value),
+                    .time(timestamp_ns, WritePrecision.NS)
                 )
+                for tag_name, tag_value in tags.items():
+                    point.tag(tag_name, tag_value)
+                for field_name, field_value in fields.items():
+                    point.field(field_name, field_value)
+                if self.influxdb_healthy:
+                    self.influxdb_rw.write(bucket=self.influxdb_bucket, record=point)
+                else:
+                    # keep memory flat until the sink recovers
+                    self.influxdb_spool.append([point.to_line_protocol()])
+                    INFLUXDB_SPOOLED_POINTS.inc()
             except Exception:
                 log.warning("Unable to post to InfluxDB.", exc_info=True)
         else:
             log.debug(
-                f'Not writing {point_name}.{field_name}={field_value} InfluxDB due to feature flag "local-influxdb" being disabled.'
+                f'Not writing {len(fields)} {point_name} fields to InfluxDB due to feature flag "local-influxdb" being disabled.'
             )
 
-    # noinspection PyBroadException
-    def run(self):
-        # influx DB
+    def open_sinks(self):
         influxdb_url = creds.get_creds("InfluxDB/local/url")
         log.info(
             f"Connecting to InfluxDB at {influxdb_url} using bucket {self.influxdb_bucket}."
@@ -614,35 +1872,271 @@ class EventProcessor(AppThread, Closable):
                 url=influxdb_url,
                 token=creds.get_creds("InfluxDB/local/token"),
                 org=creds.get_creds("InfluxDB/local/org"),
+                enable_gzip=True,
             )
-            self.influxdb_rw = self.influxdb.write_api(write_options=ASYNCHRONOUS)
+            # batches are flushed by the client's background writer
+            self.influxdb_rw = self.influxdb.write_api(
+                write_options=WriteOptions(
+                    batch_size=self.influxdb_batch_size,
+                    flush_interval=app_config.getint(
+                        "influxdb",
+                        "flush_interval_ms",
+                        fallback=INFLUXDB_FLUSH_INTERVAL_MS,
+                    ),
+                    jitter_interval=0,
+                ),
+                success_callback=self._influxdb_batch_written,
+                error_callback=self._influxdb_batch_failed,
+            )
+            self.influxdb_spool_rw = self.influxdb.write_api(write_options=SYNCHRONOUS)
+            self.influxdb_spool = LineSpool(
+                spool_dir=app_config.get("influxdb", "spool_dir", fallback=INFLUXDB_SPOOL_DIR),
+                segment_bytes=app_config.getint(
+                    "influxdb", "spool_segment_bytes", fallback=INFLUXDB_SPOOL_SEGMENT_BYTES
+                ),
+                max_bytes=app_config.getint(
+                    "influxdb", "spool_max_bytes", fallback=INFLUXDB_SPOOL_MAX_BYTES
+                ),
+            )
+            if self.influxdb_spool.pending:
+                log.info(
+                    f"Replaying {self.influxdb_spool.size_bytes} bytes of spooled points to InfluxDB."
+                )
             self.influxdb_ro = self.influxdb.query_api()
+        try:
+            if self.energy.load():
+                log.info(f"Resuming energy totals from {self.energy.state_path}.")
+        except (OSError, ValueError):
+            log.warning(
+                f"Starting energy totals afresh; unable to load {self.energy.state_path}.",
+                exc_info=True,
+            )
+
+    def close_sinks(self):
+        self._save_energy()
+        if self.influxdb is not None:
+            # flush pending batches, spooling any that fail
+            self.influxdb_rw.close()
+            self.influxdb_spool_rw.close()
+            self.influxdb.close()
+            self.influxdb_spool.close()
+            if self.influxdb_spool.dropped_bytes > 0:
+                log.warning(
+                    f"Dropped {self.influxdb_spool.dropped_bytes} bytes of the oldest spooled points beyond the spool size cap."
+                )
+
+    def process(self, message):
+        """
+        Record an event, given either as the parts of a sample message or as
+        an event dict, returning the messages to relay to the MqttSubscriber.
+        """
+        relay = []
+        sample = None
+        if isinstance(message, dict):
+            event = message
+        elif len(message) == 2 and message[0] == EVENT_SAMPLE:
+            sample = SampleRecord(message[1])
+            EVENT_DELAY_SECONDS.labels(logger_sn=str(sample.logger_sn)).observe(
+                (time.time_ns() - sample.timestamp_ns) / 1e9
+            )
+            event = {
+                "inverter": sample.to_dict(),
+                EVENT_TAGS: {"logger_sn": str(sample.logger_sn)},
+                EVENT_TIMESTAMP: sample.timestamp_ns,
+            }
+            energy = self._integrate_energy(sample)
+            if len(energy) > 0:
+                event["energy"] = energy
+        else:
+            event = pickle.loads(message[0])
+        log.debug(event)
+        if isinstance(event, dict):
+            tags = event.pop(EVENT_TAGS, {})
+            timestamp_ns = event.pop(EVENT_TIMESTAMP, None)
+            if timestamp_ns is None:
+                timestamp_ns = time.time_ns()
+            for point_name in list(event):
+                point_items = event[point_name]
+                self._influxdb_write(point_name, point_items, tags, timestamp_ns)
+                self.history.record(point_name, point_items, tags, timestamp_ns)
+                for key, value in point_items.items():
+                    if key not in self.gauges:
+                        gauge_name = key
+                        if not gauge_name.startswith(point_name):
+                            gauge_name = f"{point_name}_{key}"
+                        self.gauges[key] = Gauge(
+                            name=gauge_name,
+                            documentation=f"{point_name} {key}",
+                            labelnames=sorted(tags))
+                    if len(tags) > 0:
+                        self.gauges[key].labels(**tags).set(value)
+                    else:
+                        self.gauges[key].set(value)
+                log.debug(f"Wrote {len(point_items)} {point_name} points.")
+        if sample is not None:
+            # relay the packed sample as received
+            relay.append(message)
+            if len(energy) > 0:
+                relay.append(
+                    [
+                        EVENT_ENERGY,
+                        str(sample.logger_sn).encode(),
+                        json.dumps(energy).encode(),
+                    ]
+                )
+        return relay
+
+    # noinspection PyBroadException
+    def run(self):
+        self.open_sinks()
         my_socket = self.get_socket()
-        gauges = {}
         with exception_handler(
             connect_url=URL_WORKER_MQTT_PUBLISH, and_raise=False, shutdown_on_error=True
         ) as mqtt_socket:
             while not threads.shutting_down:
-                event = my_socket.recv_pyobj()
-                log.debug(event)
-                if isinstance(event, dict):
-                    for point_name in list(event):
-                        point_items = event[point_name]
-                        for key, value in point_items.items():
-                            self._influxdb_write(point_name, key, value)
-                            if key not in gauges:
-                                gauge_name = key
-                                if not gauge_name.startswith(point_name):
-                                    gauge_name = f"{point_name}_{key}"
-                                gauges[key] = Gauge(
-                                    name=gauge_name,
-                                    documentation=f"{point_name} {key}")
-                            gauges[key].set(value)
-                        log.debug(f"Wrote {len(point_items)} {point_name} points.")
-                        if point_name == "inverter":
-                            mqtt_socket.send_pyobj(point_items)
+                if self.influxdb_spool is not None:
+                    self._replay_spool()
+                if my_socket.poll(timeout=EVENT_POLL_INTERVAL_MS) == 0:
+                    continue
+                frames = my_socket.recv_multipart(copy=False)
+                INPROC_QUEUE_DEPTH.labels(queue="app").dec()
+                for relay in self.process([frame.buffer for frame in frames]):
+                    mqtt_socket.send_multipart(relay, copy=False)
+                    INPROC_QUEUE_DEPTH.labels(queue="mqtt").inc()
+        self.close_sinks()
         self.close()
 
+    async def run_async(self, app_queue, mqtt_queue, stopping):
+        await asyncio.to_thread(self.open_sinks)
+        try:
+            while not stopping.is_set():
+                if self.influxdb_spool is not None and self.influxdb_spool.pending:
+                    # the replay writes synchronously
+                    await asyncio.to_thread(self._replay_spool)
+                try:
+                    message = await asyncio.wait_for(
+                        app_queue.get(), timeout=EVENT_POLL_INTERVAL_MS / 1000
+                    )
+                except TimeoutError:
+                    continue
+                INPROC_QUEUE_DEPTH.labels(queue="app").dec()
+                for relay in self.process(message):
+                    await mqtt_queue.put(relay)
+                    INPROC_QUEUE_DEPTH.labels(queue="mqtt").inc()
+        finally:
+            await asyncio.to_thread(self.close_sinks)
+
+
+class AsyncRuntime(AppThread):
+    """
+    Runs the logger, weather, MQTT and event processing work as coroutines
+    on a single event loop, passing messages over bounded in-memory queues
+    instead of inproc ZeroMQ sockets. As with their threads, the failure of
+    any of them shuts the application down, and on shutdown each finishes
+    the work in hand and cleans up.
+    """
+
+    def __init__(
+        self,
+        logger_reader,
+        weather_reader,
+        mqtt_subscriber,
+        event_processor,
+        queue_size=RUNTIME_QUEUE_SIZE,
+        shutdown_grace_secs=RUNTIME_SHUTDOWN_GRACE_SECONDS,
+    ):
+        AppThread.__init__(self, name=self.__class__.__name__)
+        self.logger_reader = logger_reader
+        self.weather_reader = weather_reader
+        self.mqtt_subscriber = mqtt_subscriber
+        self.event_processor = event_processor
+        # run here rather than on threads of their own
+        for component in (logger_reader, weather_reader, mqtt_subscriber, event_processor):
+            component.untrack()
+        self.queue_size = queue_size
+        self.shutdown_grace_secs = shutdown_grace_secs
+
+    @staticmethod
+    def _failed(task):
+        if threads.shutting_down:
+            return
+        exception = None if task.cancelled() else task.exception()
+        if exception is None:
+            exception = ResourceWarning(f"{task.get_name()} has stopped.")
+        if isinstance(exception, ResourceWarning):
+            log.warning(f"{task.get_name()}: {exception!s}")
+        else:
+            log.error(task.get_name(), exc_info=exception)
+            sentry_sdk.capture_exception(exception)
+        die(exception=exception)
+
+    async def _supervise(self):
+        stopping = asyncio.Event()
+        # samples and events for the EventProcessor, and what it relays to MQTT
+        app_queue = asyncio.Queue(maxsize=self.queue_size)
+        mqtt_queue = asyncio.Queue(maxsize=self.queue_size)
+        tasks = [
+            asyncio.create_task(
+                self.event_processor.run_async(app_queue, mqtt_queue, stopping),
+                name=self.event_processor.name,
+            ),
+            asyncio.create_task(
+                self.logger_reader.run_async(app_queue, mqtt_queue, stopping),
+                name=self.logger_reader.name,
+            ),
+            asyncio.create_task(
+                self.weather_reader.run_async(app_queue, stopping),
+                name=self.weather_reader.name,
+            ),
+            asyncio.create_task(
+                self.mqtt_subscriber.run_async(mqtt_queue, app_queue, stopping),
+                name=self.mqtt_subscriber.name,
+            ),
+        ]
+        # woken from any thread by die(), as the threads are
+        shutdown = asyncio.ensure_future(asyncio.to_thread(threads.interruptable_sleep.wait))
+        done, _ = await asyncio.wait([shutdown, *tasks], return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            if task is not shutdown:
+                self._failed(task)
+        stopping.set()
+        _, pending = await asyncio.wait(tasks, timeout=self.shutdown_grace_secs)
+        for task in pending:
+            log.warning(f"Cancelling {task.get_name()} after {self.shutdown_grace_secs}s.")
+            task.cancel()
+        for task, result in zip(
+            tasks, await asyncio.gather(*tasks, return_exceptions=True)
+        ):
+            if isinstance(result, Exception):
+                log.debug(f"{task.get_name()} stopped with {result!r}.")
+        await shutdown
+
+    def run(self):
+        log.info(f"Running {APP_NAME} on a single event loop.")
+        asyncio.run(self._supervise())
+
+
+def parse_logger_fleet(fleet_csv, default_port, default_interval_secs):
+    """
+    Parse fleet entries of the form serial@address[:port][/interval_secs].
+    """
+    logger_fleet = []
+    for entry in fleet_csv.split(","):
+        entry = entry.strip()
+        if len(entry) == 0:
+            continue
+        logger_sn, logger_ip = entry.split("@", 1)
+        sample_interval_secs = default_interval_secs
+        if "/" in logger_ip:
+            logger_ip, sample_interval_secs = logger_ip.split("/", 1)
+        logger_port = default_port
+        if ":" in logger_ip:
+            logger_ip, logger_port = logger_ip.rsplit(":", 1)
+        logger_fleet.append(
+            (int(logger_sn), logger_ip, int(logger_port), int(sample_interval_secs))
+        )
+    return logger_fleet
+
 
 def main():
     log.setLevel(logging.INFO)
@@ -668,24 +2162,161 @@ def main():
         except JSONDecodeError as e:
             log.exception(f"Error loading {mappings_file}.")
             raise e
+    field_limits = None
+    limits_file = os.path.join(app_path, "config", "field_limits.json")
+    with open(limits_file) as limit_file:
+        try:
+            field_limits = load_field_limits(json.loads(limit_file.read()))
+            log.info(f"Loaded {len(field_limits)} field limits from {limits_file}")
+        except JSONDecodeError as e:
+            log.exception(f"Error loading {limits_file}.")
+            raise e
     # ensure proper signal handling; must be main thread
     signal_handler = SignalHandler()
     event_processor = EventProcessor()
-    logger_reader = LoggerReader(
-        field_mappings=mappings,
-        logger_sn=app_config.getint("inverter", "logger_sn"),
-        logger_ip=app_config.get("inverter", "logger_address"),
-        logger_port=app_config.getint("inverter", "logger_port"),
-        sample_interval_secs=app_config.getint(
-            "inverter", "logger_sample_interval_seconds"
-        ),
+    logger_sn = app_config.getint("inverter", "logger_sn")
+    logger_port = app_config.getint("inverter", "logger_port")
+    sample_interval_secs = app_config.getint(
+        "inverter", "logger_sample_interval_seconds"
     )
+    register_gap_max = app_config.getint(
+        "inverter", "register_gap_max", fallback=DEFAULT_REGISTER_GAP_MAX
+    )
+    register_window_max = app_config.getint(
+        "inverter", "register_window_max", fallback=DEFAULT_REGISTER_WINDOW_MAX
+    )
+    logger_fleet = parse_logger_fleet(
+        fleet_csv=app_config.get("inverter", "logger_fleet_csv", fallback=""),
+        default_port=logger_port,
+        default_interval_secs=sample_interval_secs,
+    )
+    runtime = app_config.get("app", "runtime", fallback="threads")
+    if runtime == RUNTIME_ASYNCIO and len(logger_fleet) == 0:
+        # the fleet poller is the reader that runs on an event loop
+        logger_fleet = [
+            (logger_sn, app_config.get("inverter", "logger_address"), logger_port, sample_interval_secs)
+        ]
+    capture_path = app_config.get("inverter", "capture_path", fallback="")
+    capture_max_bytes = app_config.getint(
+        "inverter", "capture_max_bytes", fallback=DEFAULT_CAPTURE_MAX_BYTES
+    )
+    if capture_path:
+        log.info(f"Capturing logger frames to {capture_path}.")
+    register_request_topic = app_config.get(
+        "registers", "request_topic", fallback=REGISTER_REQUEST_TOPIC
+    )
+    register_cache = None
+    read_queue = None
+    if register_request_topic:
+        register_cache = RegisterCache(
+            ttl_secs=app_config.getint(
+                "registers", "cache_ttl_secs", fallback=DEFAULT_CACHE_TTL_SECS
+            )
+        )
+    # reads are made on demand by the reader of the primary logger
+    if register_cache is not None and (
+        len(logger_fleet) == 0 or logger_sn in [fleet_logger[0] for fleet_logger in logger_fleet]
+    ):
+        read_queue = RegisterReadQueue(
+            max_pending=app_config.getint(
+                "registers", "max_pending_reads", fallback=DEFAULT_MAX_PENDING_READS
+            )
+        )
+    critical_fields = [
+        field.strip()
+        for field in app_config.get("inverter", "critical_fields_csv", fallback="").split(",")
+        if len(field.strip()) > 0
+    ]
+    critical_interval_secs = app_config.getint(
+        "inverter",
+        "critical_sample_interval_seconds",
+        fallback=DEFAULT_CRITICAL_SAMPLE_INTERVAL_SECONDS,
+    )
+    if len(logger_fleet) > 0:
+        log.info(f"Polling a fleet of {len(logger_fleet)} inverter loggers.")
+        logger_reader = FleetReader(
+            field_mappings=mappings,
+            logger_fleet=logger_fleet,
+            register_gap_max=register_gap_max,
+            register_window_max=register_window_max,
+            critical_fields=critical_fields,
+            critical_interval_secs=critical_interval_secs,
+            primary_logger_sn=logger_sn,
+            field_limits=field_limits,
+            capture_path=capture_path,
+            capture_max_bytes=capture_max_bytes,
+            register_cache=register_cache,
+            read_queue=read_queue,
+        )
+    else:
+        logger_reader = LoggerReader(
+            field_mappings=mappings,
+            logger_sn=logger_sn,
+            logger_ip=app_config.get("inverter", "logger_address"),
+            logger_port=logger_port,
+            sample_interval_secs=sample_interval_secs,
+            register_gap_max=register_gap_max,
+            register_window_max=register_window_max,
+            critical_fields=critical_fields,
+            critical_interval_secs=critical_interval_secs,
+            field_limits=field_limits,
+            capture_path=capture_path,
+            capture_max_bytes=capture_max_bytes,
+            register_cache=register_cache,
+            read_queue=read_queue,
+        )
     weather_reader = WeatherReader()
+    field_deadband = None
+    if app_config.getboolean("mqtt", "field_topics", fallback=False):
+        field_deadband = DeadbandFilter(
+            deadbands=parse_deadbands(app_config.get("mqtt", "field_deadband_csv", fallback="")),
+            default_deadband=app_config.getfloat("mqtt", "field_deadband_default", fallback=0),
+            max_silence_secs=app_config.getint(
+                "mqtt", "field_max_silence_secs", fallback=DEFAULT_MAX_SILENCE_SECS
+            ),
+        )
     mqtt_subscriber = MqttSubscriber(
         mqtt_server_address=app_config.get("mqtt", "server_address"),
         mqtt_topic_prefix=app_config.get("mqtt", "topic_prefix"),
         mqtt_switch_devices=app_config.get("mqtt", "switch_device_csv").split(","),
+        primary_logger_sn=logger_sn,
+        switch_hysteresis_secs=app_config.getint(
+            "mqtt", "switch_hysteresis_secs", fallback=SWITCH_HYSTERESIS_SECONDS
+        ),
+        switch_confirm_timeout_secs=app_config.getint(
+            "mqtt",
+            "switch_confirm_timeout_secs",
+            fallback=SWITCH_CONFIRM_TIMEOUT_SECONDS,
+        ),
+        statistics_fields=[
+            field.strip()
+            for field in app_config.get(
+                "statistics", "fields_csv", fallback=",".join(STATISTICS_FIELDS)
+            ).split(",")
+            if len(field.strip()) > 0
+        ],
+        statistics_window_secs=app_config.getint(
+            "statistics", "window_secs", fallback=STATISTICS_WINDOW_SECONDS
+        ),
+        statistics_ewma_halflife_secs=app_config.getint(
+            "statistics",
+            "ewma_halflife_secs",
+            fallback=STATISTICS_EWMA_HALFLIFE_SECONDS,
+        ),
+        register_cache=register_cache,
+        read_queue=read_queue,
+        register_request_topic=register_request_topic,
+        field_deadband=field_deadband,
     )
+    async_runtime = None
+    if runtime == RUNTIME_ASYNCIO:
+        async_runtime = AsyncRuntime(
+            logger_reader=logger_reader,
+            weather_reader=weather_reader,
+            mqtt_subscriber=mqtt_subscriber,
+            event_processor=event_processor,
+            queue_size=app_config.getint("app", "runtime_queue_size", fallback=RUNTIME_QUEUE_SIZE),
+        )
     nanny = threading.Thread(
         name="nanny", target=thread_nanny, args=(signal_handler,), daemon=True
     )
@@ -703,11 +2334,20 @@ def main():
         else:
             log.info(f"Starting metric server on port {metric_port}...")
             start_http_server(metric_port)
-        log.info(f"Starting {APP_NAME} threads...")
-        event_processor.start()
-        logger_reader.start()
-        weather_reader.start()
-        mqtt_subscriber.start()
+        history_port = app_config.getint(
+            "history", "network_port", fallback=HISTORY_NETWORK_PORT
+        )
+        log.info(f"Starting history server on port {history_port}...")
+        start_history_server(history_port, event_processor.history)
+        if async_runtime is not None:
+            log.info(f"Starting the {APP_NAME} event loop...")
+            async_runtime.start()
+        else:
+            log.info(f"Starting {APP_NAME} threads...")
+            event_processor.start()
+            logger_reader.start()
+            weather_reader.start()
+            mqtt_subscriber.start()
         # start thread nanny
         nanny.start()
         log.info("Startup complete.")
@@ -717,6 +2357,9 @@ def main():
     except (KeyboardInterrupt, RuntimeWarning, ContextTerminated):
         die()
     finally:
+        if read_queue is not None:
+            # a LoggerReader waits on it rather than on the shutdown event
+            read_queue.wake()
         zmq_term()
     bye()
 
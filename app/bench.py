@@ -0,0 +1,280 @@
+#!/usr/bin/env python
+import argparse
+import json
+import os.path
+import random
+import re
+import time
+import timeit
+import tracemalloc
+
+from pathlib import Path
+
+from app.simulator import add_simulator_arguments, simulator_from_arguments
+from app.solarman import (
+    DEFAULT_REGISTER_GAP_MAX,
+    DEFAULT_REGISTER_WINDOW_MAX,
+    FrameError,
+    LoggerConnection,
+    build_response_frame,
+    compile_read_windows,
+    compile_register_plan,
+    decode_registers,
+    decode_responses,
+    window_decoders,
+)
+
+# first and last register of each chunk read from the logger
+READ_WINDOWS = ((59, 112), (150, 195))
+BENCH_LOGGER_SN = 2712345678
+# polls traced for allocations, which is too slow to time alongside
+ALLOCATION_POLLS = 50
+
+
+def load_field_mappings():
+    app_path = Path(os.path.abspath(os.path.dirname(__file__))).parent
+    with open(os.path.join(app_path, "config", "field_mappings.txt")) as mapping_file:
+        return json.loads(mapping_file.read())
+
+
+def synthetic_response(count):
+    return build_response_frame(
+        BENCH_LOGGER_SN, [random.randrange(0, 0x10000) for _ in range(count)]
+    )
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def measure_polls(name, poll, polls):
+    """
+    Time each call of poll, which returns False on failure, then trace the
+    memory allocated by a smaller number of further polls.
+    """
+    latencies = []
+    failures = 0
+    bench_start = time.perf_counter()
+    for _ in range(polls):
+        poll_start = time.perf_counter()
+        if not poll():
+            failures += 1
+        latencies.append(time.perf_counter() - poll_start)
+    elapsed = time.perf_counter() - bench_start
+    allocations = []
+    tracemalloc.start()
+    for _ in range(min(polls, ALLOCATION_POLLS)):
+        tracemalloc.clear_traces()
+        tracemalloc.reset_peak()
+        poll()
+        allocations.append(tracemalloc.get_traced_memory()[1])
+    tracemalloc.stop()
+    print(f"{name}: {polls} polls, {failures} failed, in {elapsed:.2f}s")
+    print(f"{'polls/sec':>16}: {polls / elapsed:10.1f}")
+    print(f"{'p50 latency':>16}: {percentile(latencies, 50) * 1e3:10.3f}ms")
+    print(f"{'p99 latency':>16}: {percentile(latencies, 99) * 1e3:10.3f}ms")
+    # traced allocations include those of an in-process simulator
+    print(f"{'allocated/poll':>16}: {percentile(allocations, 50) / 1024:10.1f}KiB")
+
+
+def legacy_decode(field_mappings, pini, pfin, data, output):
+    """
+    The hex-string decoder that shipped before the register plan, kept for
+    comparison.
+    """
+    i = pfin - pini
+    a = 0
+    while a <= i:
+        p1 = 56 + (a * 4)
+        p2 = 60 + (a * 4)
+        response = int(
+            str(
+                "".join(hex(ord(chr(x)))[2:].zfill(2) for x in bytearray(data))
+                + "  "
+                + re.sub("[^\x20-\x7f]", "", "")
+            )[p1:p2],
+            16,
+        )
+        if response & 0x8000:
+            response -= 0x10000
+        hexpos = str("0x") + str(hex(a + pini)[2:].zfill(4)).upper()
+        for parameter in field_mappings:
+            for item in parameter["items"]:
+                title = item["titleEN"]
+                ratio = item["ratio"]
+                unit = item["unit"]
+                for register in item["registers"]:
+                    if register == hexpos:
+                        if title.find("Temperature") != -1:
+                            response = round(response * ratio - 100, 2)
+                        else:
+                            response = round(response * ratio, 2)
+                        if len(unit) > 0:
+                            key = f"{title} {unit}"
+                        else:
+                            key = f"{title}"
+                        key = (
+                            key.replace(" ", "_")
+                            .replace("-", "_")
+                            .replace("º", "c")
+                            .replace("%", "pct")
+                            .lower()
+                        )
+                        output[key] = response
+        a += 1
+    return output
+
+
+def bench_decode(repeat):
+    field_mappings = load_field_mappings()
+    register_plan = compile_register_plan(field_mappings)
+    frames = []
+    for pini, pfin in READ_WINDOWS:
+        count = pfin - pini + 1
+        frames.append(
+            (
+                pini,
+                pfin,
+                window_decoders(register_plan, pini, count),
+                synthetic_response(count),
+            )
+        )
+
+    def legacy():
+        output = {}
+        for pini, pfin, _, data in frames:
+            legacy_decode(field_mappings, pini, pfin, data, output)
+
+    def current():
+        output = {}
+        for pini, pfin, decoders, data in frames:
+            decode_registers(decoders, pfin - pini + 1, data, output)
+
+    results = {}
+    for name, fn in (("legacy", legacy), ("current", current)):
+        number, _ = timeit.Timer(fn).autorange()
+        best = min(timeit.Timer(fn).repeat(repeat=repeat, number=number))
+        # per response frame
+        results[name] = best / number / len(frames)
+        print(f"{name:>8}: {results[name] * 1e6:10.2f}us per frame")
+    print(f"{'speedup':>8}: {results['legacy'] / results['current']:10.1f}x")
+
+
+def bench_reader(simulator, polls):
+    """
+    Poll the simulator the way LoggerReader does: one persistent session,
+    pipelined window requests, then validation and decoding.
+    """
+    port = simulator.start()
+    read_windows = compile_read_windows(
+        register_plan=compile_register_plan(load_field_mappings()),
+        logger_sn=BENCH_LOGGER_SN,
+        max_gap=DEFAULT_REGISTER_GAP_MAX,
+        max_count=DEFAULT_REGISTER_WINDOW_MAX,
+    )
+    request_frames = [window.frame for window in read_windows]
+    connection = LoggerConnection(address="127.0.0.1", port=port, timeout=2)
+
+    def poll():
+        try:
+            decode_responses(
+                read_windows=read_windows,
+                responses=connection.exchange(request_frames),
+                logger_sn=BENCH_LOGGER_SN,
+                output={},
+            )
+        except (FrameError, OSError):
+            connection.close()
+            return False
+        return True
+
+    measure_polls("reader", poll, polls)
+    connection.close()
+    simulator.stop()
+    print(f"{'simulator':>16}: {simulator.stats}")
+
+
+def bench_pipeline(simulator, polls):
+    """
+    Push polls from a LoggerReader through a running EventProcessor to its
+    MQTT hand-off. Needs the application runtime configuration.
+    """
+    import zmq
+
+    from tailucas_pylib import threads
+    from tailucas_pylib.zmq import zmq_socket, try_close
+
+    from app.__main__ import (
+        EventProcessor,
+        LoggerReader,
+        URL_WORKER_APP,
+        URL_WORKER_MQTT_PUBLISH,
+        EVENT_SAMPLE,
+        INPROC_QUEUE_DEPTH,
+    )
+
+    port = simulator.start()
+    logger_reader = LoggerReader(
+        field_mappings=load_field_mappings(),
+        logger_sn=BENCH_LOGGER_SN,
+        logger_ip="127.0.0.1",
+        logger_port=port,
+    )
+    mqtt_socket = zmq_socket(zmq.PULL)
+    mqtt_socket.bind(URL_WORKER_MQTT_PUBLISH)
+    event_processor = EventProcessor()
+    event_processor.start()
+    app_socket = zmq_socket(zmq.PUSH)
+    app_socket.connect(URL_WORKER_APP)
+
+    def poll():
+        logger_data = logger_reader.get_logger_data()
+        if logger_data is None:
+            return False
+        app_socket.send_multipart(
+            [
+                EVENT_SAMPLE,
+                logger_reader.sample_schema.pack(BENCH_LOGGER_SN, time.time_ns(), logger_data),
+            ],
+            copy=False,
+        )
+        INPROC_QUEUE_DEPTH.labels(queue="app").inc()
+        while True:
+            frames = mqtt_socket.recv_multipart(copy=False)
+            INPROC_QUEUE_DEPTH.labels(queue="mqtt").dec()
+            # passing over the energy totals that follow each sample
+            if frames[0].bytes == EVENT_SAMPLE:
+                return True
+
+    measure_polls("pipeline", poll, polls)
+    threads.shutting_down = True
+    try_close(app_socket)
+    try_close(mqtt_socket)
+    logger_reader.connection.close()
+    simulator.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inverter monitor benchmarks.")
+    subparsers = parser.add_subparsers(dest="bench", required=True)
+    decode_parser = subparsers.add_parser("decode", help="register decode microbenchmark")
+    decode_parser.add_argument("--repeat", type=int, default=5)
+    for name, help in (
+        ("reader", "logger polls against the simulator"),
+        ("pipeline", "logger polls through the EventProcessor"),
+    ):
+        poll_parser = subparsers.add_parser(name, help=help)
+        poll_parser.add_argument("--polls", type=int, default=1000)
+        add_simulator_arguments(poll_parser)
+    args = parser.parse_args()
+    if args.bench == "decode":
+        bench_decode(repeat=args.repeat)
+    elif args.bench == "reader":
+        bench_reader(simulator=simulator_from_arguments(args), polls=args.polls)
+    else:
+        bench_pipeline(simulator=simulator_from_arguments(args), polls=args.polls)
+
+
+if __name__ == "__main__":
+    main()
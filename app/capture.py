@@ -0,0 +1,212 @@
+import mmap
+import os
+import struct
+
+from array import array
+from typing import NamedTuple
+
+CAPTURE_MAGIC = b"IMFC\x02"
+INDEX_SUFFIX = ".idx"
+# the previous capture, kept once the current one reaches its size cap
+ROTATED_SUFFIX = ".1"
+# a capture written in another format, kept aside rather than appended to
+OUTDATED_SUFFIX = ".old"
+DEFAULT_MAX_BYTES = 67108864
+# sample time, logger serial, kind, frame pairs and the length of the pairs that follow
+RECORD_HEADER = struct.Struct("<QQBHI")
+FRAME_LENGTH = struct.Struct("<H")
+
+# what an exchange was for
+KIND_SAMPLE = 0
+KIND_CRITICAL = 1
+# the windows of values rejected from the last sample or critical sample
+KIND_REREAD = 2
+# registers read on demand for the register read service
+KIND_READ = 3
+
+
+class CaptureRecord(NamedTuple):
+    timestamp_ns: int
+    logger_sn: int
+    kind: int
+    # (request frame, response frame) pairs, as views into the capture
+    exchanges: tuple
+
+
+class FrameCapture:
+    """
+    Appends the request and response frames of each logger exchange to a
+    binary log, and the time and offset of each record to an index beside
+    it, so that replays can seek by time. Once the log reaches max_bytes it
+    is rotated to a ".1" suffix, replacing the capture rotated before it. A
+    log in another format is moved aside to an ".old" suffix, noted in
+    outdated_path.
+    """
+
+    def __init__(self, path, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.outdated_path = None
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        if os.path.exists(path):
+            self._recover()
+        self._open()
+
+    def _open(self):
+        self._log = open(self.path, "ab")
+        if self._log.tell() == 0:
+            self._log.write(CAPTURE_MAGIC)
+        self._index = open(f"{self.path}{INDEX_SUFFIX}", "ab")
+
+    def _move(self, suffix):
+        moved_path = f"{self.path}{suffix}"
+        os.replace(self.path, moved_path)
+        index_path = f"{self.path}{INDEX_SUFFIX}"
+        if os.path.exists(index_path):
+            os.replace(index_path, f"{moved_path}{INDEX_SUFFIX}")
+        return moved_path
+
+    def _rotate(self):
+        self.close()
+        self._move(ROTATED_SUFFIX)
+        self._open()
+
+    def _recover(self):
+        """
+        Cut the log back to its last whole record so that appends follow it,
+        indexing any whole records the index is missing.
+        """
+        with open(self.path, "rb") as log_file:
+            magic = log_file.read(len(CAPTURE_MAGIC))
+        if len(magic) == len(CAPTURE_MAGIC) and magic != CAPTURE_MAGIC:
+            # written in another format, which a replay of that version can still read
+            self.outdated_path = self._move(OUTDATED_SUFFIX)
+            return
+        index_path = f"{self.path}{INDEX_SUFFIX}"
+        with open(self.path, "r+b") as log_file, open(index_path, "a+b") as index_file:
+            size = log_file.seek(0, os.SEEK_END)
+            if size < len(CAPTURE_MAGIC):
+                # torn at birth
+                log_file.truncate(0)
+                index_file.truncate(0)
+                return
+            entries = index_file.seek(0, os.SEEK_END) // 16
+            offset = len(CAPTURE_MAGIC)
+            # resume from the last indexed record that lies within the log
+            while entries > 0:
+                index_file.seek((entries - 1) * 16)
+                _, last_offset = struct.unpack("<QQ", index_file.read(16))
+                if last_offset < size:
+                    offset = last_offset
+                    entries -= 1
+                    break
+                entries -= 1
+            index_file.truncate(entries * 16)
+            while offset + RECORD_HEADER.size <= size:
+                log_file.seek(offset)
+                timestamp_ns, _, _, _, length = RECORD_HEADER.unpack(
+                    log_file.read(RECORD_HEADER.size)
+                )
+                if offset + RECORD_HEADER.size + length > size:
+                    break
+                index_file.write(struct.pack("<QQ", timestamp_ns, offset))
+                offset += RECORD_HEADER.size + length
+            log_file.truncate(offset)
+
+    def append(self, timestamp_ns, logger_sn, kind, request_frames, responses):
+        pairs = bytearray()
+        count = 0
+        for request, response in zip(request_frames, responses):
+            pairs += FRAME_LENGTH.pack(len(request))
+            pairs += request
+            pairs += FRAME_LENGTH.pack(len(response))
+            pairs += response
+            count += 1
+        offset = self._log.tell()
+        if offset + RECORD_HEADER.size + len(pairs) > self.max_bytes and offset > len(
+            CAPTURE_MAGIC
+        ):
+            self._rotate()
+            offset = self._log.tell()
+        self._log.write(RECORD_HEADER.pack(timestamp_ns, logger_sn, kind, count, len(pairs)))
+        self._log.write(pairs)
+        self._log.flush()
+        self._index.write(struct.pack("<QQ", timestamp_ns, offset))
+        self._index.flush()
+
+    def close(self):
+        self._log.close()
+        self._index.close()
+
+
+class CaptureReader:
+    """
+    Reads a frame capture through a memory map, yielding records without
+    copying the frames.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as log_file:
+            self._map = mmap.mmap(log_file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[: len(CAPTURE_MAGIC)] != CAPTURE_MAGIC:
+            self._map.close()
+            raise ValueError(f"{path} is not a frame capture.")
+        self._view = memoryview(self._map)
+        # interleaved sample times and offsets
+        self._index = array("Q")
+        index_path = f"{path}{INDEX_SUFFIX}"
+        if os.path.exists(index_path):
+            with open(index_path, "rb") as index_file:
+                data = index_file.read()
+            self._index.frombytes(data[: len(data) - len(data) % 16])
+
+    def _offset_at(self, start_ns):
+        """
+        The offset of the first indexed record at or after start_ns.
+        """
+        low, high = 0, len(self._index) // 2
+        while low < high:
+            middle = (low + high) // 2
+            if self._index[middle * 2] < start_ns:
+                low = middle + 1
+            else:
+                high = middle
+        if low == len(self._index) // 2:
+            return len(self._map)
+        return self._index[low * 2 + 1]
+
+    def records(self, start_ns=None, end_ns=None):
+        offset = len(CAPTURE_MAGIC)
+        if start_ns is not None and len(self._index) > 0:
+            offset = self._offset_at(start_ns)
+        view = self._view
+        size = len(view)
+        while offset + RECORD_HEADER.size <= size:
+            timestamp_ns, logger_sn, kind, count, length = RECORD_HEADER.unpack_from(view, offset)
+            offset += RECORD_HEADER.size
+            if offset + length > size:
+                # torn by a crash mid-append
+                break
+            if end_ns is not None and timestamp_ns > end_ns:
+                break
+            exchanges = []
+            position = offset
+            for _ in range(count):
+                (request_length,) = FRAME_LENGTH.unpack_from(view, position)
+                position += FRAME_LENGTH.size
+                request = view[position : position + request_length]
+                position += request_length
+                (response_length,) = FRAME_LENGTH.unpack_from(view, position)
+                position += FRAME_LENGTH.size
+                response = view[position : position + response_length]
+                position += response_length
+                exchanges.append((request, response))
+            offset += length
+            if start_ns is not None and timestamp_ns < start_ns:
+                continue
+            yield CaptureRecord(timestamp_ns, logger_sn, kind, tuple(exchanges))
+
+    def close(self):
+        self._view.release()
+        self._map.close()
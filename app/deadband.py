@@ -0,0 +1,55 @@
+DEFAULT_MAX_SILENCE_SECS = 300
+
+
+def parse_deadbands(deadband_csv):
+    """
+    Parse field:deadband pairs such as "battery_soc_pct:1,pv1_power_w:25".
+    """
+    deadbands = dict()
+    for item in deadband_csv.split(","):
+        item = item.strip()
+        if len(item) == 0:
+            continue
+        field, deadband = item.split(":")
+        deadbands[field.strip()] = float(deadband)
+    return deadbands
+
+
+class DeadbandFilter:
+    """
+    Picks the fields of each sample worth publishing: those that moved
+    beyond their deadband from the value last published, and those unpublished
+    for max_silence_secs so that subscribers can tell a steady value from a
+    stale one. A deadband of 0 publishes every change.
+    """
+
+    def __init__(self, deadbands, default_deadband=0, max_silence_secs=DEFAULT_MAX_SILENCE_SECS):
+        self.deadbands = deadbands
+        self.default_deadband = default_deadband
+        self.max_silence_secs = max_silence_secs
+        # by source (e.g. logger serial): {field: (value, published at)}
+        self.published = dict()
+        self.suppressed = 0
+
+    def changes(self, source, sample, now):
+        """
+        Return the (field, value) pairs of the sample to publish, recording
+        them as published at now.
+        """
+        published = self.published.setdefault(source, dict())
+        changes = []
+        for field in sample.keys():
+            value = sample[field]
+            last = published.get(field)
+            if last is not None and now - last[1] < self.max_silence_secs:
+                deadband = self.deadbands.get(field, self.default_deadband)
+                if deadband > 0:
+                    if abs(value - last[0]) <= deadband:
+                        self.suppressed += 1
+                        continue
+                elif value == last[0]:
+                    self.suppressed += 1
+                    continue
+            published[field] = (value, now)
+            changes.append((field, value))
+        return changes
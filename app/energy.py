@@ -0,0 +1,127 @@
+import json
+import os
+import time
+
+POWER_SUFFIX = "_power_w"
+WH_PER_KWH = 1000
+SECS_PER_HOUR = 3600
+# samples further apart are not integrated across
+DEFAULT_GAP_MAX_SECS = 300
+
+
+def trapezoid_wh(power_w, prev_power_w, secs):
+    """
+    Integrate power linearly between two samples, returning the positive and
+    negative energy in Wh, split where the power crosses zero.
+    """
+    if prev_power_w >= 0 and power_w >= 0:
+        return (prev_power_w + power_w) / 2 * secs / SECS_PER_HOUR, 0.0
+    if prev_power_w <= 0 and power_w <= 0:
+        return 0.0, -(prev_power_w + power_w) / 2 * secs / SECS_PER_HOUR
+    # the share of the interval before crossing zero
+    crossing = prev_power_w / (prev_power_w - power_w)
+    before_wh = prev_power_w / 2 * secs * crossing / SECS_PER_HOUR
+    after_wh = power_w / 2 * secs * (1 - crossing) / SECS_PER_HOUR
+    if prev_power_w > 0:
+        return before_wh, -after_wh
+    return after_wh, -before_wh
+
+
+def local_day(timestamp):
+    return time.strftime("%Y-%m-%d", time.localtime(timestamp))
+
+
+class EnergyIntegrator:
+    """
+    Running kWh totals of every *_power_w field, integrated with the
+    trapezoid rule over sample times. Positive and negative energy are kept
+    apart (e.g. import and export) so that every total only grows, and the
+    daily totals restart at local midnight. An interval that spans midnight
+    counts towards the day it ends in. State is saved to state_path so that
+    totals survive restarts.
+    """
+
+    def __init__(self, state_path, gap_max_secs=DEFAULT_GAP_MAX_SECS):
+        self.state_path = state_path
+        self.gap_max_secs = gap_max_secs
+        # by source (e.g. logger serial): {"day": ..., "fields": {field: {...}}}
+        self.sources = dict()
+        self.gaps = 0
+
+    def load(self):
+        if not os.path.exists(self.state_path):
+            return False
+        with open(self.state_path) as state_file:
+            self.sources = json.loads(state_file.read())
+        return True
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.state_path) or ".", exist_ok=True)
+        with open(f"{self.state_path}.tmp", "w") as state_file:
+            state_file.write(json.dumps(self.sources))
+        os.replace(f"{self.state_path}.tmp", self.state_path)
+
+    def update(self, source, timestamp_ns, sample):
+        """
+        Integrate a sample, returning the (field, positive kWh, negative kWh)
+        added by it.
+        """
+        timestamp = timestamp_ns / 1e9
+        day = local_day(timestamp)
+        state = self.sources.setdefault(source, {"day": day, "fields": {}})
+        if state["day"] != day:
+            state["day"] = day
+            for field_state in state["fields"].values():
+                field_state["day_kwh"] = [0.0, 0.0]
+        deltas = []
+        for field in sample.keys():
+            if not field.endswith(POWER_SUFFIX):
+                continue
+            power_w = sample[field]
+            field_state = state["fields"].get(field)
+            if field_state is None:
+                state["fields"][field] = {
+                    "at": timestamp,
+                    "power_w": power_w,
+                    "day_kwh": [0.0, 0.0],
+                    "total_kwh": [0.0, 0.0],
+                }
+                continue
+            secs = timestamp - field_state["at"]
+            if secs <= 0:
+                # a repeated or late sample
+                continue
+            field_state["at"] = timestamp
+            prev_power_w = field_state["power_w"]
+            field_state["power_w"] = power_w
+            if secs > self.gap_max_secs:
+                # too little is known about the gap to integrate over it
+                self.gaps += 1
+                continue
+            positive_wh, negative_wh = trapezoid_wh(power_w, prev_power_w, secs)
+            positive_kwh = positive_wh / WH_PER_KWH
+            negative_kwh = negative_wh / WH_PER_KWH
+            for totals in (field_state["day_kwh"], field_state["total_kwh"]):
+                totals[0] += positive_kwh
+                totals[1] += negative_kwh
+            deltas.append((field, positive_kwh, negative_kwh))
+        return deltas
+
+    def totals(self, source):
+        """
+        Return the totals of a source as flat fields, e.g. pv1_daily_kwh and
+        pv1_total_kwh, with battery_daily_negative_kwh and the like only for
+        fields that have been negative.
+        """
+        fields = dict()
+        state = self.sources.get(source)
+        if state is None:
+            return fields
+        for field, field_state in state["fields"].items():
+            prefix = field[: -len(POWER_SUFFIX)]
+            fields[f"{prefix}_daily_kwh"] = field_state["day_kwh"][0]
+            fields[f"{prefix}_total_kwh"] = field_state["total_kwh"][0]
+            if field_state["total_kwh"][1] > 0:
+                fields[f"{prefix}_daily_negative_kwh"] = field_state["day_kwh"][1]
+                fields[f"{prefix}_total_negative_kwh"] = field_state["total_kwh"][1]
+        return fields
@@ -0,0 +1,275 @@
+import json
+import threading
+import time
+
+from array import array
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+# raw samples kept per field, e.g. 24h at the default 60s interval
+DEFAULT_RAW_POINTS = 1440
+# (step seconds, points): 1-minute means for 24h and 15-minute means for 30 days
+DEFAULT_TIERS = ((60, 1440), (900, 2880))
+
+
+def parse_tiers(tiers_csv):
+    """
+    Parse downsampled tiers of the form step_secs:points[,step_secs:points].
+    """
+    tiers = []
+    for entry in tiers_csv.split(","):
+        entry = entry.strip()
+        if len(entry) == 0:
+            continue
+        step_secs, points = entry.split(":", 1)
+        tiers.append((int(step_secs), int(points)))
+    return tuple(sorted(tiers))
+
+
+class RingBuffer:
+    """
+    A bounded series of (time_ns, value) in flat arrays, which grow as
+    entries arrive until the capacity is reached and then overwrite the
+    oldest entry. Entries are expected in time order.
+    """
+
+    __slots__ = ("capacity", "times", "values", "head", "size")
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.times = array("q")
+        self.values = array("d")
+        # where the next entry goes
+        self.head = 0
+        self.size = 0
+
+    def append(self, time_ns, value):
+        if self.size < self.capacity:
+            # the oldest entry is still at the start while growing
+            self.times.append(time_ns)
+            self.values.append(value)
+            self.size += 1
+            self.head = self.size % self.capacity
+            return
+        self.times[self.head] = time_ns
+        self.values[self.head] = value
+        self.head = (self.head + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def _index(self, position):
+        # position 0 is the oldest entry
+        return (self.head - self.size + position) % self.capacity
+
+    def _bisect(self, time_ns):
+        low, high = 0, self.size
+        while low < high:
+            middle = (low + high) // 2
+            if self.times[self._index(middle)] < time_ns:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    @property
+    def oldest_ns(self):
+        if self.size == 0:
+            return None
+        return self.times[self._index(0)]
+
+    def range(self, start_ns, end_ns):
+        """
+        Return the (time_ns, value) entries from start_ns up to and including end_ns.
+        """
+        entries = []
+        for position in range(self._bisect(start_ns), self.size):
+            index = self._index(position)
+            if self.times[index] > end_ns:
+                break
+            entries.append((self.times[index], self.values[index]))
+        return entries
+
+
+class DownsampledTier:
+    """
+    Means over wall-clock aligned steps, kept in a ring once each step closes.
+    """
+
+    __slots__ = ("step_ns", "ring", "bucket_ns", "bucket_sum", "bucket_count")
+
+    def __init__(self, step_secs, points):
+        self.step_ns = step_secs * 1_000_000_000
+        self.ring = RingBuffer(points)
+        self.bucket_ns = None
+        self.bucket_sum = 0.0
+        self.bucket_count = 0
+
+    def append(self, time_ns, value):
+        bucket_ns = time_ns - time_ns % self.step_ns
+        if bucket_ns != self.bucket_ns:
+            if self.bucket_count > 0:
+                self.ring.append(self.bucket_ns, self.bucket_sum / self.bucket_count)
+            self.bucket_ns = bucket_ns
+            self.bucket_sum = 0.0
+            self.bucket_count = 0
+        self.bucket_sum += value
+        self.bucket_count += 1
+
+
+class SeriesHistory:
+    __slots__ = ("raw", "tiers")
+
+    def __init__(self, raw_points, tiers):
+        self.raw = RingBuffer(raw_points)
+        self.tiers = tuple(DownsampledTier(step_secs, points) for step_secs, points in tiers)
+
+    def append(self, time_ns, value):
+        self.raw.append(time_ns, value)
+        for tier in self.tiers:
+            tier.append(time_ns, value)
+
+    def select(self, start_ns, step_secs):
+        """
+        Pick the finest ring holding data back to start_ns that is at least
+        step_secs apart, or else the one reaching furthest back.
+        """
+        rings = [(0, self.raw)] + [
+            (tier.step_ns // 1_000_000_000, tier.ring) for tier in self.tiers
+        ]
+        candidates = [(step, ring) for step, ring in rings if step >= step_secs]
+        if len(candidates) == 0:
+            candidates = rings[-1:]
+        furthest = candidates[0]
+        for step, ring in candidates:
+            if ring.oldest_ns is None:
+                continue
+            if ring.oldest_ns <= start_ns:
+                return step, ring
+            if furthest[1].oldest_ns is None or ring.oldest_ns < furthest[1].oldest_ns:
+                furthest = (step, ring)
+        return furthest
+
+
+class HistoryStore:
+    """
+    Recent history of every numeric event field in bounded memory: each
+    series keeps raw samples and downsampled tiers in rings that grow as
+    data arrives up to their capacity, so range queries are served from
+    memory whether or not InfluxDB is reachable.
+    Series are named point/field, with the logger serial when tagged.
+    """
+
+    def __init__(self, raw_points=DEFAULT_RAW_POINTS, tiers=DEFAULT_TIERS):
+        self.raw_points = raw_points
+        self.tiers = tiers
+        self.series = dict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def series_name(point_name, field_name, logger_sn=None):
+        if logger_sn is None:
+            return f"{point_name}/{field_name}"
+        return f"{point_name}/{logger_sn}/{field_name}"
+
+    def record(self, point_name, fields, tags, timestamp_ns):
+        logger_sn = tags.get("logger_sn")
+        with self._lock:
+            for field_name, value in fields.items():
+                if not isinstance(value, (int, float)):
+                    continue
+                name = self.series_name(point_name, field_name, logger_sn)
+                series = self.series.get(name)
+                if series is None:
+                    series = SeriesHistory(self.raw_points, self.tiers)
+                    self.series[name] = series
+                series.append(timestamp_ns, value)
+
+    def names(self):
+        with self._lock:
+            return sorted(self.series)
+
+    def query(self, name, start_ns, end_ns, step_secs=0):
+        """
+        Return (step seconds, [(time_ns, value), ...]) for a series, or None
+        if it is unknown. A step of 0 is the raw samples.
+        """
+        with self._lock:
+            series = self.series.get(name)
+            if series is None:
+                return None
+            step, ring = series.select(start_ns, step_secs)
+            return step, ring.range(start_ns, end_ns)
+
+
+class HistoryRequestHandler(BaseHTTPRequestHandler):
+    """
+    GET /history lists the series; GET /history/<series>?minutes=N (or
+    start and end in epoch seconds, and an optional step in seconds) returns
+    its points as [epoch seconds, value] pairs.
+    """
+
+    history_store = None
+
+    def _send_json(self, status, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        path = url.path.rstrip("/")
+        if path == "/history":
+            self._send_json(200, {"series": self.history_store.names()})
+            return
+        if not path.startswith("/history/"):
+            self._send_json(404, {"error": f"No such resource {url.path}."})
+            return
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        try:
+            end_ns = time.time_ns()
+            if "end" in params:
+                end_ns = int(float(params["end"]) * 1e9)
+            if "start" in params:
+                start_ns = int(float(params["start"]) * 1e9)
+            else:
+                start_ns = end_ns - int(float(params.get("minutes", 60)) * 60e9)
+            step_secs = int(params.get("step", 0))
+        except ValueError as e:
+            self._send_json(400, {"error": str(e)})
+            return
+        name = path[len("/history/") :]
+        result = self.history_store.query(name, start_ns, end_ns, step_secs)
+        if result is None:
+            self._send_json(404, {"error": f"No history for {name}."})
+            return
+        step, points = result
+        self._send_json(
+            200,
+            {
+                "series": name,
+                "step_secs": step,
+                "points": [[time_ns / 1e9, value] for time_ns, value in points],
+            },
+        )
+
+    def log_message(self, format, *args):
+        # requests are not worth a log line each
+        pass
+
+
+def start_history_server(port, history_store, addr="0.0.0.0"):
+    """
+    Serve the history store over HTTP from a daemon thread.
+    """
+    handler = type(
+        "BoundHistoryRequestHandler",
+        (HistoryRequestHandler,),
+        {"history_store": history_store},
+    )
+    server = ThreadingHTTPServer((addr, port), handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name="HistoryServer", daemon=True)
+    thread.start()
+    return server
@@ -0,0 +1,158 @@
+from typing import NamedTuple
+
+
+class FieldLimit(NamedTuple):
+    minimum: float = None
+    maximum: float = None
+    # a change this large within the window is implausible
+    max_delta: float = None
+    window_intervals: float = 2
+    # a zero here and on all of these fields marks a glitch frame
+    zero_with: tuple = ()
+
+
+# limits entry applying to every field without limits of its own
+DEFAULT_LIMIT_KEY = "*"
+
+# the battery rules that predate configurable limits
+DEFAULT_FIELD_LIMITS = {
+    "battery_soc_pct": FieldLimit(
+        minimum=0, maximum=100, max_delta=5, zero_with=("battery_voltage_v",)
+    ),
+    "battery_voltage_v": FieldLimit(minimum=1),
+}
+
+DEFAULT_MAX_REREADS = 2
+
+
+def load_field_limits(limits):
+    """
+    Build field limits from JSON of the form
+    {"battery_soc_pct": {"min": 0, "max": 100, "max_delta": 5, "window_intervals": 2,
+    "zero_with": ["battery_voltage_v"]}}, where a "*" entry applies to every
+    other field.
+    """
+    return {
+        key: FieldLimit(
+            minimum=limit.get("min"),
+            maximum=limit.get("max"),
+            max_delta=limit.get("max_delta"),
+            window_intervals=limit.get("window_intervals", 2),
+            zero_with=tuple(limit.get("zero_with", ())),
+        )
+        for key, limit in limits.items()
+    }
+
+
+def windows_for_keys(read_windows, keys):
+    """
+    Select the read windows that decode any of the given field keys.
+    """
+    return tuple(
+        window
+        for window in read_windows
+        if any(decoder.key in keys for _, decoder in window.decoders)
+    )
+
+
+class PlausibilityFilter:
+    """
+    Judges each decoded field of a sample against its bounds and against the
+    last value accepted for it, which is only updated by values that pass.
+    Fields without limits of their own take the "*" limits, if any. A sample
+    in which a field and all of its zero_with fields read zero is a glitch
+    frame, and every field of it is rejected.
+    """
+
+    def __init__(self, field_limits, sample_interval_secs):
+        self.field_limits = field_limits
+        self.default_limit = field_limits.get(DEFAULT_LIMIT_KEY)
+        self.zero_rules = [
+            (key, limit.zero_with)
+            for key, limit in field_limits.items()
+            if len(limit.zero_with) > 0
+        ]
+        self.sample_interval_secs = sample_interval_secs
+        # key: (value, accepted at)
+        self.accepted = dict()
+
+    def check(self, logger_data, now):
+        """
+        Return {key: reason} for the fields of the sample that are implausible.
+        """
+        for key, zero_with in self.zero_rules:
+            if logger_data.get(key) == 0 and all(
+                logger_data.get(other) == 0 for other in zero_with
+            ):
+                reason = f"{key} and {', '.join(zero_with)} are all zero"
+                return {field: reason for field in logger_data}
+        rejected = dict()
+        for key, value in logger_data.items():
+            limit = self.field_limits.get(key, self.default_limit)
+            if limit is None:
+                continue
+            if limit.minimum is not None and value < limit.minimum:
+                rejected[key] = f"{key}={value} is below {limit.minimum}"
+                continue
+            if limit.maximum is not None and value > limit.maximum:
+                rejected[key] = f"{key}={value} is above {limit.maximum}"
+                continue
+            if limit.max_delta is None or key not in self.accepted:
+                continue
+            prev_value, accepted_at = self.accepted[key]
+            accepted_secs = now - accepted_at
+            if (
+                abs(value - prev_value) >= limit.max_delta
+                and accepted_secs < self.sample_interval_secs * limit.window_intervals
+            ):
+                rejected[key] = (
+                    f"{key} changed from {prev_value} to {value} within {accepted_secs:.2f}s"
+                )
+        return rejected
+
+    def accept(self, logger_data, now):
+        for key, value in logger_data.items():
+            self.accepted[key] = (value, now)
+
+
+class SampleCheck:
+    """
+    Judges a sample read from a logger, choosing the read windows to re-read
+    for its rejected values until they pass or the re-reads are spent, then
+    dropping the values still rejected so that one implausible field cannot
+    hold back the rest.
+    """
+
+    def __init__(self, plausibility, read_windows, logger_data, max_rereads=DEFAULT_MAX_REREADS):
+        self.plausibility = plausibility
+        self.read_windows = read_windows
+        self.logger_data = logger_data
+        self.max_rereads = max_rereads
+        self.rejected = dict()
+        self.rereads = 0
+
+    def reread_windows(self, now):
+        """
+        Return the windows to re-read before judging the sample again, or none
+        once it is judged.
+        """
+        self.rejected = self.plausibility.check(self.logger_data, now=now)
+        if len(self.rejected) == 0 or self.rereads == self.max_rereads:
+            return ()
+        self.rereads += 1
+        # only the windows holding the rejected values
+        return windows_for_keys(self.read_windows, self.rejected)
+
+    def merge(self, reread):
+        self.logger_data.update(reread)
+
+    def sample(self, now):
+        """
+        Return the plausible fields of the sample, or None if there are none.
+        """
+        for key in self.rejected:
+            del self.logger_data[key]
+        if len(self.logger_data) == 0:
+            return None
+        self.plausibility.accept(self.logger_data, now=now)
+        return self.logger_data
@@ -0,0 +1,181 @@
+import threading
+import time
+
+from typing import NamedTuple
+
+from app.solarman import plan_read_windows
+
+# the most registers a single Modbus read may return
+MODBUS_MAX_REGISTERS = 125
+DEFAULT_CACHE_TTL_SECS = 60
+DEFAULT_MAX_PENDING_READS = 64
+
+
+class RegisterRead(NamedTuple):
+    logger_sn: int
+    start: int
+    count: int
+    # the oldest cached value that will do
+    max_age_secs: float
+    # where and with what to answer, e.g. the MQTT reply topic and request id
+    reply_to: str
+    request_id: object
+
+
+def parse_register_read(request, default_logger_sn, ttl_secs):
+    """
+    Build a RegisterRead from a request of the form
+    {"logger_sn": 2712345678, "start": "0x3b", "count": 10, "max_age_secs": 30,
+    "reply_to": "my/topic", "id": 1}, where only start and count are required
+    and addresses may be integers or strings such as "0x3b".
+
+    Raises ValueError describing the first problem found.
+    """
+    try:
+        start = request["start"]
+        count = request["count"]
+    except (KeyError, TypeError):
+        raise ValueError("A register read needs a start and a count.") from None
+    try:
+        start = int(start, 0) if isinstance(start, str) else int(start)
+        count = int(count, 0) if isinstance(count, str) else int(count)
+        logger_sn = int(request.get("logger_sn", default_logger_sn))
+        max_age_secs = float(request.get("max_age_secs", ttl_secs))
+    except (TypeError, ValueError):
+        raise ValueError(f"Unreadable register read {request}.") from None
+    if not 1 <= count <= MODBUS_MAX_REGISTERS:
+        raise ValueError(f"Cannot read {count} registers, only 1 to {MODBUS_MAX_REGISTERS}.")
+    if start < 0 or start + count > 0x10000:
+        raise ValueError(f"Registers 0x{start:04X}+{count} are out of range.")
+    reply_to = request.get("reply_to")
+    if reply_to is not None and (
+        not isinstance(reply_to, str) or len(reply_to) == 0 or "+" in reply_to or "#" in reply_to
+    ):
+        raise ValueError(f"Cannot reply to {reply_to!r}, which is not a topic name.")
+    return RegisterRead(
+        logger_sn=logger_sn,
+        start=start,
+        count=count,
+        max_age_secs=min(max_age_secs, ttl_secs),
+        reply_to=reply_to,
+        request_id=request.get("id"),
+    )
+
+
+def register_reply(read, words=None, age_secs=None, source=None, error=None):
+    reply = {
+        "id": read.request_id,
+        "logger_sn": read.logger_sn,
+        "start": read.start,
+        "count": read.count,
+    }
+    if error is not None:
+        reply["error"] = error
+        return reply
+    reply["registers"] = list(words)
+    reply["age_secs"] = round(age_secs, 3)
+    reply["source"] = source
+    return reply
+
+
+class RegisterCache:
+    """
+    The last raw value of every register read from each logger, for at most
+    ttl_secs. Written by the reader and read by the MQTT thread, so access
+    is locked.
+    """
+
+    def __init__(self, ttl_secs=DEFAULT_CACHE_TTL_SECS):
+        self.ttl_secs = ttl_secs
+        self._lock = threading.Lock()
+        # by logger serial: {address: (word, read at)}
+        self._registers = dict()
+
+    def put(self, logger_sn, start, words, now=None):
+        if now is None:
+            now = time.monotonic()
+        with self._lock:
+            registers = self._registers.setdefault(logger_sn, dict())
+            for address, word in enumerate(words, start):
+                registers[address] = (word, now)
+
+    def get(self, logger_sn, start, count, max_age_secs=None, now=None):
+        """
+        Return the words of the registers and the age of the oldest, or None
+        unless every register is cached and young enough.
+        """
+        if now is None:
+            now = time.monotonic()
+        if max_age_secs is None:
+            max_age_secs = self.ttl_secs
+        horizon = now - min(max_age_secs, self.ttl_secs)
+        words = []
+        oldest = now
+        with self._lock:
+            registers = self._registers.get(logger_sn)
+            if registers is None:
+                return None
+            for address in range(start, start + count):
+                cached = registers.get(address)
+                if cached is None or cached[1] < horizon:
+                    return None
+                words.append(cached[0])
+                oldest = min(oldest, cached[1])
+        return words, now - oldest
+
+
+class RegisterReadQueue:
+    """
+    Register reads the cache could not answer, waiting for the reader to
+    make them between samples. Reads taken together are coalesced into as
+    few requests as the logger allows.
+    """
+
+    def __init__(self, max_pending=DEFAULT_MAX_PENDING_READS):
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._pending = []
+        self._ready = threading.Event()
+        # called once a read is queued, for a reader not waiting on the queue
+        self.on_submit = None
+
+    def submit(self, read):
+        """
+        Queue a read, returning False if too many are already waiting.
+        """
+        with self._lock:
+            if len(self._pending) >= self.max_pending:
+                return False
+            self._pending.append(read)
+            self._ready.set()
+        on_submit = self.on_submit
+        if on_submit is not None:
+            on_submit()
+        return True
+
+    def wait(self, timeout):
+        return self._ready.wait(timeout)
+
+    def wake(self):
+        """
+        Wake the waiting reader without a read, e.g. to notice shutdown.
+        """
+        self._ready.set()
+
+    def take(self):
+        with self._lock:
+            pending = self._pending
+            self._pending = []
+            self._ready.clear()
+        return pending
+
+
+def coalesce_reads(reads, max_gap, max_count):
+    """
+    Plan the fewest (start, count) windows covering the registers of the
+    reads, bridging at most max_gap unread registers.
+    """
+    addresses = set()
+    for read in reads:
+        addresses.update(range(read.start, read.start + read.count))
+    return plan_read_windows(addresses, max_gap, min(max_count, MODBUS_MAX_REGISTERS))
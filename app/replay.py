@@ -0,0 +1,317 @@
+#!/usr/bin/env python
+import argparse
+import json
+import os.path
+import struct
+import time
+
+from datetime import datetime
+from pathlib import Path
+
+from app.capture import KIND_CRITICAL, KIND_READ, KIND_REREAD, CaptureReader
+from app.plausibility import PlausibilityFilter, load_field_limits
+from app.sample import SampleRecord, SampleSchema
+from app.solarman import (
+    FrameError,
+    compile_register_plan,
+    decode_registers,
+    parse_request_frame,
+    select_register_plan,
+    validate_response,
+    window_decoders,
+)
+
+DEFAULT_SAMPLE_INTERVAL_SECONDS = 60
+
+
+def load_config(name):
+    app_path = Path(os.path.abspath(os.path.dirname(__file__))).parent
+    with open(os.path.join(app_path, "config", name)) as config_file:
+        return json.loads(config_file.read())
+
+
+class CaptureReplay:
+    """
+    Pushes captured logger exchanges back through decoding and the
+    plausibility filter, as LoggerReader would have on receiving them.
+
+    Records are handled by the kind of exchange captured: re-reads are
+    merged into the sample rejected before them, whose values still rejected
+    are dropped as the reader drops them once the next sample begins, and
+    on-demand register reads are skipped. Exchanges are decoded with the
+    current field mappings, which is the point: a capture taken before a
+    mapping fix decodes with the fix. Every mapped field in a captured
+    window is decoded, so critical samples may carry more fields than the
+    critical tier decoded live.
+    """
+
+    def __init__(self, register_plan, field_limits, sample_interval_secs):
+        self.register_plan = register_plan
+        self.field_limits = field_limits
+        self.sample_interval_secs = sample_interval_secs
+        # by (start, count), as the decoders would be compiled in the reader
+        self._decoders = dict()
+        # by the set of keys decoded, for packing samples
+        self._schemas = dict()
+        # by logger serial
+        self._filters = dict()
+        # the last rejected sample of each logger: (record, data, rejected, critical)
+        self._pending = dict()
+        self.stats = {
+            "records": 0,
+            "exchanges": 0,
+            "invalid_frames": 0,
+            "implausible": 0,
+            "rereads": 0,
+            "unmatched_rereads": 0,
+            "register_reads": 0,
+            "partial": 0,
+            "samples": 0,
+            "critical": 0,
+        }
+
+    def decode(self, record):
+        """
+        Decode the exchanges of a record into a new dict.
+
+        Raises FrameError (or struct.error) as decoding the live exchange would.
+        """
+        output = {}
+        for request, response in record.exchanges:
+            _, start, count = parse_request_frame(request)
+            decoders = self._decoders.get((start, count))
+            if decoders is None:
+                decoders = window_decoders(self.register_plan, start, count)
+                self._decoders[(start, count)] = decoders
+            validate_response(frame=response, logger_sn=record.logger_sn, count=count)
+            decode_registers(decoders=decoders, count=count, data=response, output=output)
+        return output
+
+    def schema(self, keys):
+        key_set = frozenset(keys)
+        schema = self._schemas.get(key_set)
+        if schema is None:
+            schema = SampleSchema.from_register_plan(
+                select_register_plan(self.register_plan, key_set)
+            ).register()
+            self._schemas[key_set] = schema
+        return schema
+
+    def _judge(self, logger_sn, data, now):
+        plausibility = self._filters.get(logger_sn)
+        if plausibility is None:
+            plausibility = PlausibilityFilter(self.field_limits, self.sample_interval_secs)
+            self._filters[logger_sn] = plausibility
+        rejected = plausibility.check(data, now=now)
+        if len(rejected) == 0:
+            plausibility.accept(data, now=now)
+        return rejected
+
+    def _give_up(self, pending):
+        """
+        Drop the values still rejected from a sample no longer re-read,
+        returning what the reader would have sent of it, if anything.
+        """
+        record, data, rejected, critical = pending
+        self.stats["partial"] += 1
+        for key in rejected:
+            del data[key]
+        if len(data) == 0:
+            return None
+        self._filters[record.logger_sn].accept(data, now=record.timestamp_ns / 1e9)
+        self.stats["critical" if critical else "samples"] += 1
+        return record, data, critical
+
+    def samples(self, records):
+        """
+        Yield (record, sample, critical) for each sample that would have been
+        sent, with the sample as a dict of decoded fields.
+        """
+        stats = self.stats
+        for record in records:
+            stats["records"] += 1
+            stats["exchanges"] += len(record.exchanges)
+            if record.kind == KIND_READ:
+                # only ever filled the register cache
+                stats["register_reads"] += 1
+                continue
+            try:
+                data = self.decode(record)
+            except (FrameError, struct.error):
+                stats["invalid_frames"] += 1
+                continue
+            now = record.timestamp_ns / 1e9
+            if record.kind == KIND_REREAD:
+                pending = self._pending.pop(record.logger_sn, None)
+                if pending is None:
+                    # of a sample this replay found plausible
+                    stats["unmatched_rereads"] += 1
+                    continue
+                stats["rereads"] += 1
+                reread = data
+                record, data, _, critical = pending
+                data.update(reread)
+            else:
+                pending = self._pending.pop(record.logger_sn, None)
+                if pending is not None:
+                    # the reader stopped re-reading it before this sample
+                    sample = self._give_up(pending)
+                    if sample is not None:
+                        yield sample
+                critical = record.kind == KIND_CRITICAL
+            rejected = self._judge(record.logger_sn, data, now)
+            if len(rejected) > 0:
+                stats["implausible"] += 1
+                self._pending[record.logger_sn] = (record, data, rejected, critical)
+                continue
+            stats["critical" if critical else "samples"] += 1
+            yield record, data, critical
+        for pending in self._pending.values():
+            sample = self._give_up(pending)
+            if sample is not None:
+                yield sample
+        self._pending.clear()
+
+
+def parse_time_ns(value):
+    if value is None:
+        return None
+    return int(datetime.fromisoformat(value).timestamp() * 1e9)
+
+
+def load_shedder(primary_logger_sn):
+    """
+    A load shedder that is never started, so that its decisions reach no
+    switch. Needs the application runtime configuration.
+    """
+    from app.__main__ import MqttSubscriber
+
+    return MqttSubscriber(
+        mqtt_server_address=None,
+        mqtt_topic_prefix=None,
+        mqtt_switch_devices=[],
+        primary_logger_sn=primary_logger_sn,
+    )
+
+
+def replay_capture(replay, records, line_file, tags, shed_load, primary_sn):
+    """
+    Write the accepted full samples to line_file as InfluxDB line protocol if
+    given, and shed load on the samples of the primary logger if asked,
+    returning the count of each switch state decided and of the changes.
+    """
+    if line_file is not None:
+        from influxdb_client import Point, WritePrecision
+    shedder = None
+    switch_states = {}
+    switch_changes = 0
+    prev_switch_state = None
+    for record, sample, critical in replay.samples(records):
+        if line_file is not None and not critical:
+            point = Point("inverter").time(record.timestamp_ns, WritePrecision.NS)
+            for tag_name, tag_value in tags.items():
+                point.tag(tag_name, tag_value)
+            point.tag("logger_sn", str(record.logger_sn))
+            for field_name, field_value in sample.items():
+                point.field(field_name, field_value)
+            line_file.write(point.to_line_protocol())
+            line_file.write("\n")
+        if not shed_load:
+            continue
+        if primary_sn is None:
+            primary_sn = record.logger_sn
+        if record.logger_sn != primary_sn:
+            continue
+        if shedder is None:
+            shedder = load_shedder(primary_sn)
+        switch_stats = shedder.shed_load(
+            SampleRecord(
+                replay.schema(sample.keys()).pack(record.logger_sn, record.timestamp_ns, sample)
+            ),
+            critical=critical,
+        )
+        if switch_stats is None:
+            continue
+        switch_state = switch_stats["switch_state"]
+        switch_states[switch_state] = switch_states.get(switch_state, 0) + 1
+        if prev_switch_state is not None and switch_state != prev_switch_state:
+            switch_changes += 1
+        prev_switch_state = switch_state
+    return switch_states, switch_changes
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Replay a logger frame capture through decoding, plausibility and load shedding."
+    )
+    parser.add_argument("capture", help="capture file written by [inverter] capture_path")
+    parser.add_argument("--start", help="ISO 8601 time of the first record")
+    parser.add_argument("--end", help="ISO 8601 time of the last record")
+    parser.add_argument(
+        "--interval",
+        type=int,
+        default=DEFAULT_SAMPLE_INTERVAL_SECONDS,
+        help="sample interval the capture was taken at, in seconds",
+    )
+    parser.add_argument(
+        "--line-protocol",
+        metavar="PATH",
+        help="write accepted full samples as InfluxDB line protocol, for backfill",
+    )
+    parser.add_argument(
+        "--tag",
+        action="append",
+        default=[],
+        metavar="KEY=VALUE",
+        help="tag added to every line, e.g. the device tag of the live points",
+    )
+    parser.add_argument(
+        "--shed-load",
+        action="store_true",
+        help="run load shedding on the samples of the primary logger",
+    )
+    parser.add_argument(
+        "--primary-sn", type=int, help="logger driving load shedding (default: the first seen)"
+    )
+    args = parser.parse_args()
+
+    replay = CaptureReplay(
+        register_plan=compile_register_plan(load_config("field_mappings.txt")),
+        field_limits=load_field_limits(load_config("field_limits.json")),
+        sample_interval_secs=args.interval,
+    )
+    line_file = None
+    if args.line_protocol is not None:
+        line_file = open(args.line_protocol, "w")
+    reader = CaptureReader(args.capture)
+    replay_start = time.perf_counter()
+    switch_states, switch_changes = replay_capture(
+        replay=replay,
+        records=reader.records(
+            start_ns=parse_time_ns(args.start), end_ns=parse_time_ns(args.end)
+        ),
+        line_file=line_file,
+        tags=dict(tag.split("=", 1) for tag in args.tag),
+        shed_load=args.shed_load,
+        primary_sn=args.primary_sn,
+    )
+    replay_secs = time.perf_counter() - replay_start
+    if line_file is not None:
+        line_file.close()
+    # the records viewing the map are gone with replay_capture
+    reader.close()
+
+    stats = replay.stats
+    print(
+        f"{stats['records']} records ({stats['exchanges']} exchanges) in {replay_secs:.3f}s: "
+        f"{stats['records'] / max(replay_secs, 1e-9):.0f} records/s"
+    )
+    for name, value in stats.items():
+        if name not in ("records", "exchanges"):
+            print(f"{name:>16}: {value}")
+    if args.shed_load:
+        print(f"{'switch states':>16}: {switch_states} with {switch_changes} changes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+import struct
+import zlib
+
+# schema id, logger serial and sample time in nanoseconds
+SAMPLE_HEADER = struct.Struct("<IQQ")
+SAMPLE_INTEGER = struct.Struct("<q")
+SAMPLE_FLOAT = struct.Struct("<d")
+
+# schemas by id, shared by the producing and consuming threads
+_sample_schemas = {}
+
+
+class SampleSchema:
+    """
+    The fixed layout of a logger sample: one 8-byte slot per field in register
+    address order, typed as an integer or a float so that the InfluxDB field
+    types stay as they were.
+    """
+
+    def __init__(self, fields):
+        self.fields = tuple(fields)
+        self.keys = tuple(key for key, _ in fields)
+        self.index = {key: index for index, key in enumerate(self.keys)}
+        layout = "".join("q" if integral else "d" for _, integral in fields)
+        self.slots = tuple(
+            SAMPLE_INTEGER if integral else SAMPLE_FLOAT for _, integral in fields
+        )
+        self.schema_id = zlib.crc32(f"{','.join(self.keys)}:{layout}".encode())
+        self.record = struct.Struct(f"{SAMPLE_HEADER.format}{layout}")
+        # registered schemas of samples missing some fields, by the keys kept
+        self._subsets = {}
+
+    @classmethod
+    def from_register_plan(cls, register_plan):
+        fields = []
+        for address in sorted(register_plan):
+            for decoder in register_plan[address]:
+                fields.append(
+                    (
+                        decoder.key,
+                        isinstance(decoder.ratio, int) and isinstance(decoder.offset, int),
+                    )
+                )
+        return cls(fields)
+
+    def register(self):
+        _sample_schemas[self.schema_id] = self
+        return self
+
+    def subset(self, keys):
+        """
+        The registered schema for samples holding only the given fields, such
+        as those left once implausible values are dropped.
+        """
+        if len(keys) == len(self.keys):
+            return self
+        key_set = frozenset(keys)
+        schema = self._subsets.get(key_set)
+        if schema is None:
+            schema = SampleSchema(
+                [(key, integral) for key, integral in self.fields if key in key_set]
+            ).register()
+            self._subsets[key_set] = schema
+        return schema
+
+    def pack(self, logger_sn, timestamp_ns, data):
+        return self.record.pack(
+            self.schema_id, logger_sn, timestamp_ns, *(data[key] for key in self.keys)
+        )
+
+
+class SampleRecord:
+    """
+    A read-only view of a packed sample that decodes fields on access.
+    """
+
+    __slots__ = ("schema", "buffer", "logger_sn", "timestamp_ns")
+
+    def __init__(self, buffer):
+        schema_id, self.logger_sn, self.timestamp_ns = SAMPLE_HEADER.unpack_from(buffer)
+        try:
+            self.schema = _sample_schemas[schema_id]
+        except KeyError:
+            raise ValueError(f"Unknown sample schema {schema_id:#010x}.") from None
+        self.buffer = buffer
+
+    def keys(self):
+        return self.schema.keys
+
+    def __contains__(self, key):
+        return key in self.schema.index
+
+    def __getitem__(self, key):
+        index = self.schema.index[key]
+        return self.schema.slots[index].unpack_from(
+            self.buffer, SAMPLE_HEADER.size + index * 8
+        )[0]
+
+    def get(self, key, default=None):
+        if key not in self.schema.index:
+            return default
+        return self[key]
+
+    def to_dict(self):
+        return dict(zip(self.schema.keys, self.schema.record.unpack_from(self.buffer)[3:]))
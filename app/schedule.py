@@ -0,0 +1,73 @@
+import time
+
+from typing import NamedTuple
+
+# shares of the sample interval given to each phase of a poll
+CONNECT_BUDGET_SHARE = 0.1
+READ_BUDGET_SHARE = 0.1
+RETRY_BUDGET_SHARE = 0.5
+RETRY_WAIT_SHARE = 0.1
+
+
+class SampleBudget(NamedTuple):
+    connect_secs: float
+    read_secs: float
+    # retries stop this long after the tick
+    retry_secs: float
+    retry_wait_secs: float
+
+    @classmethod
+    def for_interval(cls, interval_secs, socket_timeout_secs, retry_wait_secs):
+        return cls(
+            connect_secs=min(socket_timeout_secs, interval_secs * CONNECT_BUDGET_SHARE),
+            read_secs=min(socket_timeout_secs, interval_secs * READ_BUDGET_SHARE),
+            retry_secs=interval_secs * RETRY_BUDGET_SHARE,
+            retry_wait_secs=min(retry_wait_secs, interval_secs * RETRY_WAIT_SHARE),
+        )
+
+    def can_retry(self, tick, now):
+        # leave room for the wait and a full attempt before the deadline
+        return (
+            now + self.retry_wait_secs + self.connect_secs + self.read_secs
+            <= tick.monotonic + self.retry_secs
+        )
+
+
+class Tick(NamedTuple):
+    # when to sample on the monotonic clock
+    monotonic: float
+    # the wall-clock boundary that the sample is attributed to
+    time_ns: int
+    # ticks passed over since the previous one
+    skipped: int
+
+
+class SampleSchedule:
+    """
+    Sample ticks on wall-clock multiples of the interval (e.g. every :00 for
+    a 60s interval), waited for on the monotonic clock.
+
+    Each tick is the next boundary after the current time, so ticks missed by
+    a slow poll are skipped rather than bunched up, and a stepped wall clock
+    is followed without sampling twice within half an interval.
+    """
+
+    def __init__(self, interval_secs):
+        self.interval_secs = interval_secs
+        self._previous = None
+
+    def next_tick(self):
+        now = time.monotonic()
+        wall_now_ns = time.time_ns()
+        # in integer nanoseconds to keep the boundaries exact
+        interval_ns = int(self.interval_secs * 1e9)
+        boundary_ns = (wall_now_ns // interval_ns + 1) * interval_ns
+        tick = now + (boundary_ns - wall_now_ns) / 1e9
+        skipped = 0
+        if self._previous is not None:
+            if tick - self._previous < self.interval_secs / 2:
+                tick += self.interval_secs
+                boundary_ns += interval_ns
+            skipped = max(0, round((tick - self._previous) / self.interval_secs) - 1)
+        self._previous = tick
+        return Tick(monotonic=tick, time_ns=boundary_ns, skipped=skipped)
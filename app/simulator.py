@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+import argparse
+import asyncio
+import json
+import os.path
+import random
+import threading
+
+from pathlib import Path
+
+from app.solarman import (
+    FrameError,
+    V5FrameReader,
+    build_response_frame,
+    parse_request_frame,
+    v5_checksum,
+    V5_TRAILER_LENGTH,
+)
+
+DEFAULT_PROFILE = os.path.join(
+    Path(os.path.abspath(os.path.dirname(__file__))).parent,
+    "config",
+    "simulator_profile.json",
+)
+# Battery SOC register, the subject of the reader's plausibility check
+SOC_REGISTER = 0x00B8
+SOC_JUMP_PCT = 20
+
+
+def load_profile(profile_path):
+    """
+    Load raw register values keyed by hex address, e.g. {"0x00B8": 62}.
+    Negative values are served as two's complement.
+    """
+    with open(profile_path) as profile_file:
+        profile = json.loads(profile_file.read())
+    return {int(address, 16): value & 0xFFFF for address, value in profile.items()}
+
+
+class LoggerSimulator:
+    """
+    A stand-in Solarman V5 logger serving register values from a profile,
+    with optional latency and injected faults.
+    """
+
+    def __init__(
+        self,
+        registers,
+        latency_secs=0.0,
+        truncate_rate=0.0,
+        bad_crc_rate=0.0,
+        soc_jump_rate=0.0,
+        seed=None,
+    ):
+        self.registers = registers
+        self.latency_secs = latency_secs
+        self.truncate_rate = truncate_rate
+        self.bad_crc_rate = bad_crc_rate
+        self.soc_jump_rate = soc_jump_rate
+        self.stats = {
+            "connections": 0,
+            "requests": 0,
+            "truncated": 0,
+            "bad_crc": 0,
+            "soc_jump": 0,
+        }
+        self._random = random.Random(seed)
+        self._loop = None
+        self._server = None
+        self._thread = None
+
+    def _words(self, start, count):
+        words = [self.registers.get(address, 0) for address in range(start, start + count)]
+        if (
+            start <= SOC_REGISTER < start + count
+            and self._random.random() < self.soc_jump_rate
+        ):
+            self.stats["soc_jump"] += 1
+            index = SOC_REGISTER - start
+            words[index] = (words[index] + SOC_JUMP_PCT) % 100
+        return words
+
+    def _corrupt(self, frame):
+        # break the Modbus CRC but keep the V5 checksum intact
+        corrupt = bytearray(frame)
+        corrupt[-V5_TRAILER_LENGTH - 3] ^= 0xFF
+        corrupt[-V5_TRAILER_LENGTH] = v5_checksum(corrupt)
+        return bytes(corrupt)
+
+    async def handle(self, reader, writer):
+        self.stats["connections"] += 1
+        frame_reader = V5FrameReader()
+        try:
+            while True:
+                data = await reader.read(4096)
+                if len(data) == 0:
+                    break
+                frame_reader.feed(data)
+                while (request := frame_reader.next_frame()) is not None:
+                    self.stats["requests"] += 1
+                    try:
+                        logger_sn, start, count = parse_request_frame(request)
+                    except FrameError:
+                        continue
+                    response = build_response_frame(logger_sn, self._words(start, count))
+                    if self.latency_secs > 0:
+                        await asyncio.sleep(self.latency_secs)
+                    if self._random.random() < self.truncate_rate:
+                        self.stats["truncated"] += 1
+                        writer.write(response[: len(response) // 2])
+                        await writer.drain()
+                        return
+                    if self._random.random() < self.bad_crc_rate:
+                        self.stats["bad_crc"] += 1
+                        response = self._corrupt(response)
+                    writer.write(response)
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host, port):
+        self._server = await asyncio.start_server(self.handle, host, port)
+        return self._server
+
+    def start(self, host="127.0.0.1", port=0):
+        """
+        Serve from a background thread, returning the bound port.
+        """
+        started = threading.Event()
+        self._loop = asyncio.new_event_loop()
+
+        def run():
+            asyncio.set_event_loop(self._loop)
+            self._loop.run_until_complete(self.serve(host, port))
+            started.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(name=self.__class__.__name__, target=run, daemon=True)
+        self._thread.start()
+        started.wait()
+        return self._server.sockets[0].getsockname()[1]
+
+    async def _shutdown(self):
+        self._server.close()
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stop(self):
+        if self._loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._loop = None
+
+
+def add_simulator_arguments(parser):
+    parser.add_argument("--profile", default=None, help="register profile JSON file")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per response")
+    parser.add_argument("--truncate", type=float, default=0.0, help="truncated frame rate")
+    parser.add_argument("--bad-crc", type=float, default=0.0, help="bad Modbus CRC rate")
+    parser.add_argument("--soc-jump", type=float, default=0.0, help="implausible SOC rate")
+    parser.add_argument("--seed", type=int, default=None)
+
+
+def simulator_from_arguments(args):
+    return LoggerSimulator(
+        registers=load_profile(args.profile or DEFAULT_PROFILE),
+        latency_secs=args.latency,
+        truncate_rate=args.truncate,
+        bad_crc_rate=args.bad_crc,
+        soc_jump_rate=args.soc_jump,
+        seed=args.seed,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Solarman V5 logger simulator.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8899)
+    add_simulator_arguments(parser)
+    args = parser.parse_args()
+    simulator = simulator_from_arguments(args)
+
+    async def serve():
+        server = await simulator.serve(args.host, args.port)
+        print(f"Simulating logger on {args.host}:{args.port}...")
+        async with server:
+            await server.serve_forever()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        print(f"Stopped: {simulator.stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+import argparse
+import math
+import time
+
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import NamedTuple
+
+SECONDS_PER_DAY = 86400
+# Haurwitz clear-sky global horizontal irradiance, W/m²
+HAURWITZ_SCALE_WM2 = 1098
+HAURWITZ_EXTINCTION = 0.057
+
+
+class SunPosition(NamedTuple):
+    # epoch seconds
+    timestamp: float
+    elevation_deg: float
+    # theoretical clear-sky irradiance on a horizontal surface
+    clear_sky_ghi_wm2: float
+    # clear-sky irradiance as a percentage of that at solar noon
+    midday_pct: int
+
+
+@lru_cache(maxsize=32)
+def day_terms(epoch_day):
+    """
+    Solar declination (radians) and equation of time (minutes) at noon UTC
+    of a day since the epoch, using the NOAA series approximations. These
+    change slowly enough to share across the day.
+    """
+    day_of_year = datetime.fromtimestamp(epoch_day * SECONDS_PER_DAY, timezone.utc).timetuple().tm_yday
+    gamma = 2 * math.pi / 365 * (day_of_year - 1)
+    equation_of_time = 229.18 * (
+        0.000075
+        + 0.001868 * math.cos(gamma)
+        - 0.032077 * math.sin(gamma)
+        - 0.014615 * math.cos(2 * gamma)
+        - 0.040849 * math.sin(2 * gamma)
+    )
+    declination = (
+        0.006918
+        - 0.399912 * math.cos(gamma)
+        + 0.070257 * math.sin(gamma)
+        - 0.006758 * math.cos(2 * gamma)
+        + 0.000907 * math.sin(2 * gamma)
+        - 0.002697 * math.cos(3 * gamma)
+        + 0.00148 * math.sin(3 * gamma)
+    )
+    return declination, equation_of_time
+
+
+def clear_sky_ghi(cos_zenith):
+    if cos_zenith <= 0:
+        return 0.0
+    return HAURWITZ_SCALE_WM2 * cos_zenith * math.exp(-HAURWITZ_EXTINCTION / cos_zenith)
+
+
+class SolarSite:
+    """
+    Sun elevation and theoretical clear-sky output at a location, computed
+    locally so that the sun signal needs no network and costs a few
+    microseconds per sample.
+    """
+
+    def __init__(self, lat, lon):
+        self.lat = float(lat)
+        self.lon = float(lon)
+        self._sin_lat = math.sin(math.radians(self.lat))
+        self._cos_lat = math.cos(math.radians(self.lat))
+
+    def _day(self, epoch_day):
+        declination, equation_of_time = day_terms(epoch_day)
+        sin_terms = self._sin_lat * math.sin(declination)
+        cos_terms = self._cos_lat * math.cos(declination)
+        # true solar time offset from UTC, in minutes
+        offset_mins = equation_of_time + 4 * self.lon
+        # the sun is highest where the hour angle is 0
+        noon_ghi = clear_sky_ghi(sin_terms + cos_terms)
+        return sin_terms, cos_terms, offset_mins, noon_ghi
+
+    def curve(self, timestamps):
+        """
+        Return the SunPosition at each of the epoch second timestamps,
+        computing the terms of each day once.
+        """
+        positions = []
+        day = None
+        for timestamp in timestamps:
+            epoch_day = int(timestamp // SECONDS_PER_DAY)
+            if epoch_day != day:
+                day = epoch_day
+                sin_terms, cos_terms, offset_mins, noon_ghi = self._day(epoch_day)
+            solar_mins = (timestamp % SECONDS_PER_DAY) / 60 + offset_mins
+            hour_angle = math.radians(solar_mins / 4 - 180)
+            cos_zenith = min(max(sin_terms + cos_terms * math.cos(hour_angle), -1.0), 1.0)
+            ghi = clear_sky_ghi(cos_zenith)
+            positions.append(
+                SunPosition(
+                    timestamp=timestamp,
+                    elevation_deg=90 - math.degrees(math.acos(cos_zenith)),
+                    clear_sky_ghi_wm2=ghi,
+                    midday_pct=int(ghi / noon_ghi * 100) if noon_ghi > 0 else 0,
+                )
+            )
+        return positions
+
+    def position(self, timestamp):
+        return self.curve((timestamp,))[0]
+
+    def day_curve(self, timestamp, step_secs=300):
+        """
+        The curve over the UTC day holding the timestamp, every step_secs.
+        """
+        start = timestamp - timestamp % SECONDS_PER_DAY
+        return self.curve(range(int(start), int(start) + SECONDS_PER_DAY, step_secs))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Clear-sky sun curve for a location.")
+    parser.add_argument("coord_lat_lon", help="latitude,longitude")
+    parser.add_argument("--date", help="UTC date as YYYY-MM-DD (default today)")
+    parser.add_argument("--step", type=int, default=900, help="seconds between points")
+    args = parser.parse_args()
+    lat, lon = args.coord_lat_lon.split(",")
+    timestamp = time.time()
+    if args.date is not None:
+        timestamp = (
+            datetime.strptime(args.date, "%Y-%m-%d").replace(tzinfo=timezone.utc).timestamp()
+        )
+    for position in SolarSite(lat, lon).day_curve(timestamp, args.step):
+        if position.elevation_deg <= 0:
+            continue
+        print(
+            f"{datetime.fromtimestamp(position.timestamp, timezone.utc):%H:%M}Z "
+            f"elevation {position.elevation_deg:5.1f}° "
+            f"clear-sky {position.clear_sky_ghi_wm2:6.1f}W/m² "
+            f"{position.midday_pct:3d}%"
+        )
+
+
+if __name__ == "__main__":
+    main()
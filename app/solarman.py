@@ -0,0 +1,538 @@
+import asyncio
+import libscrc
+import select
+import socket
+import struct
+import time
+
+from typing import NamedTuple
+
+
+# V5 frame start, length (2 bytes), control code (2), sequence (2) and logger serial (4)
+V5_HEADER_LENGTH = 11
+# V5 frame checksum and end code
+V5_TRAILER_LENGTH = 2
+V5_START = 0xA5
+V5_END = 0x15
+V5_CONTROL_REQUEST = 0x4510
+V5_CONTROL_RESPONSE = 0x1510
+# far beyond any register read response; used to resynchronize on garbage
+V5_MAX_FRAME_LENGTH = 1024
+# com.igen.localmode.dy.instruction.send.SendDataField
+V5_REQUEST_DATA_FIELD = bytes.fromhex("020000000000000000000000000000")
+# frame type, status, then total working, power on and offset times
+V5_RESPONSE_PAYLOAD_HEADER = bytes.fromhex("0201") + bytes(12)
+MODBUS_SLAVE_ADDRESS = 0x01
+MODBUS_READ_HOLDING_REGISTERS = 0x03
+MODBUS_EXCEPTION = 0x80
+# register data follows the V5 header (11 bytes), the V5 response payload
+# header (14 bytes) and the Modbus slave, function and byte count (3 bytes)
+RESPONSE_REGISTER_OFFSET = 28
+# unused registers worth reading to save a request
+DEFAULT_REGISTER_GAP_MAX = 24
+DEFAULT_REGISTER_WINDOW_MAX = 100
+# field_mappings.txt parser rule for signed 16-bit values
+PARSER_RULE_SIGNED = 2
+# temperatures are reported with a fixed offset
+TEMPERATURE_OFFSET = -100
+
+
+class FrameError(ValueError):
+    pass
+
+
+class ReadWindow(NamedTuple):
+    start: int
+    count: int
+    frame: bytes
+    decoders: tuple
+
+
+class RegisterDecoder(NamedTuple):
+    key: str
+    ratio: float
+    offset: float
+    signed: bool
+
+    def decode(self, value):
+        if self.signed and value & 0x8000:
+            value -= 0x10000
+        return round(value * self.ratio + self.offset, 2)
+
+
+def field_key(title, unit):
+    if len(unit) > 0:
+        key = f"{title} {unit}"
+    else:
+        key = f"{title}"
+    # sanitize string
+    return (
+        key.replace(" ", "_")
+        .replace("-", "_")
+        .replace("º", "c")
+        .replace("%", "pct")
+        .replace(".", "")
+        .lower()
+    )
+
+
+def compile_register_plan(field_mappings):
+    """
+    Index the field mappings by register address so that a poll only does
+    a dictionary lookup per register read.
+
+    Items spanning several registers are decoded from the last one, which
+    is the value that the address-ordered scan has always published.
+    """
+    plan = {}
+    for parameter in field_mappings:
+        for item in parameter["items"]:
+            title = item["titleEN"]
+            offset = 0
+            if title.find("Temperature") != -1:
+                offset = TEMPERATURE_OFFSET
+            decoder = RegisterDecoder(
+                key=field_key(title, item["unit"]),
+                ratio=item["ratio"],
+                offset=offset,
+                signed=item.get("parserRule") == PARSER_RULE_SIGNED,
+            )
+            address = int(item["registers"][-1], 16)
+            plan.setdefault(address, []).append(decoder)
+    return {address: tuple(decoders) for address, decoders in plan.items()}
+
+
+def select_register_plan(register_plan, keys):
+    """
+    Narrow a register plan to the decoders of the given field keys.
+    """
+    plan = {}
+    for address, decoders in register_plan.items():
+        selected = tuple(decoder for decoder in decoders if decoder.key in keys)
+        if len(selected) > 0:
+            plan[address] = selected
+    return plan
+
+
+def window_decoders(register_plan, start, count):
+    """
+    Select the decoders for the registers in a read window as
+    (word index, decoder) pairs in address order.
+    """
+    decoders = []
+    for index in range(count):
+        for decoder in register_plan.get(start + index, ()):
+            decoders.append((index, decoder))
+    return tuple(decoders)
+
+
+def response_words(data, count):
+    """
+    Unpack the big-endian register words of a read response in one pass.
+
+    Raises struct.error if the response is too short for the window.
+    """
+    return struct.unpack_from(f">{count}H", memoryview(data), RESPONSE_REGISTER_OFFSET)
+
+
+def decode_registers(decoders, count, data, output):
+    """
+    Apply the window decoders to the register words of a read response.
+
+    Raises struct.error if the response is too short for the window.
+    """
+    words = response_words(data, count)
+    for index, decoder in decoders:
+        output[decoder.key] = decoder.decode(words[index])
+    return output
+
+
+def plan_read_windows(addresses, max_gap, max_count):
+    """
+    Merge register addresses into the fewest (start, count) read windows,
+    bridging at most max_gap unused registers and reading at most max_count
+    registers per request.
+    """
+    windows = []
+    for address in sorted(addresses):
+        if len(windows) > 0:
+            start, end = windows[-1]
+            if address - end - 1 <= max_gap and address - start < max_count:
+                windows[-1] = (start, address)
+                continue
+        windows.append((address, address))
+    return tuple((start, end - start + 1) for start, end in windows)
+
+
+def v5_checksum(frame):
+    # sum of everything after the start byte, up to the checksum itself
+    return sum(memoryview(frame)[1:-V5_TRAILER_LENGTH]) & 0xFF
+
+
+def build_frame(control_code, logger_sn, payload):
+    frame = bytearray(
+        struct.pack("<BHHHI", V5_START, len(payload), control_code, 0, logger_sn)
+    )
+    frame += payload
+    # checksum placeholder and end code
+    frame += bytes((0, V5_END))
+    frame[-V5_TRAILER_LENGTH] = v5_checksum(frame)
+    return bytes(frame)
+
+
+def build_request_frame(logger_sn, start, count):
+    modbus = struct.pack(
+        ">BBHH", MODBUS_SLAVE_ADDRESS, MODBUS_READ_HOLDING_REGISTERS, start, count
+    )
+    payload = V5_REQUEST_DATA_FIELD + modbus + struct.pack("<H", libscrc.modbus(modbus))
+    return build_frame(V5_CONTROL_REQUEST, logger_sn, payload)
+
+
+def parse_request_frame(frame):
+    """
+    Extract (logger serial, start register, register count) from a request
+    frame, as a logger would.
+    """
+    _, _, control_code, _, logger_sn = struct.unpack_from("<BHHHI", frame)
+    if control_code != V5_CONTROL_REQUEST:
+        raise FrameError(f"Unexpected V5 control code 0x{control_code:04X}.")
+    _, function_code, start, count = struct.unpack_from(
+        ">BBHH", frame, V5_HEADER_LENGTH + len(V5_REQUEST_DATA_FIELD)
+    )
+    if function_code != MODBUS_READ_HOLDING_REGISTERS:
+        raise FrameError(f"Unexpected Modbus function code {function_code}.")
+    return logger_sn, start, count
+
+
+def build_response_frame(logger_sn, words):
+    modbus = struct.pack(
+        f">BBB{len(words)}H",
+        MODBUS_SLAVE_ADDRESS,
+        MODBUS_READ_HOLDING_REGISTERS,
+        len(words) * 2,
+        *words,
+    )
+    payload = (
+        V5_RESPONSE_PAYLOAD_HEADER + modbus + struct.pack("<H", libscrc.modbus(modbus))
+    )
+    return build_frame(V5_CONTROL_RESPONSE, logger_sn, payload)
+
+
+def compile_read_windows(register_plan, logger_sn, max_gap, max_count):
+    """
+    Plan the read windows for every register with a decoder and serialize
+    their request frames up front.
+    """
+    return tuple(
+        ReadWindow(
+            start=start,
+            count=count,
+            frame=build_request_frame(logger_sn, start, count),
+            decoders=window_decoders(register_plan, start, count),
+        )
+        for start, count in plan_read_windows(register_plan.keys(), max_gap, max_count)
+    )
+
+
+def v5_frame_length(header):
+    # the length field counts the payload between header and trailer
+    (payload_length,) = struct.unpack_from("<H", header, 1)
+    return V5_HEADER_LENGTH + payload_length + V5_TRAILER_LENGTH
+
+
+class V5FrameReader:
+    """
+    Accumulates received bytes and splits them into complete V5 frames,
+    skipping anything that cannot be the start of a frame.
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def clear(self):
+        self._buffer.clear()
+
+    def feed(self, data):
+        self._buffer.extend(data)
+
+    def next_frame(self):
+        while True:
+            start = self._buffer.find(V5_START)
+            if start < 0:
+                self._buffer.clear()
+                return None
+            del self._buffer[:start]
+            if len(self._buffer) < 3:
+                return None
+            frame_length = v5_frame_length(self._buffer)
+            if frame_length <= V5_MAX_FRAME_LENGTH:
+                break
+            # not a plausible header, look for the next start byte
+            del self._buffer[:1]
+        if len(self._buffer) < frame_length:
+            return None
+        frame = bytes(self._buffer[:frame_length])
+        del self._buffer[:frame_length]
+        return frame
+
+
+def validate_response(frame, logger_sn, count):
+    """
+    Check the V5 envelope and the Modbus register read response in a
+    complete frame before it is decoded.
+
+    Raises FrameError describing the first problem found.
+    """
+    if len(frame) < RESPONSE_REGISTER_OFFSET + V5_TRAILER_LENGTH:
+        raise FrameError(f"Truncated {len(frame)} byte frame.")
+    if frame[0] != V5_START or frame[-1] != V5_END:
+        raise FrameError("Missing V5 start or end code.")
+    checksum = v5_checksum(frame)
+    if frame[-V5_TRAILER_LENGTH] != checksum:
+        raise FrameError(
+            f"V5 checksum 0x{frame[-V5_TRAILER_LENGTH]:02X} does not match 0x{checksum:02X}."
+        )
+    _, _, control_code, _, serial = struct.unpack_from("<BHHHI", frame)
+    if control_code != V5_CONTROL_RESPONSE:
+        raise FrameError(f"Unexpected V5 control code 0x{control_code:04X}.")
+    if serial != logger_sn:
+        raise FrameError(f"Response is from logger {serial}, not {logger_sn}.")
+    modbus = memoryview(frame)[RESPONSE_REGISTER_OFFSET - 3 : -V5_TRAILER_LENGTH]
+    function_code = modbus[1]
+    if function_code & MODBUS_EXCEPTION:
+        raise FrameError(f"Modbus exception code {modbus[2]}.")
+    if function_code != MODBUS_READ_HOLDING_REGISTERS:
+        raise FrameError(f"Unexpected Modbus function code {function_code}.")
+    if modbus[2] != count * 2 or len(modbus) != count * 2 + 5:
+        raise FrameError(
+            f"Expected {count} registers but got {modbus[2]} bytes in a {len(modbus)} byte response."
+        )
+    (crc,) = struct.unpack_from("<H", modbus, len(modbus) - 2)
+    if libscrc.modbus(bytes(modbus[:-2])) != crc:
+        raise FrameError(f"Modbus CRC 0x{crc:04X} does not match.")
+
+
+def decode_responses(read_windows, responses, logger_sn, output):
+    """
+    Validate and decode the response frame of each read window.
+
+    Raises FrameError on the first invalid response.
+    """
+    for window, data in zip(read_windows, responses):
+        validate_response(frame=data, logger_sn=logger_sn, count=window.count)
+        decode_registers(
+            decoders=window.decoders, count=window.count, data=data, output=output
+        )
+    return output
+
+
+def tune_socket(sock):
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    # notice sessions that die between samples
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    if hasattr(socket, "TCP_KEEPIDLE"):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, 30)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, 10)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, 3)
+
+
+class LoggerConnection:
+    """
+    A TCP session to a Solarman V5 logger that is kept open across requests.
+
+    Requests are written back-to-back and the responses read in order. A
+    session that the logger has dropped is replaced transparently.
+    """
+
+    def __init__(self, address, port, timeout, connect_timeout=None):
+        self.address = address
+        self.port = port
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout or timeout
+        # timings of the last exchange; connect_secs is None for a reused session
+        self.connect_secs = None
+        self.round_trip_secs = ()
+        self._socket = None
+        self._reader = V5FrameReader()
+
+    @property
+    def connected(self):
+        return self._socket is not None
+
+    def connect(self):
+        self.close()
+        connect_start = time.perf_counter()
+        self._socket = socket.create_connection(
+            (self.address, self.port), timeout=self.connect_timeout
+        )
+        self.connect_secs = time.perf_counter() - connect_start
+        self._socket.settimeout(self.timeout)
+        tune_socket(self._socket)
+
+    def close(self):
+        self._reader.clear()
+        if self._socket is None:
+            return
+        try:
+            self._socket.close()
+        finally:
+            self._socket = None
+
+    def _is_half_open(self):
+        try:
+            # an idle session only becomes readable when the peer has gone
+            # away or sent something unsolicited, which is stale anyway
+            while select.select([self._socket], [], [], 0)[0]:
+                if len(self._socket.recv(4096)) == 0:
+                    return True
+        except OSError:
+            return True
+        return False
+
+    def _recv_frame(self):
+        frame = self._reader.next_frame()
+        while frame is None:
+            data = self._socket.recv(4096)
+            if len(data) == 0:
+                raise ConnectionResetError(
+                    f"Logger {self.address}:{self.port} closed the connection."
+                )
+            self._reader.feed(data)
+            frame = self._reader.next_frame()
+        return frame
+
+    def _exchange(self, frames):
+        sent = time.perf_counter()
+        self._socket.sendall(b"".join(frames))
+        responses = []
+        round_trip_secs = []
+        for _ in frames:
+            responses.append(self._recv_frame())
+            round_trip_secs.append(time.perf_counter() - sent)
+        self.round_trip_secs = tuple(round_trip_secs)
+        return responses
+
+    def exchange(self, frames):
+        """
+        Send the request frames and return the response frame for each.
+
+        Raises OSError if the logger cannot be reached on a fresh session.
+        """
+        self.connect_secs = None
+        self.round_trip_secs = ()
+        reused = self.connected
+        if reused and self._is_half_open():
+            reused = False
+            self.connect()
+        elif not reused:
+            self.connect()
+        try:
+            return self._exchange(frames)
+        except OSError:
+            self.close()
+            if not reused:
+                raise
+        # the reused session went stale after the check; retry once on a fresh one
+        self.connect()
+        try:
+            return self._exchange(frames)
+        except OSError:
+            self.close()
+            raise
+
+
+class AsyncLoggerConnection:
+    """
+    The asyncio counterpart of LoggerConnection, for polling many loggers
+    from one event loop.
+    """
+
+    def __init__(self, address, port, timeout, connect_timeout=None):
+        self.address = address
+        self.port = port
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout or timeout
+        # timings of the last exchange; connect_secs is None for a reused session
+        self.connect_secs = None
+        self.round_trip_secs = ()
+        self._stream_reader = None
+        self._stream_writer = None
+        self._reader = V5FrameReader()
+
+    @property
+    def connected(self):
+        return self._stream_writer is not None
+
+    async def connect(self):
+        self.close()
+        connect_start = time.perf_counter()
+        self._stream_reader, self._stream_writer = await asyncio.wait_for(
+            asyncio.open_connection(self.address, self.port),
+            timeout=self.connect_timeout,
+        )
+        self.connect_secs = time.perf_counter() - connect_start
+        tune_socket(self._stream_writer.get_extra_info("socket"))
+
+    def close(self):
+        self._reader.clear()
+        if self._stream_writer is None:
+            return
+        try:
+            self._stream_writer.close()
+        finally:
+            self._stream_reader = None
+            self._stream_writer = None
+
+    def _is_half_open(self):
+        return self._stream_reader.at_eof() or self._stream_writer.is_closing()
+
+    async def _recv_frame(self):
+        frame = self._reader.next_frame()
+        while frame is None:
+            data = await asyncio.wait_for(
+                self._stream_reader.read(4096), timeout=self.timeout
+            )
+            if len(data) == 0:
+                raise ConnectionResetError(
+                    f"Logger {self.address}:{self.port} closed the connection."
+                )
+            self._reader.feed(data)
+            frame = self._reader.next_frame()
+        return frame
+
+    async def _exchange(self, frames):
+        sent = time.perf_counter()
+        self._stream_writer.write(b"".join(frames))
+        await asyncio.wait_for(self._stream_writer.drain(), timeout=self.timeout)
+        responses = []
+        round_trip_secs = []
+        for _ in frames:
+            responses.append(await self._recv_frame())
+            round_trip_secs.append(time.perf_counter() - sent)
+        self.round_trip_secs = tuple(round_trip_secs)
+        return responses
+
+    async def exchange(self, frames):
+        """
+        Send the request frames and return the response frame for each.
+
+        Raises OSError if the logger cannot be reached on a fresh session.
+        """
+        self.connect_secs = None
+        self.round_trip_secs = ()
+        reused = self.connected and not self._is_half_open()
+        if not reused:
+            await self.connect()
+        try:
+            return await self._exchange(frames)
+        except OSError:
+            self.close()
+            if not reused:
+                raise
+        # the reused session went stale after the check; retry once on a fresh one
+        await self.connect()
+        try:
+            return await self._exchange(frames)
+        except OSError:
+            self.close()
+            raise
@@ -0,0 +1,153 @@
+import json
+import os
+import os.path
+import threading
+
+from collections import deque
+
+SEGMENT_SUFFIX = ".lp"
+CURSOR_FILE = "cursor.json"
+
+
+class LineSpool:
+    """
+    An append-only spool of line protocol records on disk, written to rotated
+    segments and capped in total size. Records are replayed oldest first by
+    reading a batch and committing it once delivered, so that a restart
+    replays at most one batch again.
+    """
+
+    def __init__(self, spool_dir, segment_bytes, max_bytes):
+        self.spool_dir = spool_dir
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.dropped_bytes = 0
+        self._lock = threading.Lock()
+        self._writer = None
+        os.makedirs(spool_dir, exist_ok=True)
+        self._segments = deque(
+            sorted(name for name in os.listdir(spool_dir) if name.endswith(SEGMENT_SUFFIX))
+        )
+        self._sizes = {
+            name: os.path.getsize(os.path.join(spool_dir, name)) for name in self._segments
+        }
+        self._cursor = 0
+        cursor_path = os.path.join(spool_dir, CURSOR_FILE)
+        if os.path.exists(cursor_path):
+            with open(cursor_path) as cursor_file:
+                cursor = json.loads(cursor_file.read())
+            if len(self._segments) > 0 and cursor["segment"] == self._segments[0]:
+                self._cursor = cursor["offset"]
+
+    def _path(self, name):
+        return os.path.join(self.spool_dir, name)
+
+    def _next_segment(self):
+        sequence = 0
+        if len(self._segments) > 0:
+            sequence = int(self._segments[-1][: -len(SEGMENT_SUFFIX)]) + 1
+        return f"{sequence:012d}{SEGMENT_SUFFIX}"
+
+    def _seal(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def _drop_oldest(self):
+        name = self._segments.popleft()
+        self.dropped_bytes += self._sizes.pop(name) - self._cursor
+        self._cursor = 0
+        os.remove(self._path(name))
+
+    def _save_cursor(self):
+        cursor_path = self._path(CURSOR_FILE)
+        with open(f"{cursor_path}.tmp", "w") as cursor_file:
+            cursor_file.write(
+                json.dumps({"segment": self._segments[0], "offset": self._cursor})
+            )
+        os.replace(f"{cursor_path}.tmp", cursor_path)
+
+    @property
+    def pending(self):
+        return len(self._segments) > 0
+
+    @property
+    def size_bytes(self):
+        return sum(self._sizes.values()) - self._cursor
+
+    def append(self, lines):
+        """
+        Append records, rotating the segment when full and dropping the oldest
+        segments beyond the size cap.
+        """
+        data = "".join(f"{line}\n" for line in lines if len(line) > 0).encode()
+        if len(data) == 0:
+            return
+        with self._lock:
+            if self._writer is None or self._sizes[self._segments[-1]] >= self.segment_bytes:
+                self._seal()
+                name = self._next_segment()
+                self._segments.append(name)
+                self._sizes[name] = 0
+                self._writer = open(self._path(name), "ab")
+            self._writer.write(data)
+            self._writer.flush()
+            os.fsync(self._writer.fileno())
+            self._sizes[self._segments[-1]] += len(data)
+            while sum(self._sizes.values()) > self.max_bytes and len(self._segments) > 1:
+                self._drop_oldest()
+
+    def read(self, max_lines):
+        """
+        Read up to max_lines of the oldest records, returning them with the
+        (segment, offset) position to commit once they are delivered.
+        """
+        with self._lock:
+            if len(self._segments) == 0:
+                return [], (None, 0)
+            if max_lines < 1:
+                return [], (self._segments[0], self._cursor)
+            if len(self._segments) == 1:
+                # never read from the segment being appended to
+                self._seal()
+            lines = []
+            offset = self._cursor
+            with open(self._path(self._segments[0]), "rb") as segment:
+                segment.seek(offset)
+                while len(lines) < max_lines:
+                    line = segment.readline()
+                    # skip a record torn by a crash mid-append
+                    if not line.endswith(b"\n"):
+                        offset += len(line)
+                        break
+                    offset += len(line)
+                    if len(line) > 1:
+                        lines.append(line[:-1].decode())
+            return lines, (self._segments[0], offset)
+
+    def commit(self, position):
+        """
+        Commit a position returned by read, unless appends have since dropped
+        the segment read beyond the size cap.
+        """
+        name, offset = position
+        with self._lock:
+            if len(self._segments) == 0 or self._segments[0] != name:
+                return
+            appending = self._writer is not None and len(self._segments) == 1
+            if offset >= self._sizes[name] and not appending:
+                self._segments.popleft()
+                del self._sizes[name]
+                self._cursor = 0
+                os.remove(self._path(name))
+                if len(self._segments) == 0:
+                    if os.path.exists(self._path(CURSOR_FILE)):
+                        os.remove(self._path(CURSOR_FILE))
+                    return
+            else:
+                self._cursor = offset
+            self._save_cursor()
+
+    def close(self):
+        with self._lock:
+            self._seal()
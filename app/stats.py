@@ -0,0 +1,150 @@
+import math
+
+from collections import deque
+
+
+class WindowStats:
+    """
+    Running statistics over the samples of the last window_secs, updated in
+    amortized O(1): a Welford mean and variance that samples are added to
+    and expired from, monotonic queues for the extremes, and an EWMA that
+    decays with elapsed time rather than sample count, so that a missed
+    sample weighs the next one more rather than skewing the window.
+    """
+
+    __slots__ = (
+        "window_secs",
+        "ewma_halflife_secs",
+        "samples",
+        "mean",
+        "_m2",
+        "_minima",
+        "_maxima",
+        "ewma",
+        "_ewma_at",
+    )
+
+    def __init__(self, window_secs, ewma_halflife_secs=None):
+        self.window_secs = window_secs
+        self.ewma_halflife_secs = ewma_halflife_secs or window_secs / 2
+        # (time, value) in arrival order
+        self.samples = deque()
+        self.mean = None
+        self._m2 = 0.0
+        # candidates for the extremes, as (time, value)
+        self._minima = deque()
+        self._maxima = deque()
+        self.ewma = None
+        self._ewma_at = None
+
+    @property
+    def count(self):
+        return len(self.samples)
+
+    @property
+    def minimum(self):
+        if len(self._minima) == 0:
+            return None
+        return self._minima[0][1]
+
+    @property
+    def maximum(self):
+        if len(self._maxima) == 0:
+            return None
+        return self._maxima[0][1]
+
+    @property
+    def variance(self):
+        if len(self.samples) < 2:
+            return None
+        return max(self._m2, 0.0) / (len(self.samples) - 1)
+
+    @property
+    def stddev(self):
+        variance = self.variance
+        if variance is None:
+            return None
+        return math.sqrt(variance)
+
+    def _remove(self, value):
+        count = len(self.samples)
+        if count == 0:
+            self.mean = None
+            self._m2 = 0.0
+            return
+        delta = value - self.mean
+        self.mean -= delta / count
+        self._m2 -= delta * (value - self.mean)
+
+    def expire(self, now):
+        horizon = now - self.window_secs
+        while len(self.samples) > 0 and self.samples[0][0] <= horizon:
+            _, value = self.samples.popleft()
+            self._remove(value)
+        while len(self._minima) > 0 and self._minima[0][0] <= horizon:
+            self._minima.popleft()
+        while len(self._maxima) > 0 and self._maxima[0][0] <= horizon:
+            self._maxima.popleft()
+
+    def update(self, value, now):
+        self.expire(now)
+        self.samples.append((now, value))
+        if self.mean is None:
+            self.mean = float(value)
+        else:
+            delta = value - self.mean
+            self.mean += delta / len(self.samples)
+            self._m2 += delta * (value - self.mean)
+        while len(self._minima) > 0 and self._minima[-1][1] >= value:
+            self._minima.pop()
+        self._minima.append((now, value))
+        while len(self._maxima) > 0 and self._maxima[-1][1] <= value:
+            self._maxima.pop()
+        self._maxima.append((now, value))
+        if self.ewma is None:
+            self.ewma = float(value)
+        else:
+            weight = 1 - 0.5 ** (max(now - self._ewma_at, 0) / self.ewma_halflife_secs)
+            self.ewma += weight * (value - self.ewma)
+        self._ewma_at = now
+
+    def snapshot(self):
+        return {
+            "mean": self.mean,
+            "ewma": self.ewma,
+            "min": self.minimum,
+            "max": self.maximum,
+            "stddev": self.stddev,
+        }
+
+
+class FieldStats:
+    """
+    Window statistics for a chosen set of sample fields.
+    """
+
+    def __init__(self, fields, window_secs, ewma_halflife_secs=None):
+        self.fields = {
+            field: WindowStats(window_secs, ewma_halflife_secs) for field in fields
+        }
+
+    def update(self, sample, now):
+        for field, stats in self.fields.items():
+            value = sample.get(field)
+            if value is not None:
+                stats.update(value, now)
+
+    def snapshot(self):
+        return {field: stats.snapshot() for field, stats in self.fields.items()}
+
+    def smoothed(self):
+        """
+        Return the statistics as flat <field>_<statistic> values, leaving out
+        those without enough samples.
+        """
+        values = dict()
+        for field, snapshot in self.snapshot().items():
+            for statistic, value in snapshot.items():
+                if value is not None:
+                    values[f"{field}_{statistic}"] = value
+        return values
@@ -0,0 +1,123 @@
+import re
+import time
+
+import requests
+
+from requests.adapters import HTTPAdapter
+from typing import NamedTuple
+
+OPENWEATHER_URL = "https://api.openweathermap.org/data/2.5/weather"
+# (connect, read) so that a hung request cannot stall the reader
+DEFAULT_TIMEOUT_SECS = (5, 10)
+# how often OpenWeather refreshes its observations
+DEFAULT_OBSERVATION_INTERVAL_SECS = 600
+# the soonest a location is asked again, e.g. while an observation is overdue
+DEFAULT_MIN_FETCH_INTERVAL_SECS = 60
+DEFAULT_ERROR_BACKOFF_SECS = 30
+DEFAULT_MAX_BACKOFF_SECS = 900
+
+MAX_AGE_PATTERN = re.compile(r"max-age=(\d+)")
+
+
+class WeatherObservation(NamedTuple):
+    data: dict
+    # the upstream observation time in epoch seconds
+    dt: int
+    # whether this fetch brought a newer observation than the last
+    new: bool
+
+
+class WeatherClient:
+    """
+    Fetches current weather for coordinates over a pooled session, caching
+    each observation until a newer one is expected: the observation time
+    plus the upstream refresh interval, no sooner than any Cache-Control
+    max-age. Failures back off exponentially, honouring Retry-After.
+    """
+
+    def __init__(
+        self,
+        api_key,
+        timeout_secs=DEFAULT_TIMEOUT_SECS,
+        observation_interval_secs=DEFAULT_OBSERVATION_INTERVAL_SECS,
+        min_fetch_interval_secs=DEFAULT_MIN_FETCH_INTERVAL_SECS,
+        error_backoff_secs=DEFAULT_ERROR_BACKOFF_SECS,
+        max_backoff_secs=DEFAULT_MAX_BACKOFF_SECS,
+        url=OPENWEATHER_URL,
+    ):
+        self.api_key = api_key
+        self.timeout_secs = timeout_secs
+        self.observation_interval_secs = observation_interval_secs
+        self.min_fetch_interval_secs = min_fetch_interval_secs
+        self.error_backoff_secs = error_backoff_secs
+        self.max_backoff_secs = max_backoff_secs
+        self.url = url
+        self.session = requests.Session()
+        # one keep-alive connection is all a single reader needs
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=1))
+        self.session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=1))
+        # by (lat, lon)
+        self._observations = dict()
+        self._fetch_at = dict()
+        self._failures = dict()
+
+    def next_fetch_secs(self, lat, lon, now=None):
+        if now is None:
+            now = time.monotonic()
+        return max(self._fetch_at.get((lat, lon), now) - now, 0)
+
+    def _backoff(self, key, now, retry_after=None):
+        failures = self._failures.get(key, 0) + 1
+        self._failures[key] = failures
+        delay = min(self.error_backoff_secs * 2 ** (failures - 1), self.max_backoff_secs)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        self._fetch_at[key] = now + delay
+
+    def get(self, lat, lon):
+        """
+        Return the latest observation, only asking upstream once a newer one
+        is due. Raises requests' exceptions, or KeyError/ValueError for a
+        malformed body, after scheduling the retry.
+        """
+        key = (lat, lon)
+        now = time.monotonic()
+        cached = self._observations.get(key)
+        if cached is not None and now < self._fetch_at[key]:
+            return cached._replace(new=False)
+        try:
+            response = self.session.get(
+                self.url,
+                params={"lat": lat, "lon": lon, "appid": self.api_key},
+                timeout=self.timeout_secs,
+            )
+            response.raise_for_status()
+            data = response.json()
+            dt = int(data["dt"])
+        except requests.HTTPError as e:
+            retry_after = e.response.headers.get("Retry-After", "")
+            self._backoff(key, now, int(retry_after) if retry_after.isdigit() else None)
+            raise
+        except Exception:
+            self._backoff(key, now)
+            raise
+        self._failures.pop(key, None)
+        new = cached is None or dt > cached.dt
+        if new:
+            # the next observation is expected one refresh after this one
+            delay = dt + self.observation_interval_secs - time.time()
+        else:
+            # overdue, so check back soon
+            delay = self.min_fetch_interval_secs
+        max_age = MAX_AGE_PATTERN.search(response.headers.get("Cache-Control", ""))
+        if max_age is not None:
+            delay = max(delay, int(max_age.group(1)))
+        self._fetch_at[key] = now + max(delay, self.min_fetch_interval_secs)
+        if not new:
+            return cached._replace(new=False)
+        observation = WeatherObservation(data=data, dt=dt, new=True)
+        self._observations[key] = observation
+        return observation
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,177 @@
+import json
+
+from pathlib import Path
+
+from app.plausibility import (
+    DEFAULT_FIELD_LIMITS,
+    PlausibilityFilter,
+    SampleCheck,
+    load_field_limits,
+)
+from app.solarman import ReadWindow, RegisterDecoder
+
+LIMITS_FILE = Path(__file__).parent.parent / "config" / "field_limits.json"
+
+INTERVAL_SECS = 60
+
+
+def decoder(key):
+    return RegisterDecoder(key=key, ratio=1, offset=0, signed=False)
+
+
+def read_window(start, *keys):
+    return ReadWindow(
+        start=start,
+        count=len(keys),
+        frame=b"",
+        decoders=tuple((index, decoder(key)) for index, key in enumerate(keys)),
+    )
+
+
+READ_WINDOWS = (
+    read_window(0x00B7, "battery_voltage_v", "battery_soc_pct"),
+    read_window(0x0096, "grid_voltage_l1_v", "grid_voltage_l2_v"),
+    read_window(0x00BA, "pv1_power_w", "pv2_power_w"),
+)
+
+
+def shipped_limits():
+    return load_field_limits(json.loads(LIMITS_FILE.read_text()))
+
+
+def glitch_sample():
+    return {
+        "battery_voltage_v": 0,
+        "battery_soc_pct": 0,
+        "grid_voltage_l1_v": 0,
+        "grid_voltage_l2_v": 0,
+        "pv1_power_w": 0,
+        "pv2_power_w": 0,
+    }
+
+
+def read(logger_data, read_windows):
+    """
+    The fields of the sample that the read windows decode.
+    """
+    return {
+        window_decoder.key: logger_data[window_decoder.key]
+        for window in read_windows
+        for _, window_decoder in window.decoders
+    }
+
+
+def judge(plausibility, logger_data, rereads, now=0):
+    """
+    Run a sample check to its end, re-reading from the given samples in turn.
+    """
+    check = SampleCheck(plausibility, READ_WINDOWS, logger_data)
+    rereads = iter(rereads)
+    reread_windows = check.reread_windows(now=now)
+    while len(reread_windows) > 0:
+        check.merge(read(next(rereads), reread_windows))
+        reread_windows = check.reread_windows(now=now)
+    return check.sample(now=now)
+
+
+def test_glitch_sample_is_rejected_whole():
+    for field_limits in (shipped_limits(), DEFAULT_FIELD_LIMITS):
+        plausibility = PlausibilityFilter(field_limits, INTERVAL_SECS)
+        rejected = plausibility.check(glitch_sample(), now=0)
+        assert set(rejected) == set(glitch_sample())
+
+
+def test_glitch_sample_without_history_is_not_published():
+    plausibility = PlausibilityFilter(shipped_limits(), INTERVAL_SECS)
+    assert len(plausibility.accepted) == 0
+    # the glitch persists through the re-reads
+    assert judge(plausibility, glitch_sample(), rereads=[glitch_sample()] * 2) is None
+    # so nothing reaches load shedding as SOC 0%, nor becomes a reference
+    assert len(plausibility.accepted) == 0
+
+
+def test_glitch_sample_recovered_by_reread():
+    plausibility = PlausibilityFilter(shipped_limits(), INTERVAL_SECS)
+    reread = dict(glitch_sample(), battery_voltage_v=52.1, battery_soc_pct=80, grid_voltage_l1_v=230)
+    sample = judge(plausibility, glitch_sample(), rereads=[reread])
+    assert sample == reread
+
+
+def test_zero_soc_with_battery_voltage_is_plausible():
+    plausibility = PlausibilityFilter(shipped_limits(), INTERVAL_SECS)
+    logger_data = dict(glitch_sample(), battery_voltage_v=44.0)
+    assert plausibility.check(logger_data, now=0) == {}
+
+
+def test_bounds():
+    plausibility = PlausibilityFilter(shipped_limits(), INTERVAL_SECS)
+    rejected = plausibility.check(
+        {"battery_soc_pct": 101, "battery_voltage_v": 0.5, "pv1_power_w": 0}, now=0
+    )
+    assert set(rejected) == {"battery_soc_pct", "battery_voltage_v"}
+    assert plausibility.check({"battery_soc_pct": 100, "battery_voltage_v": 1}, now=0) == {}
+
+
+def test_max_delta_within_window():
+    plausibility = PlausibilityFilter(shipped_limits(), INTERVAL_SECS)
+    plausibility.accept({"battery_soc_pct": 50}, now=0)
+    assert set(plausibility.check({"battery_soc_pct": 55}, now=60)) == {"battery_soc_pct"}
+    assert plausibility.check({"battery_soc_pct": 54}, now=60) == {}
+    # a jump is believable once the reference is older than the window
+    assert plausibility.check({"battery_soc_pct": 55}, now=2 * INTERVAL_SECS) == {}
+
+
+def test_max_delta_reference_is_only_updated_by_accepted_values():
+    plausibility = PlausibilityFilter(shipped_limits(), INTERVAL_SECS)
+    plausibility.accept({"battery_soc_pct": 50}, now=0)
+    # a rejected value is never accepted, so the next is judged against 50
+    assert len(plausibility.check({"battery_soc_pct": 90}, now=10)) == 1
+    assert len(plausibility.check({"battery_soc_pct": 89}, now=20)) == 1
+    assert plausibility.check({"battery_soc_pct": 51}, now=30) == {}
+
+
+def test_default_limit():
+    field_limits = load_field_limits(
+        {"*": {"min": 0, "max": 10}, "pv1_power_w": {"min": 0, "max": 15000}}
+    )
+    plausibility = PlausibilityFilter(field_limits, INTERVAL_SECS)
+    rejected = plausibility.check({"pv1_power_w": 5000, "pv2_power_w": 11, "alert": -1}, now=0)
+    assert set(rejected) == {"pv2_power_w", "alert"}
+    # without a "*" entry, fields without limits are never rejected
+    plausibility = PlausibilityFilter(shipped_limits(), INTERVAL_SECS)
+    assert plausibility.check({"alert": -1}, now=0) == {}
+
+
+def test_only_rejected_windows_are_reread():
+    plausibility = PlausibilityFilter(shipped_limits(), INTERVAL_SECS)
+    logger_data = dict(
+        glitch_sample(), battery_voltage_v=52.1, battery_soc_pct=80, grid_voltage_l1_v=400
+    )
+    check = SampleCheck(plausibility, READ_WINDOWS, logger_data)
+    assert check.reread_windows(now=0) == (READ_WINDOWS[1],)
+    assert set(check.rejected) == {"grid_voltage_l1_v"}
+
+
+def test_only_still_rejected_keys_are_dropped():
+    plausibility = PlausibilityFilter(shipped_limits(), INTERVAL_SECS)
+    logger_data = dict(
+        glitch_sample(), battery_voltage_v=75, battery_soc_pct=80, grid_voltage_l1_v=400
+    )
+    # the grid voltage is repaired by the first re-read, the battery voltage never is
+    rereads = [
+        dict(logger_data, grid_voltage_l1_v=230),
+        dict(logger_data, grid_voltage_l1_v=230),
+    ]
+    sample = judge(plausibility, logger_data, rereads=rereads)
+    assert "battery_voltage_v" not in sample
+    assert sample["grid_voltage_l1_v"] == 230
+    assert sample["battery_soc_pct"] == 80
+    assert set(plausibility.accepted) == set(sample)
+
+
+def test_rereads_are_limited():
+    plausibility = PlausibilityFilter(shipped_limits(), INTERVAL_SECS)
+    check = SampleCheck(plausibility, READ_WINDOWS, {"battery_voltage_v": 75}, max_rereads=1)
+    assert len(check.reread_windows(now=0)) == 1
+    assert check.reread_windows(now=0) == ()
+    assert check.sample(now=0) is None